@@ -5,17 +5,22 @@ Automatically takes actions when spending limits are reached
 
 import json
 import os
-import boto3
 from datetime import datetime, timedelta
 from decimal import Decimal
 
-# Initialize AWS clients
-ecs = boto3.client('ecs')
-autoscaling = boto3.client('autoscaling')
-rds = boto3.client('rds')
-ce = boto3.client('ce')
-sns = boto3.client('sns')
-budgets = boto3.client('budgets')
+# Shared with the cost optimizer (terraform/lambda) and bundled into the same zip
+from aws_clients import api_metrics, default_client, preload_models
+from ce_cache import CostExplorerCache, LRUBackend, StoreBackend
+from object_store import store_from_uri
+
+# AWS clients, created on first use; most invocations only read Cost Explorer
+ecs = default_client('ecs')
+autoscaling = default_client('autoscaling')
+rds = default_client('rds')
+ce = default_client('ce')
+sns = default_client('sns')
+budgets = default_client('budgets')
+preload_models(['ce', 'ecs', 'sns'])
 
 # Environment variables
 ENVIRONMENT = os.environ['ENVIRONMENT']
@@ -23,12 +28,21 @@ MAX_BUDGET = Decimal(os.environ['MAX_BUDGET'])
 ACTIONS = json.loads(os.environ['ACTIONS'])
 CLUSTER_NAME = f"diagnyx-{ENVIRONMENT}"
 
+# Cost Explorer responses cached in memory and in a store shared with the cost optimizer
+ce_cache = CostExplorerCache(
+    ce,
+    [LRUBackend(), StoreBackend(store_from_uri(os.environ.get('CE_CACHE_URI', '/tmp/diagnyx-cache')))],
+    open_period_ttl=int(os.environ.get('CE_CACHE_TTL_SECONDS', '3600'))
+)
+
+@api_metrics.instrument
 def handler(event, context):
     """Main Lambda handler"""
     print(f"Event received: {json.dumps(event)}")
     
     # Get current spending
-    current_spend = get_current_spend()
+    with api_metrics.scope('current_spend'):
+        current_spend = get_current_spend()
     budget_percentage = (current_spend / MAX_BUDGET) * 100
     
     print(f"Current spend: ${current_spend:.2f} ({budget_percentage:.1f}% of ${MAX_BUDGET})")
@@ -58,7 +72,8 @@ def get_current_spend():
     end_date = (now + timedelta(days=1)).strftime('%Y-%m-%d')
     
     try:
-        response = ce.get_cost_and_usage(
+        response = ce_cache.call(
+            'get_cost_and_usage',
             TimePeriod={
                 'Start': start_date,
                 'End': end_date
@@ -96,34 +111,35 @@ def execute_actions(actions, current_spend, budget_percentage):
     
     for action in actions:
         try:
-            if action == "alert":
-                send_alert(current_spend, budget_percentage)
-            
-            elif action == "scale_down":
-                scale_down_services()
-            
-            elif action == "stop_non_essential":
-                stop_non_essential_services()
-            
-            elif action == "scale_down_non_critical":
-                scale_down_non_critical_services()
-            
-            elif action == "emergency_scale_down":
-                emergency_scale_down()
-            
-            elif action == "stop_batch_jobs":
-                stop_batch_jobs()
-            
-            elif action == "critical_only_mode":
-                enable_critical_only_mode()
-            
-            elif action == "page_oncall":
-                page_oncall_team(current_spend, budget_percentage)
-            
-            elif action == "review_required":
-                request_manual_review(current_spend, budget_percentage)
-            
-            print(f"Successfully executed action: {action}")
+            with api_metrics.scope(action):
+                if action == "alert":
+                    send_alert(current_spend, budget_percentage)
+                
+                elif action == "scale_down":
+                    scale_down_services()
+                
+                elif action == "stop_non_essential":
+                    stop_non_essential_services()
+                
+                elif action == "scale_down_non_critical":
+                    scale_down_non_critical_services()
+                
+                elif action == "emergency_scale_down":
+                    emergency_scale_down()
+                
+                elif action == "stop_batch_jobs":
+                    stop_batch_jobs()
+                
+                elif action == "critical_only_mode":
+                    enable_critical_only_mode()
+                
+                elif action == "page_oncall":
+                    page_oncall_team(current_spend, budget_percentage)
+                
+                elif action == "review_required":
+                    request_manual_review(current_spend, budget_percentage)
+                
+                print(f"Successfully executed action: {action}")
             
         except Exception as e:
             print(f"Error executing action {action}: {e}")
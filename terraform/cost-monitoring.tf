@@ -232,13 +232,41 @@ resource "aws_lambda_function" "cost_optimizer" {
   source_code_hash = data.archive_file.cost_optimizer.output_base64sha256
   runtime         = "python3.11"
   timeout         = 300  # 5 minutes for analysis
+  layers          = var.cost_optimizer_layer_arns  # NumPy speeds up analysis; pure Python is used without it
   
   environment {
     variables = {
       SNS_TOPIC_ARN = var.enable_monitoring ? aws_sns_topic.cost_alerts[0].arn : ""
       ENVIRONMENT   = var.environment
-      THRESHOLD_UNDERUTILIZED = "30"  # CPU < 30% considered underutilized
       THRESHOLD_IDLE_DAYS     = "7"   # Resources idle for 7 days
+      ANALYZER_WORKERS        = "8"   # Analyzers run concurrently
+      ANALYZER_TIMEOUT_SECONDS = "240" # Leave headroom under the Lambda timeout
+      RESOURCE_WORKERS        = "4"   # Metric batches fetched concurrently per analyzer
+      TARGET_ACCOUNTS         = jsonencode(var.cost_optimizer_target_accounts)
+      TARGET_REGIONS          = join(",", var.cost_optimizer_target_regions)
+      TARGET_ROLE_NAME        = var.cost_optimizer_target_role_name
+      TARGET_WORKERS          = "4"   # (account, region) pairs analyzed concurrently
+      PRICE_CATALOG_URI       = "/tmp/diagnyx-cache"  # or s3://bucket/prefix to share snapshots
+      PRICE_CATALOG_TTL_SECONDS = "604800"           # Refresh prices weekly
+      CE_CACHE_URI            = "/tmp/diagnyx-cache"  # or s3://bucket/prefix shared with the cost controller
+      COST_TREND_DAYS         = "90"  # History used for spend anomaly baselines
+      ANOMALY_Z_THRESHOLD     = "3"   # Standard deviations above baseline to flag
+      ANOMALY_EVAL_DAYS       = "1"   # Most recent days scored for anomalies
+      CHECKPOINT_ENABLED      = "true" # Continue long runs in a new invocation instead of timing out
+      CHECKPOINT_URI          = "s3://${aws_s3_bucket.temp.id}/cost-optimizer"  # Shared by all containers
+      CHECKPOINT_RESERVE_SECONDS = "30"  # Time left when analyzers stop and the checkpoint is saved
+      CHECKPOINT_MAX_INVOCATIONS = "10"  # Report partial results after this many invocations
+      REPORT_URI              = "s3://${aws_s3_bucket.metrics.id}/cost-optimizer/reports"  # Full report, JSON Lines and CSV, kept for linking from alerts
+      API_RATE_LIMIT          = "20"  # Starting and maximum req/s per API operation, halved on throttling
+      METRICS_OUTPUT          = "emf" # API call counts and latency per analyzer as CloudWatch metrics
+      INCREMENTAL_ENABLED     = tostring(var.cost_optimizer_incremental)
+      RESOURCE_STATE_URI      = "s3://${aws_s3_bucket.metrics.id}/cost-optimizer/state"  # Recommendations per resource, updated by change events
+      RECONCILE_INTERVAL_HOURS = "168" # Full scan at least weekly to repair missed events
+      SNAPSHOT_INDEX_URI      = "s3://${aws_s3_bucket.metrics.id}/cost-optimizer/state"  # Snapshots seen so far, refreshed from a StartTime watermark
+      SNAPSHOT_FULL_SCAN_DAYS = "7"   # Relist every snapshot weekly to drop deleted ones
+      SNAPSHOT_DAILY_CHANGE_RATE = "0.02" # Share of a volume assumed rewritten per day between snapshots
+      NAT_ENDPOINT_TRAFFIC_SHARE = "0.25" # Share of NAT traffic assumed bound for S3/DynamoDB
+      MEMORY_METRIC_DIMENSIONS = "AutoScalingGroupName,ImageId,InstanceId,InstanceType"  # CloudWatch agent append_dimensions
     }
   }
   
@@ -259,6 +287,106 @@ data "archive_file" "cost_optimizer" {
     content  = file("${path.module}/lambda/cost_optimizer.py")
     filename = "index.py"
   }
+  
+  source {
+    content  = file("${path.module}/lambda/anomaly.py")
+    filename = "anomaly.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/api_metrics.py")
+    filename = "api_metrics.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/aws_clients.py")
+    filename = "aws_clients.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/ce_cache.py")
+    filename = "ce_cache.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/checkpoint.py")
+    filename = "checkpoint.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/fanout.py")
+    filename = "fanout.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/inventory.py")
+    filename = "inventory.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/metrics_engine.py")
+    filename = "metrics_engine.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/nat_traffic.py")
+    filename = "nat_traffic.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/object_store.py")
+    filename = "object_store.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/price_catalog.py")
+    filename = "price_catalog.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/rate_limiter.py")
+    filename = "rate_limiter.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/recommendations.py")
+    filename = "recommendations.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/report_renderer.py")
+    filename = "report_renderer.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/resource_state.py")
+    filename = "resource_state.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/rightsizing.py")
+    filename = "rightsizing.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/scheduler.py")
+    filename = "scheduler.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/snapshot_lineage.py")
+    filename = "snapshot_lineage.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/tag_index.py")
+    filename = "tag_index.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/volume_sizing.py")
+    filename = "volume_sizing.py"
+  }
 }
 
 # IAM Role for Cost Optimizer
@@ -295,7 +423,8 @@ resource "aws_iam_role_policy" "cost_optimizer" {
           "ce:GetCostForecast",
           "ce:GetReservationUtilization",
           "ce:GetSavingsPlansUtilization",
-          "ce:GetRightsizingRecommendation"
+          "ce:GetRightsizingRecommendation",
+          "pricing:GetProducts"
         ]
         Resource = "*"
       },
@@ -306,9 +435,16 @@ resource "aws_iam_role_policy" "cost_optimizer" {
           "ec2:DescribeVolumes",
           "ec2:DescribeSnapshots",
           "ec2:DescribeImages",
+          "ec2:DescribeAddresses",
+          "ec2:DescribeNatGateways",
+          "ec2:DescribeRouteTables",
+          "ec2:DescribeSubnets",
+          "ec2:DescribeVpcEndpoints",
           "rds:DescribeDBInstances",
           "elasticache:DescribeCacheClusters",
-          "cloudwatch:GetMetricStatistics"
+          "cloudwatch:GetMetricStatistics",
+          "cloudwatch:GetMetricData",
+          "tag:GetResources"
         ]
         Resource = "*"
       },
@@ -319,6 +455,71 @@ resource "aws_iam_role_policy" "cost_optimizer" {
         ]
         Resource = var.enable_monitoring ? aws_sns_topic.cost_alerts[0].arn : "*"
       },
+      {
+        Effect = "Allow"
+        Action = [
+          "sts:AssumeRole"
+        ]
+        Resource = "arn:aws:iam::*:role/${var.cost_optimizer_target_role_name}"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject",
+          "s3:DeleteObject",
+          "s3:AbortMultipartUpload"
+        ]
+        Resource = "${aws_s3_bucket.temp.arn}/cost-optimizer/*"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:PutObject",
+          "s3:AbortMultipartUpload"
+        ]
+        Resource = "${aws_s3_bucket.metrics.arn}/cost-optimizer/reports/*"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject",
+          "s3:DeleteObject"
+        ]
+        Resource = "${aws_s3_bucket.metrics.arn}/cost-optimizer/state/*"  # Outlives the temp bucket's 1-day expiry
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:ListBucket"
+        ]
+        Resource = aws_s3_bucket.metrics.arn  # Missing state reads as NoSuchKey, not AccessDenied
+        Condition = {
+          StringLike = {
+            "s3:prefix" = ["cost-optimizer/state/*"]
+          }
+        }
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:ListBucket"
+        ]
+        Resource = aws_s3_bucket.temp.arn  # Missing checkpoints read as NoSuchKey, not AccessDenied
+        Condition = {
+          StringLike = {
+            "s3:prefix" = ["cost-optimizer/*"]
+          }
+        }
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "lambda:InvokeFunction"
+        ]
+        Resource = aws_lambda_function.cost_optimizer.arn  # Continuation of checkpointed runs
+      },
       {
         Effect = "Allow"
         Action = [
@@ -345,6 +546,9 @@ resource "aws_cloudwatch_event_target" "cost_optimizer" {
   rule      = aws_cloudwatch_event_rule.cost_optimizer_schedule.name
   target_id = "CostOptimizerLambda"
   arn       = aws_lambda_function.cost_optimizer.arn
+  
+  # Incremental mode reports from the resource state between full scans
+  input = var.cost_optimizer_incremental ? jsonencode({ mode = "report" }) : null
 }
 
 resource "aws_lambda_permission" "cost_optimizer" {
@@ -355,6 +559,72 @@ resource "aws_lambda_permission" "cost_optimizer" {
   source_arn    = aws_cloudwatch_event_rule.cost_optimizer_schedule.arn
 }
 
+# Re-evaluate resources as they change, so the daily report needs no full scan
+resource "aws_cloudwatch_event_rule" "cost_optimizer_changes" {
+  count = var.cost_optimizer_incremental ? 1 : 0
+  
+  name        = "${local.name_prefix}-cost-optimizer-changes"
+  description = "Trigger re-evaluation of changed EC2, EBS and RDS resources"
+  
+  event_pattern = jsonencode({
+    "$or" = [
+      {
+        source      = ["aws.ec2"]
+        detail-type = [
+          "EC2 Instance State-change Notification",
+          "EBS Volume Notification",
+          "EBS Snapshot Notification"
+        ]
+      },
+      {
+        source      = ["aws.rds"]
+        detail-type = ["RDS DB Instance Event"]
+      },
+      {
+        source      = ["aws.ec2", "aws.rds"]
+        detail-type = ["AWS API Call via CloudTrail"]
+        detail = {
+          eventName = [
+            "ModifyInstanceAttribute",
+            "ModifyVolume",
+            "AttachVolume",
+            "DetachVolume",
+            "DeleteSnapshot",
+            "AllocateAddress",
+            "AssociateAddress",
+            "DisassociateAddress",
+            "ReleaseAddress",
+            "CreateTags",
+            "DeleteTags",
+            "ModifyDBInstance",
+            "DeleteDBInstance"
+          ]
+        }
+      }
+    ]
+  })
+  
+  tags = local.mandatory_tags
+}
+
+resource "aws_cloudwatch_event_target" "cost_optimizer_changes" {
+  count = var.cost_optimizer_incremental ? 1 : 0
+  
+  rule      = aws_cloudwatch_event_rule.cost_optimizer_changes[0].name
+  target_id = "CostOptimizerLambda"
+  arn       = aws_lambda_function.cost_optimizer.arn
+}
+
+resource "aws_lambda_permission" "cost_optimizer_changes" {
+  count = var.cost_optimizer_incremental ? 1 : 0
+  
+  statement_id  = "AllowExecutionFromResourceChanges"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.cost_optimizer.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.cost_optimizer_changes[0].arn
+}
+
 # Variables for Cost Monitoring
 variable "monthly_budget_limit" {
   description = "Monthly budget limit in USD"
@@ -366,4 +636,34 @@ variable "cost_alert_email" {
   description = "Email address for cost alerts"
   type        = string
   default     = ""
-}
\ No newline at end of file
+}
+
+variable "cost_optimizer_target_accounts" {
+  description = "Account IDs the cost optimizer fans out to (empty analyzes only this account)"
+  type        = list(string)
+  default     = []
+}
+
+variable "cost_optimizer_target_regions" {
+  description = "Regions analyzed in each target account (empty uses the Lambda's region)"
+  type        = list(string)
+  default     = []
+}
+
+variable "cost_optimizer_target_role_name" {
+  description = "Role assumed in each target account by the cost optimizer"
+  type        = string
+  default     = "OrganizationAccountAccessRole"
+}
+
+variable "cost_optimizer_layer_arns" {
+  description = "Lambda layers for the cost optimizer; one providing NumPy (e.g. AWS SDK for pandas) speeds up large fleets"
+  type        = list(string)
+  default     = []
+}
+
+variable "cost_optimizer_incremental" {
+  description = "Keep recommendations per resource up to date from change events and report from them between weekly full scans"
+  type        = bool
+  default     = false
+}
@@ -0,0 +1,145 @@
+"""
+Spend Anomaly Detection
+Scores daily Cost Explorer spend per service against a rolling baseline, with NumPy
+when available and in pure Python otherwise
+"""
+
+import logging
+import math
+
+try:
+    import numpy as np
+except ImportError:  # Provided by a Lambda layer; scoring falls back to pure Python without it
+    np = None
+
+logger = logging.getLogger()
+
+# Trailing days that form each day's baseline
+BASELINE_DAYS = 7
+
+# Ignore deviations smaller than this many dollars per day or this fraction of the baseline
+MIN_EXCESS_DOLLARS = 1.0
+MIN_EXCESS_RATIO = 0.10
+
+# Floor on the baseline standard deviation so flat series don't produce huge z-scores
+MIN_STD_DOLLARS = 0.5
+
+def cost_matrix(results_by_time, metric='UnblendedCost'):
+    """
+    Turn Cost Explorer ResultsByTime into (days, group names, day x group matrix)
+    """
+    days = [result['TimePeriod']['Start'] for result in results_by_time]
+    group_index = {}
+    cells = []
+
+    for day, result in enumerate(results_by_time):
+        for group in result.get('Groups', []):
+            name = ' / '.join(group['Keys'])
+            column = group_index.setdefault(name, len(group_index))
+            cells.append((day, column, float(group['Metrics'][metric]['Amount'])))
+
+    matrix = np.zeros((len(days), len(group_index)))
+    if cells:
+        rows, columns, amounts = zip(*cells)
+        matrix[list(rows), list(columns)] = amounts
+
+    return days, list(group_index), matrix
+
+def rolling_baseline(matrix, window=BASELINE_DAYS):
+    """
+    Mean and standard deviation of the `window` days before each day (NaN until enough history)
+    """
+    days = matrix.shape[0]
+    padded = np.vstack([np.zeros((1, matrix.shape[1])), matrix])
+    sums = np.cumsum(padded, axis=0)
+    squares = np.cumsum(padded ** 2, axis=0)
+
+    mean = np.full(matrix.shape, np.nan)
+    std = np.full(matrix.shape, np.nan)
+    if days > window:
+        window_sum = sums[window:days] - sums[:days - window]
+        window_squares = squares[window:days] - squares[:days - window]
+        mean[window:] = window_sum / window
+        std[window:] = np.sqrt(np.maximum(window_squares / window - mean[window:] ** 2, 0))
+
+    return mean, std
+
+def detect_anomalies(results_by_time, z_threshold=3.0, eval_days=1, metric='UnblendedCost'):
+    """
+    Return anomaly dicts for the last `eval_days` days, ranked by excess spend
+    """
+    if np is None:
+        return detect_anomalies_python(results_by_time, z_threshold, eval_days, metric)
+
+    days, groups, matrix = cost_matrix(results_by_time, metric)
+    if matrix.shape[0] <= BASELINE_DAYS or not groups:
+        return []
+
+    mean, std = rolling_baseline(matrix)
+    excess = matrix - mean
+    z_scores = excess / np.maximum(std, MIN_STD_DOLLARS)
+
+    week_ago = np.full(matrix.shape, np.nan)
+    week_ago[7:] = matrix[:-7]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        week_over_week = np.where(week_ago > 0, (matrix - week_ago) / week_ago * 100, np.nan)
+
+    # Only score the most recent days
+    recent = np.zeros(matrix.shape, dtype=bool)
+    recent[-eval_days:] = True
+    material = excess >= np.maximum(MIN_EXCESS_DOLLARS, mean * MIN_EXCESS_RATIO)
+    flagged = recent & (z_scores >= z_threshold) & material
+
+    rows, columns = np.nonzero(flagged)
+    order = np.argsort(-excess[rows, columns], kind='stable')
+
+    return [
+        {
+            'day': days[rows[i]],
+            'group': groups[columns[i]],
+            'cost': float(matrix[rows[i], columns[i]]),
+            'baseline': float(mean[rows[i], columns[i]]),
+            'excess': float(excess[rows[i], columns[i]]),
+            'z_score': float(z_scores[rows[i], columns[i]]),
+            'week_over_week': None if np.isnan(week_over_week[rows[i], columns[i]])
+            else float(week_over_week[rows[i], columns[i]])
+        }
+        for i in order
+    ]
+
+def detect_anomalies_python(results_by_time, z_threshold=3.0, eval_days=1, metric='UnblendedCost'):
+    """
+    detect_anomalies without NumPy: the same baseline and scoring, computed per group
+    for the evaluated days only
+    """
+    days = [result['TimePeriod']['Start'] for result in results_by_time]
+    series = {}
+    for day, result in enumerate(results_by_time):
+        for group in result.get('Groups', []):
+            costs = series.setdefault(' / '.join(group['Keys']), [0.0] * len(days))
+            costs[day] = float(group['Metrics'][metric]['Amount'])
+    if len(days) <= BASELINE_DAYS or not series:
+        return []
+
+    anomalies = []
+    for day in range(max(BASELINE_DAYS, len(days) - eval_days), len(days)):
+        for name, costs in series.items():
+            window = costs[day - BASELINE_DAYS:day]
+            mean = sum(window) / BASELINE_DAYS
+            std = math.sqrt(max(sum(cost * cost for cost in window) / BASELINE_DAYS - mean ** 2, 0))
+            excess = costs[day] - mean
+            z_score = excess / max(std, MIN_STD_DOLLARS)
+            if z_score < z_threshold or excess < max(MIN_EXCESS_DOLLARS, mean * MIN_EXCESS_RATIO):
+                continue
+            week_ago = costs[day - 7]
+            anomalies.append({
+                'day': days[day],
+                'group': name,
+                'cost': costs[day],
+                'baseline': mean,
+                'excess': excess,
+                'z_score': z_score,
+                'week_over_week': (costs[day] - week_ago) / week_ago * 100 if week_ago > 0 else None
+            })
+
+    return sorted(anomalies, key=lambda anomaly: -anomaly['excess'])
@@ -0,0 +1,305 @@
+"""
+API Call Metrics
+Counts AWS calls, retries, errors and latency per operation and per analyzer/action scope,
+and emits them once per invocation as CloudWatch Embedded Metric Format or Prometheus text
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+logger = logging.getLogger()
+
+# Latency histogram bucket upper bounds in seconds (Prometheus client defaults)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# EMF accepts at most this many values per metric in one log line
+EMF_MAX_VALUES = 100
+
+# Scope of calls made outside any analyzer or action
+DEFAULT_SCOPE = 'handler'
+
+_scope = ContextVar('api_metrics_scope', default=DEFAULT_SCOPE)
+
+class OperationStats:
+    """
+    Calls, retries, errors and latencies of one operation within one scope
+    """
+    __slots__ = ('calls', 'retries', 'errors', 'latencies')
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.errors = 0
+        self.latencies = []
+
+    def histogram(self):
+        """
+        Cumulative counts per LATENCY_BUCKETS bound, then +Inf
+        """
+        counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        for latency in self.latencies:
+            counts[bisect_left(LATENCY_BUCKETS, latency)] += 1
+        for i in range(1, len(counts)):
+            counts[i] += counts[i - 1]
+        return counts
+
+class ApiMetrics:
+    """
+    Per-invocation API call accounting, driven by botocore's before-call, after-call
+    and after-call-error events.
+
+    Calls are attributed to the scope active in the calling context, so work
+    submitted through scheduler (which copies the context) keeps its analyzer's scope.
+    Retries come from the response's RetryAttempts, so one call that botocore
+    retried three times counts as one call and three retries.
+    """
+
+    def __init__(self, output='emf', namespace='Diagnyx/Lambda', pushgateway_url=None, clock=time.perf_counter):
+        self.output = output
+        self.namespace = namespace
+        self.pushgateway_url = pushgateway_url
+        self.clock = clock
+        self.operations = {}
+        self.durations = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_environ(cls):
+        """
+        Metrics configured by METRICS_OUTPUT (emf, prometheus, both or none),
+        METRICS_NAMESPACE and PROMETHEUS_PUSHGATEWAY_URL
+        """
+        return cls(
+            output=os.environ.get('METRICS_OUTPUT', 'emf').lower(),
+            namespace=os.environ.get('METRICS_NAMESPACE', 'Diagnyx/Lambda'),
+            pushgateway_url=os.environ.get('PROMETHEUS_PUSHGATEWAY_URL') or None
+        )
+
+    def register(self, session):
+        """
+        Hook the metrics into a botocore session; clients created from it afterwards are counted
+        """
+        session.register('before-call', self.before_call, unique_id=f'api-metrics-before-{id(self)}')
+        session.register('after-call', self.after_call, unique_id=f'api-metrics-after-{id(self)}')
+        session.register('after-call-error', self.after_call_error, unique_id=f'api-metrics-error-{id(self)}')
+
+    def before_call(self, context, **kwargs):
+        context['api_metrics'] = (_scope.get(), self.clock())
+
+    def after_call(self, event_name, context, http_response=None, parsed=None, **kwargs):
+        retries = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        failed = http_response is None or http_response.status_code >= 400
+        self._record(event_name, context, retries, failed)
+
+    def after_call_error(self, event_name, context, **kwargs):
+        # Connection errors and exhausted retries; the attempt count is not reported
+        self._record(event_name, context, 0, True)
+
+    def _record(self, event_name, context, retries, failed):
+        started = context.get('api_metrics')
+        if started is None:
+            return
+        scope, start = started
+        latency = self.clock() - start
+        key = (scope, event_name.split('.', 1)[1])
+        with self.lock:
+            stats = self.operations.get(key)
+            if stats is None:
+                stats = self.operations[key] = OperationStats()
+            stats.calls += 1
+            stats.retries += retries
+            stats.errors += failed
+            stats.latencies.append(latency)
+
+    @contextmanager
+    def scope(self, name):
+        """
+        Attribute calls made inside the block (and threads it submits) to name and time the block
+        """
+        token = _scope.set(name)
+        start = self.clock()
+        try:
+            yield
+        finally:
+            elapsed = self.clock() - start
+            _scope.reset(token)
+            with self.lock:
+                self.durations[name] = self.durations.get(name, 0.0) + elapsed
+
+    def scoped(self, name, func):
+        """
+        Wrap func so every call runs inside scope(name)
+        """
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.scope(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def instrument(self, handler):
+        """
+        Decorate a Lambda handler so each invocation starts from zero and flushes its metrics
+        """
+        @wraps(handler)
+        def instrumented(event, context):
+            self.reset()
+            try:
+                return handler(event, context)
+            finally:
+                try:
+                    self.flush(getattr(context, 'function_name', None) or os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local'))
+                except Exception as e:
+                    logger.error(f"Failed to emit API metrics: {str(e)}")
+        return instrumented
+
+    def reset(self):
+        with self.lock:
+            self.operations = {}
+            self.durations = {}
+
+    def snapshot(self):
+        """
+        {(scope, operation): OperationStats} and {scope: seconds} recorded so far
+        """
+        with self.lock:
+            return dict(self.operations), dict(self.durations)
+
+    def summary(self):
+        """
+        {scope: {'calls', 'retries', 'errors', 'api_seconds', 'seconds'}} recorded so far
+        """
+        operations, durations = self.snapshot()
+        scopes = {
+            scope: {'calls': 0, 'retries': 0, 'errors': 0, 'api_seconds': 0.0, 'seconds': seconds}
+            for scope, seconds in durations.items()
+        }
+        for (scope, _), stats in operations.items():
+            row = scopes.setdefault(
+                scope, {'calls': 0, 'retries': 0, 'errors': 0, 'api_seconds': 0.0, 'seconds': None}
+            )
+            row['calls'] += stats.calls
+            row['retries'] += stats.retries
+            row['errors'] += stats.errors
+            row['api_seconds'] += sum(stats.latencies)
+        return scopes
+
+    def flush(self, function_name):
+        """
+        Emit this invocation's metrics in the configured output format(s)
+        """
+        if self.output in ('emf', 'both'):
+            for line in self.emf_lines(function_name):
+                # EMF must be a bare JSON log line, without the logger's prefix
+                print(line)
+        if self.output in ('prometheus', 'both'):
+            text = self.prometheus_text(function_name)
+            if self.pushgateway_url:
+                push_to_gateway(self.pushgateway_url, function_name, text)
+            else:
+                print(text, end='')
+
+    def emf_lines(self, function_name):
+        """
+        CloudWatch Embedded Metric Format log lines: one per scope with its wall time and
+        one per (scope, operation), with latencies continued over extra lines past EMF_MAX_VALUES
+        """
+        operations, durations = self.snapshot()
+        timestamp = int(time.time() * 1000)
+
+        def line(dimensions, metrics, values):
+            return json.dumps({
+                '_aws': {
+                    'Timestamp': timestamp,
+                    'CloudWatchMetrics': [{
+                        'Namespace': self.namespace,
+                        'Dimensions': dimensions,
+                        'Metrics': [{'Name': name, 'Unit': unit} for name, unit in metrics]
+                    }]
+                },
+                'Function': function_name,
+                **values
+            })
+
+        for scope, seconds in sorted(durations.items()):
+            yield line([['Function', 'Scope']], [('Duration', 'Seconds')], {'Scope': scope, 'Duration': seconds})
+
+        counters = [('ApiCalls', 'Count'), ('ApiRetries', 'Count'), ('ApiErrors', 'Count')]
+        latency = [('ApiLatency', 'Milliseconds')]
+        dimensions = [['Function', 'Scope', 'Operation'], ['Function', 'Scope']]
+        for (scope, operation), stats in sorted(operations.items()):
+            latencies = [round(value * 1000, 3) for value in stats.latencies]
+            values = {'Scope': scope, 'Operation': operation}
+            yield line(dimensions, counters + latency, {
+                **values,
+                'ApiCalls': stats.calls,
+                'ApiRetries': stats.retries,
+                'ApiErrors': stats.errors,
+                'ApiLatency': latencies[:EMF_MAX_VALUES]
+            })
+            for i in range(EMF_MAX_VALUES, len(latencies), EMF_MAX_VALUES):
+                yield line(dimensions, latency, {**values, 'ApiLatency': latencies[i:i + EMF_MAX_VALUES]})
+
+    def prometheus_text(self, function_name):
+        """
+        Prometheus text exposition of this invocation's metrics
+        """
+        operations, durations = self.snapshot()
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def labels(**values):
+            return ','.join(f'{key}="{_escape(value)}"' for key, value in values.items())
+
+        family('diagnyx_lambda_scope_duration_seconds', 'gauge', 'Wall time of each analyzer or action in the last invocation')
+        for scope, seconds in sorted(durations.items()):
+            lines.append(f"diagnyx_lambda_scope_duration_seconds{{{labels(function=function_name, scope=scope)}}} {seconds}")
+
+        for name, attribute, help_text in (
+            ('diagnyx_lambda_api_calls', 'calls', 'AWS API calls in the last invocation'),
+            ('diagnyx_lambda_api_retries', 'retries', 'AWS API retries in the last invocation'),
+            ('diagnyx_lambda_api_errors', 'errors', 'Failed AWS API calls in the last invocation')
+        ):
+            family(name, 'gauge', help_text)
+            for (scope, operation), stats in sorted(operations.items()):
+                lines.append(
+                    f"{name}{{{labels(function=function_name, scope=scope, operation=operation)}}} "
+                    f"{getattr(stats, attribute)}"
+                )
+
+        name = 'diagnyx_lambda_api_call_duration_seconds'
+        family(name, 'histogram', 'AWS API call latency, retries included, in the last invocation')
+        for (scope, operation), stats in sorted(operations.items()):
+            common = labels(function=function_name, scope=scope, operation=operation)
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), stats.histogram()):
+                lines.append(f'{name}_bucket{{{common},le="{bound}"}} {count}')
+            lines.append(f"{name}_sum{{{common}}} {sum(stats.latencies)}")
+            lines.append(f"{name}_count{{{common}}} {len(stats.latencies)}")
+
+        return '\n'.join(lines) + '\n'
+
+def push_to_gateway(url, job, text):
+    """
+    Replace the job's metric group on a Prometheus Pushgateway
+    """
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/metrics/job/{job}",
+        data=text.encode(),
+        method='PUT',
+        headers={'Content-Type': 'text/plain; version=0.0.4'}
+    )
+    with urllib.request.urlopen(request, timeout=5) as response:
+        response.read()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
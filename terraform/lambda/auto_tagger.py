@@ -5,46 +5,110 @@ Automatically tags resources created without proper tags for cost tracking
 
 import os
 import json
-import boto3
 import logging
+from collections import defaultdict
 from datetime import datetime
 
+from botocore.exceptions import ClientError
+
+from aws_clients import api_metrics, default_client, preload_models
+from checkpoint import Checkpoint, CheckpointStore
+from object_store import store_from_uri
+from tag_backfill import backfill, resource_streams
+from tag_state import TagStateCache, fingerprint, semantic_hash
+
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize AWS clients
-ec2_client = boto3.client('ec2')
-rds_client = boto3.client('rds')
-s3_client = boto3.client('s3')
+# AWS clients, created on first use so each event only builds the one it needs
+ec2_client = default_client('ec2')
+rds_client = default_client('rds')
+s3_client = default_client('s3')
+preload_models(['ec2', 'rds', 's3'])
+
+# Backfill only: TagResources calls and continuations of long sweeps
+tagging_client = default_client('resourcegroupstaggingapi')
+lambda_client = default_client('lambda')
+
+# Progress of backfill sweeps that continue in a new invocation; must be shared storage (S3) across containers
+checkpoint_store = CheckpointStore(
+    store_from_uri(os.environ.get('CHECKPOINT_URI', '/tmp/diagnyx-cache')),
+    prefix='backfill-checkpoints'
+)
+
+# Default tags from the environment, parsed once per container
+DEFAULT_TAGS = json.loads(os.environ.get('DEFAULT_TAGS', '{}'))
+
+# Recently tagged resources and handled events, so repeats cost no AWS calls
+tag_state = TagStateCache.from_environ()
+
+# Most resources EC2 tags in one create_tags call
+CREATE_TAGS_MAX_RESOURCES = 1000
+
+# Most values EC2 accepts in one describe filter
+FILTER_VALUES_LIMIT = 200
+
+# Lifecycle rule kept on log buckets: archive after 30/90 days, expire after a year
+LOG_LIFECYCLE_RULE = {
+    'ID': 'auto-archive-logs',
+    'Status': 'Enabled',
+    'Filter': {'Prefix': ''},
+    'Transitions': [
+        {
+            'Days': 30,
+            'StorageClass': 'STANDARD_IA'
+        },
+        {
+            'Days': 90,
+            'StorageClass': 'GLACIER'
+        }
+    ],
+    'Expiration': {
+        'Days': 365
+    }
+}
 
+@api_metrics.instrument
 def handler(event, context):
     """
     Main Lambda handler for auto-tagging resources
     """
     try:
-        # Get default tags from environment
-        default_tags = json.loads(os.environ.get('DEFAULT_TAGS', '{}'))
+        default_tags = build_default_tags()
         
-        # Add dynamic tags
-        default_tags['LastModified'] = datetime.utcnow().isoformat()
-        default_tags['AutoTagged'] = 'true'
+        # SQS delivers EventBridge events in batches during event storms
+        if 'Records' in event:
+            return handle_batch(event['Records'], default_tags)
         
         # Determine resource type from event
         source = event.get('source', '')
         detail_type = event.get('detail-type', '')
         detail = event.get('detail', {})
         
+        # EventBridge may deliver the same event more than once
+        if tag_state.is_duplicate(event.get('id')):
+            logger.info(f"Skipping duplicate event {event['id']}")
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'message': 'Duplicate event skipped',
+                    'timestamp': datetime.utcnow().isoformat()
+                })
+            }
+        
         logger.info(f"Processing event from {source}: {detail_type}")
         
-        if source == 'aws.ec2':
-            handle_ec2_event(detail, default_tags)
-        elif source == 'aws.rds':
-            handle_rds_event(detail, default_tags)
-        elif source == 'aws.s3':
-            handle_s3_event(detail, default_tags)
-        else:
-            logger.warning(f"Unsupported event source: {source}")
+        with api_metrics.scope(source or 'unknown'):
+            if source == 'aws.ec2':
+                handle_ec2_event(detail, default_tags)
+            elif source == 'aws.rds':
+                handle_rds_event(detail, default_tags)
+            elif source == 'aws.s3':
+                handle_s3_event(detail, default_tags)
+            else:
+                logger.warning(f"Unsupported event source: {source}")
+        tag_state.record_event(event.get('id'))
         
         return {
             'statusCode': 200,
@@ -64,6 +128,161 @@ def handler(event, context):
             })
         }
 
+@api_metrics.instrument
+def backfill_handler(event, context):
+    """
+    Apply missing default tags to every existing EC2 instance, EBS volume, RDS database
+    and S3 bucket in this account/region. Long sweeps continue in a new invocation.
+    """
+    try:
+        checkpoint = start_backfill_checkpoint(event, context)
+        account_id = context.invoked_function_arn.split(':')[4]
+        streams = resource_streams(ec2_client, rds_client, s3_client, tagging_client, account_id)
+        
+        with api_metrics.scope('backfill'):
+            summary = backfill(
+                streams, tagging_client, build_default_tags(), checkpoint,
+                max_workers=int(os.environ.get('BACKFILL_WORKERS', '8'))
+            )
+        counts = {name: dict(stream_counts) for name, stream_counts in summary.items() if stream_counts}
+        
+        # Out of time: pick the sweep up again in a fresh invocation
+        if checkpoint.suspended and continue_backfill(checkpoint, context):
+            return {
+                'statusCode': 202,
+                'body': json.dumps({
+                    'message': 'Tag backfill continues in a new invocation',
+                    'run_id': checkpoint.run_id,
+                    'invocation': checkpoint.invocation,
+                    'resources': counts,
+                    'timestamp': datetime.utcnow().isoformat()
+                })
+            }
+        if checkpoint.invocation > 1:
+            checkpoint_store.delete(checkpoint.run_id)
+        
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'message': 'Tag backfill completed' if not checkpoint.suspended else 'Tag backfill stopped early',
+                'run_id': checkpoint.run_id,
+                'resources': counts,
+                'timestamp': datetime.utcnow().isoformat()
+            })
+        }
+        
+    except Exception as e:
+        logger.error(f"Error in tag backfill: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({
+                'error': str(e),
+                'timestamp': datetime.utcnow().isoformat()
+            })
+        }
+
+def start_backfill_checkpoint(event, context):
+    """
+    Checkpoint for this invocation, resumed from the event's run ID when continuing a sweep
+    """
+    reserve_ms = int(float(os.environ.get('CHECKPOINT_RESERVE_SECONDS', '30')) * 1000)
+    run_id = (event or {}).get('backfill_run_id')
+    if run_id:
+        state = checkpoint_store.load(run_id)
+        if state:
+            logger.info(f"Resuming backfill {run_id} from checkpoint")
+            return Checkpoint.from_dict(state, context, reserve_ms)
+        logger.warning(f"Checkpoint {run_id} not found, starting a new backfill")
+    
+    return Checkpoint(context, reserve_ms)
+
+def continue_backfill(checkpoint, context):
+    """
+    Save the checkpoint and asynchronously invoke this function to continue the sweep.
+    Returns False when the sweep should stop instead.
+    """
+    max_invocations = int(os.environ.get('CHECKPOINT_MAX_INVOCATIONS', '20'))
+    if checkpoint.invocation >= max_invocations:
+        logger.warning(f"Backfill {checkpoint.run_id} reached {max_invocations} invocations, stopping")
+        return False
+    
+    try:
+        checkpoint_store.save(checkpoint)
+        lambda_client.invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType='Event',
+            Payload=json.dumps({'backfill_run_id': checkpoint.run_id})
+        )
+    except Exception as e:
+        logger.error(f"Failed to continue backfill {checkpoint.run_id}: {str(e)}")
+        return False
+    
+    logger.info(
+        f"Backfill {checkpoint.run_id} suspended in invocation {checkpoint.invocation} "
+        f"({', '.join(sorted(checkpoint.suspended))} pending)"
+    )
+    return True
+
+def build_default_tags():
+    """
+    Default tags from the environment plus the dynamic tags of this invocation
+    """
+    default_tags = dict(DEFAULT_TAGS)
+    default_tags['LastModified'] = datetime.utcnow().isoformat()
+    default_tags['AutoTagged'] = 'true'
+    return default_tags
+
+def handle_batch(records, default_tags):
+    """
+    Handle a batch of EventBridge events delivered through SQS. EC2 instances from every
+    event are described and tagged together; RDS and S3 events are handled one by one.
+    Failed messages are reported so SQS retries only those.
+    """
+    failures = []
+    duplicates = 0
+    events_by_instance = defaultdict(list)
+    
+    for record in records:
+        try:
+            event = json.loads(record['body'])
+            if tag_state.is_duplicate(event.get('id')):
+                duplicates += 1
+                continue
+            source = event.get('source', '')
+            detail = event.get('detail', {})
+            with api_metrics.scope(source or 'unknown'):
+                if source == 'aws.ec2':
+                    if detail.get('instance-id'):
+                        events_by_instance[detail['instance-id']].append((record['messageId'], event.get('id')))
+                        continue
+                elif source == 'aws.rds':
+                    handle_rds_event(detail, default_tags)
+                elif source == 'aws.s3':
+                    handle_s3_event(detail, default_tags)
+                else:
+                    logger.warning(f"Unsupported event source: {source}")
+            tag_state.record_event(event.get('id'))
+        except Exception as e:
+            logger.error(f"Error processing message {record.get('messageId')}: {str(e)}")
+            failures.append(record.get('messageId'))
+    
+    if events_by_instance:
+        instance_events = [item for items in events_by_instance.values() for item in items]
+        try:
+            with api_metrics.scope('aws.ec2'):
+                tag_instances(list(events_by_instance), default_tags)
+            for _, event_id in instance_events:
+                tag_state.record_event(event_id)
+        except Exception as e:
+            logger.error(f"Error tagging {len(events_by_instance)} EC2 instances: {str(e)}")
+            failures.extend(message_id for message_id, _ in instance_events)
+    
+    logger.info(
+        f"Processed {len(records)} events ({duplicates} duplicates), "
+        f"{len(events_by_instance)} EC2 instances, {len(failures)} failed"
+    )
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failures]}
+
 def handle_ec2_event(detail, default_tags):
     """
     Handle EC2 instance tagging
@@ -72,126 +291,211 @@ def handle_ec2_event(detail, default_tags):
     if not instance_id:
         return
     
-    # Check existing tags
-    response = ec2_client.describe_instances(InstanceIds=[instance_id])
-    if not response['Reservations']:
+    tag_instances([instance_id], default_tags)
+
+def tag_instances(instance_ids, default_tags):
+    """
+    Tag EC2 instances missing default tags, and their volumes, with as few calls as possible.
+    Instances tagged with the same default tags within the tag state TTL are skipped.
+    """
+    tags_fingerprint = fingerprint(default_tags)
+    pending = [
+        instance_id for instance_id in instance_ids
+        if not tag_state.is_current('ec2', instance_id, tags_fingerprint)
+    ]
+    if not pending:
         return
     
-    instance = response['Reservations'][0]['Instances'][0]
+    tags_by_resource = {}
+    described = []
+    
+    # Check existing tags; unknown IDs are filtered out rather than failing the call
+    for offset in range(0, len(pending), FILTER_VALUES_LIMIT):
+        chunk = pending[offset:offset + FILTER_VALUES_LIMIT]
+        paginator = ec2_client.get_paginator('describe_instances')
+        for page in paginator.paginate(Filters=[{'Name': 'instance-id', 'Values': chunk}]):
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    described.append(instance['InstanceId'])
+                    tags_by_resource.update(instance_tags(instance, default_tags))
+    
+    create_tags_grouped(tags_by_resource)
+    tag_state.mark('ec2', described, tags_fingerprint)
+
+def instance_tags(instance, default_tags):
+    """
+    {resource_id: {key: value}} to add to an instance and its volumes; empty when it has every default tag
+    """
+    instance_id = instance['InstanceId']
     existing_tags = {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
     
     # Determine which tags are missing
-    tags_to_add = []
+    tags_to_add = {}
     for key, value in default_tags.items():
         if key not in existing_tags:
-            tags_to_add.append({'Key': key, 'Value': str(value)})
+            tags_to_add[key] = str(value)
     
-    if tags_to_add:
-        logger.info(f"Adding {len(tags_to_add)} tags to EC2 instance {instance_id}")
-        
-        # Add instance-specific tags
-        tags_to_add.append({'Key': 'InstanceType', 'Value': instance['InstanceType']})
-        tags_to_add.append({'Key': 'LaunchTime', 'Value': instance['LaunchTime'].isoformat()})
-        
-        # Determine cost optimization tags
-        if instance['InstanceLifecycleType'] == 'spot':
-            tags_to_add.append({'Key': 'CostOptimized', 'Value': 'spot-instance'})
-        
-        ec2_client.create_tags(
-            Resources=[instance_id],
-            Tags=tags_to_add
-        )
-        
-        # Also tag associated volumes
-        for volume in instance.get('BlockDeviceMappings', []):
-            if 'Ebs' in volume:
-                volume_id = volume['Ebs']['VolumeId']
-                ec2_client.create_tags(
-                    Resources=[volume_id],
-                    Tags=tags_to_add + [{'Key': 'AttachedInstance', 'Value': instance_id}]
-                )
+    if not tags_to_add:
+        return {}
+    
+    logger.info(f"Adding {len(tags_to_add)} tags to EC2 instance {instance_id}")
+    
+    # Add instance-specific tags
+    tags_to_add['InstanceType'] = instance['InstanceType']
+    tags_to_add['LaunchTime'] = instance['LaunchTime'].isoformat()
+    
+    # Determine cost optimization tags
+    if instance.get('InstanceLifecycle') == 'spot':
+        tags_to_add['CostOptimized'] = 'spot-instance'
+    
+    # Volumes get the same tags, so an instance and its volumes share one create_tags call
+    # with every instance of the same type and launch time
+    tags_by_resource = {instance_id: tags_to_add}
+    for volume in instance.get('BlockDeviceMappings', []):
+        if 'Ebs' in volume:
+            tags_by_resource[volume['Ebs']['VolumeId']] = tags_to_add
+    return tags_by_resource
+
+def create_tags_grouped(tags_by_resource):
+    """
+    Apply {resource_id: {key: value}} with one create_tags call per distinct tag set, so
+    instances launched together (same type and launch time) and their volumes are tagged
+    in a single call
+    """
+    resources_by_tags = defaultdict(list)
+    for resource_id, tags in tags_by_resource.items():
+        resources_by_tags[tuple(sorted(tags.items()))].append(resource_id)
+    
+    for tags, resource_ids in resources_by_tags.items():
+        for offset in range(0, len(resource_ids), CREATE_TAGS_MAX_RESOURCES):
+            ec2_client.create_tags(
+                Resources=resource_ids[offset:offset + CREATE_TAGS_MAX_RESOURCES],
+                Tags=[{'Key': key, 'Value': value} for key, value in tags]
+            )
 
 def handle_rds_event(detail, default_tags):
     """
-    Handle RDS instance tagging
+    Handle RDS instance tagging. Errors propagate, so a failed event is retried rather
+    than recorded as handled; databases deleted before the event arrives are skipped.
     """
     db_instance_id = detail.get('SourceIdentifier')
     if not db_instance_id:
         return
     
+    tags_fingerprint = fingerprint(default_tags)
+    if tag_state.is_current('rds', db_instance_id, tags_fingerprint):
+        return
+    
+    # Get DB instance details
     try:
-        # Get DB instance details
         response = rds_client.describe_db_instances(DBInstanceIdentifier=db_instance_id)
-        if not response['DBInstances']:
-            return
-        
-        db_instance = response['DBInstances'][0]
-        db_arn = db_instance['DBInstanceArn']
-        
-        # Get existing tags
-        tags_response = rds_client.list_tags_for_resource(ResourceName=db_arn)
-        existing_tags = {tag['Key']: tag['Value'] for tag in tags_response['TagList']}
+    except rds_client.exceptions.DBInstanceNotFoundFault:
+        logger.info(f"RDS instance {db_instance_id} no longer exists, skipping")
+        return
+    if not response['DBInstances']:
+        return
+    
+    db_instance = response['DBInstances'][0]
+    db_arn = db_instance['DBInstanceArn']
+    
+    # Get existing tags
+    tags_response = rds_client.list_tags_for_resource(ResourceName=db_arn)
+    existing_tags = {tag['Key']: tag['Value'] for tag in tags_response['TagList']}
+    
+    # Determine which tags are missing
+    tags_to_add = []
+    for key, value in default_tags.items():
+        if key not in existing_tags:
+            tags_to_add.append({'Key': key, 'Value': str(value)})
+    
+    if tags_to_add:
+        logger.info(f"Adding {len(tags_to_add)} tags to RDS instance {db_instance_id}")
         
-        # Determine which tags are missing
-        tags_to_add = []
-        for key, value in default_tags.items():
-            if key not in existing_tags:
-                tags_to_add.append({'Key': key, 'Value': str(value)})
+        # Add RDS-specific tags
+        tags_to_add.append({'Key': 'Engine', 'Value': db_instance['Engine']})
+        tags_to_add.append({'Key': 'InstanceClass', 'Value': db_instance['DBInstanceClass']})
+        tags_to_add.append({'Key': 'MultiAZ', 'Value': str(db_instance['MultiAZ'])})
         
-        if tags_to_add:
-            logger.info(f"Adding {len(tags_to_add)} tags to RDS instance {db_instance_id}")
-            
-            # Add RDS-specific tags
-            tags_to_add.append({'Key': 'Engine', 'Value': db_instance['Engine']})
-            tags_to_add.append({'Key': 'InstanceClass', 'Value': db_instance['DBInstanceClass']})
-            tags_to_add.append({'Key': 'MultiAZ', 'Value': str(db_instance['MultiAZ'])})
-            
-            rds_client.add_tags_to_resource(
-                ResourceName=db_arn,
-                Tags=tags_to_add
-            )
-            
-    except Exception as e:
-        logger.error(f"Error tagging RDS instance {db_instance_id}: {str(e)}")
+        rds_client.add_tags_to_resource(
+            ResourceName=db_arn,
+            Tags=tags_to_add
+        )
+    
+    tag_state.mark('rds', [db_instance_id], tags_fingerprint)
 
 def handle_s3_event(detail, default_tags):
     """
-    Handle S3 bucket tagging
+    Handle S3 bucket tagging. Errors propagate, so a failed event is retried rather
+    than recorded as handled; buckets deleted before the event arrives are skipped.
     """
     bucket_name = detail.get('bucket', {}).get('name')
     if not bucket_name:
         return
     
+    tags_fingerprint = fingerprint(default_tags)
+    if tag_state.is_current('s3', bucket_name, tags_fingerprint):
+        return
+    
     try:
-        # Get existing tags
-        try:
-            response = s3_client.get_bucket_tagging(Bucket=bucket_name)
-            existing_tags = {tag['Key']: tag['Value'] for tag in response.get('TagSet', [])}
-        except s3_client.exceptions.NoSuchTagSet:
-            existing_tags = {}
-        
-        # Merge with default tags
-        all_tags = {**default_tags, **existing_tags}
-        
-        # Add S3-specific tags
-        all_tags['StorageClass'] = 'STANDARD'
-        all_tags['BucketPurpose'] = determine_bucket_purpose(bucket_name)
-        
-        # Convert to TagSet format
-        tag_set = [{'Key': k, 'Value': str(v)} for k, v in all_tags.items()]
-        
-        logger.info(f"Updating tags for S3 bucket {bucket_name}")
-        s3_client.put_bucket_tagging(
-            Bucket=bucket_name,
-            Tagging={'TagSet': tag_set}
-        )
-        
-        # Also set up lifecycle policy if it's a log bucket
-        if 'log' in bucket_name.lower():
-            setup_log_bucket_lifecycle(bucket_name)
-            
-    except Exception as e:
-        logger.error(f"Error tagging S3 bucket {bucket_name}: {str(e)}")
+        reconcile_bucket_tags(bucket_name, default_tags)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'NoSuchBucket':
+            raise
+        logger.info(f"S3 bucket {bucket_name} no longer exists, skipping")
+        return
+    
+    # Also set up lifecycle policy if it's a log bucket
+    if 'log' in bucket_name.lower():
+        setup_log_bucket_lifecycle(bucket_name)
+    
+    tag_state.mark('s3', [bucket_name], tags_fingerprint)
+
+def reconcile_bucket_tags(bucket_name, default_tags):
+    """
+    Write the bucket's desired tag set only when it differs from the current one in more
+    than volatile tags, so repeated events on a busy bucket cost one read each
+    """
+    # Get existing tags
+    try:
+        response = s3_client.get_bucket_tagging(Bucket=bucket_name)
+        existing_tags = {tag['Key']: tag['Value'] for tag in response.get('TagSet', [])}
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'NoSuchTagSet':
+            raise
+        existing_tags = {}
+    
+    # Merge with default tags
+    all_tags = {**{key: str(value) for key, value in default_tags.items()}, **existing_tags}
+    
+    # Add S3-specific tags
+    all_tags['StorageClass'] = 'STANDARD'
+    all_tags['BucketPurpose'] = determine_bucket_purpose(bucket_name)
+    
+    if fingerprint(all_tags) == fingerprint(existing_tags):
+        logger.info(f"Tags of S3 bucket {bucket_name} are up to date")
+        return False
+    
+    # The write is a modification, so it carries this invocation's timestamp
+    if 'LastModified' in default_tags:
+        all_tags['LastModified'] = default_tags['LastModified']
+    
+    logger.info(f"Updating tags for S3 bucket {bucket_name}")
+    s3_client.put_bucket_tagging(
+        Bucket=bucket_name,
+        Tagging={'TagSet': [{'Key': k, 'Value': v} for k, v in all_tags.items()]}
+    )
+    return True
+
+def lifecycle_rule_hash(rule):
+    """
+    Semantic hash of a lifecycle rule over the fields LOG_LIFECYCLE_RULE sets; S3 may return
+    transitions in any order and fills in fields we never set
+    """
+    if rule is None:
+        return None
+    normalized = {key: rule.get(key) for key in LOG_LIFECYCLE_RULE}
+    normalized['Transitions'] = sorted(rule.get('Transitions', []), key=lambda transition: transition.get('Days', 0))
+    return semantic_hash(normalized)
 
 def determine_bucket_purpose(bucket_name):
     """
@@ -214,32 +518,26 @@ def determine_bucket_purpose(bucket_name):
 
 def setup_log_bucket_lifecycle(bucket_name):
     """
-    Set up lifecycle policy for log buckets to optimize costs
+    Set up lifecycle policy for log buckets to optimize costs. The configuration is only
+    written when the archive rule is missing or differs; other rules on the bucket are kept.
     """
     try:
+        try:
+            rules = s3_client.get_bucket_lifecycle_configuration(Bucket=bucket_name).get('Rules', [])
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchLifecycleConfiguration':
+                raise
+            rules = []
+        
+        current = next((rule for rule in rules if rule.get('ID') == LOG_LIFECYCLE_RULE['ID']), None)
+        if lifecycle_rule_hash(current) == lifecycle_rule_hash(LOG_LIFECYCLE_RULE):
+            logger.info(f"Lifecycle policy of log bucket {bucket_name} is up to date")
+            return
+        
+        other_rules = [rule for rule in rules if rule.get('ID') != LOG_LIFECYCLE_RULE['ID']]
         s3_client.put_bucket_lifecycle_configuration(
             Bucket=bucket_name,
-            LifecycleConfiguration={
-                'Rules': [
-                    {
-                        'ID': 'auto-archive-logs',
-                        'Status': 'Enabled',
-                        'Transitions': [
-                            {
-                                'Days': 30,
-                                'StorageClass': 'STANDARD_IA'
-                            },
-                            {
-                                'Days': 90,
-                                'StorageClass': 'GLACIER'
-                            }
-                        ],
-                        'Expiration': {
-                            'Days': 365
-                        }
-                    }
-                ]
-            }
+            LifecycleConfiguration={'Rules': other_rules + [LOG_LIFECYCLE_RULE]}
         )
         logger.info(f"Lifecycle policy applied to log bucket {bucket_name}")
     except Exception as e:
@@ -0,0 +1,167 @@
+"""
+AWS Client Scoping
+Resolves clients and per-target state for the account/region currently being analyzed.
+Clients are created on first use from one botocore session, so service models are parsed once.
+"""
+
+import os
+import threading
+from contextvars import ContextVar
+
+import boto3
+import botocore.session
+from botocore.exceptions import DataNotFoundError
+
+from api_metrics import ApiMetrics
+from rate_limiter import AdaptiveRateLimiter
+
+try:
+    from snapshot_restore_py import register_after_restore
+except ImportError:  # Only available in Lambda runtimes that support SnapStart
+    register_after_restore = None
+
+# Init types where the init phase runs ahead of any request, so preloading is free for callers
+PRELOAD_INIT_TYPES = ('snap-start', 'provisioned-concurrency')
+
+# Model files a client needs when it is created
+CLIENT_MODEL_TYPES = ('service-2', 'endpoint-rule-set-1', 'paginators-1')
+
+class Target:
+    """
+    A boto3 session for one account/region plus the clients and state built from it
+    """
+
+    def __init__(self, session, account_id=None, region=None):
+        self.session = session
+        self.account_id = account_id
+        self.region = region or session.region_name
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, factory):
+        """
+        Return the object stored under key, creating it once with factory(target)
+        """
+        obj = self.objects.get(key)
+        if obj is None:
+            with self.lock:
+                obj = self.objects.get(key)
+                if obj is None:
+                    obj = factory(self)
+                    self.objects[key] = obj
+        return obj
+
+    def reset(self):
+        """
+        Drop every client and object so they are rebuilt on next use
+        """
+        with self.lock:
+            self.objects.clear()
+
+# Throttles every API call in the container, whichever session or thread makes it
+rate_limiter = AdaptiveRateLimiter.from_environ()
+
+# Counts every API call in the container per operation and analyzer/action scope
+api_metrics = ApiMetrics.from_environ()
+
+# Shared by every session in the container; its loader caches parsed service models
+botocore_session = botocore.session.get_session()
+rate_limiter.register(botocore_session)
+api_metrics.register(botocore_session)
+
+def session_for(aws_access_key_id=None, aws_secret_access_key=None, aws_session_token=None, region_name=None):
+    """
+    boto3 session with its own credentials that reuses the already loaded service models
+    and the shared rate limiter and API metrics
+    """
+    core_session = botocore.session.get_session()
+    core_session.register_component('data_loader', botocore_session.get_component('data_loader'))
+    rate_limiter.register(core_session)
+    api_metrics.register(core_session)
+    return boto3.Session(
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key,
+        aws_session_token=aws_session_token,
+        region_name=region_name,
+        botocore_session=core_session
+    )
+
+# Target used when no fan-out target is active: the Lambda's own account and region
+default_target = Target(boto3.Session(botocore_session=botocore_session))
+
+_current_target = ContextVar('current_target', default=None)
+
+def current_target():
+    """
+    Target the calling code is running against
+    """
+    return _current_target.get() or default_target
+
+def run_in_target(target, func, *args):
+    """
+    Call func with every scoped client and value resolving against target
+    """
+    token = _current_target.set(target)
+    try:
+        return func(*args)
+    finally:
+        _current_target.reset(token)
+
+class Scoped:
+    """
+    Proxy that forwards attribute access to a per-target object, created on first use.
+    Without a fixed target it follows the current target.
+    """
+
+    def __init__(self, key, factory, target=None):
+        self._key = key
+        self._factory = factory
+        self._target = target
+
+    def __getattr__(self, name):
+        target = self._target or current_target()
+        return getattr(target.get(self._key, self._factory), name)
+
+def _client_factory(service, region=None):
+    return lambda target: target.session.client(service, region_name=region or target.region)
+
+def scoped_client(service):
+    """
+    Client proxy for a service that follows the current target
+    """
+    return Scoped(('client', service), _client_factory(service))
+
+def default_client(service, region=None):
+    """
+    Client proxy for the Lambda's own account (and region unless given), whatever target is active
+    """
+    key = ('client', service, region) if region else ('client', service)
+    return Scoped(key, _client_factory(service, region), target=default_target)
+
+def prepaid_init():
+    """
+    Whether this init phase runs ahead of any request (SnapStart snapshot or provisioned concurrency)
+    """
+    return os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') in PRELOAD_INIT_TYPES
+
+def preload_models(services):
+    """
+    Parse the models of the given services during init when the init phase is
+    prepaid (SnapStart snapshot or provisioned concurrency), so the first request
+    doesn't pay for it. On-demand cold starts stay lazy and only load what they use.
+
+    No credentials are resolved and no connections opened, so the result is safe to snapshot.
+    """
+    if not prepaid_init():
+        return
+    loader = botocore_session.get_component('data_loader')
+    for service in services:
+        for type_name in CLIENT_MODEL_TYPES:
+            try:
+                loader.load_service_model(service, type_name)
+            except DataNotFoundError:
+                pass
+
+# Clients (and their credentials) must not outlive a SnapStart snapshot restore
+if register_after_restore:
+    register_after_restore(default_target.reset)
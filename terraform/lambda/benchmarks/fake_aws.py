@@ -0,0 +1,589 @@
+"""
+Synthetic AWS Fleet
+A deterministic estate of instances, volumes, snapshots, databases and ECS services,
+served to botocore clients from a before-call hook, so handlers run offline against it.
+
+Responses are handed to the client already parsed, like botocore's Stubber does, so no
+request is serialized, signed or sent. Every other client event still fires, so API call
+instrumentation counts each call.
+"""
+
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from fnmatch import fnmatch
+
+from botocore.awsrequest import AWSResponse
+
+ACCOUNT_ID = '123456789012'
+REGION = 'us-east-1'
+
+# Resources in the default estate, at scale 1
+DEFAULT_SIZES = {
+    'instances': 10000,
+    'snapshots': 50000,
+    'databases': 1000,
+    'ecs_services': 300
+}
+
+INSTANCE_TYPES = [
+    't3.micro', 't3.small', 't3.medium', 't3.large', 't3.xlarge', 't3.2xlarge',
+    't4g.small', 't4g.medium', 't4g.large', 'm5.large', 'm5.xlarge', 'm5.2xlarge',
+    'c5.large', 'c5.xlarge', 'r5.large', 'r5.2xlarge'
+]
+DB_CLASSES = ['db.t3.micro', 'db.t3.small', 'db.t3.medium', 'db.t3.large', 'db.t4g.medium', 'db.t4g.large']
+ENVIRONMENTS = ['production', 'staging', 'development']
+SERVICES = [
+    'Amazon Elastic Compute Cloud - Compute', 'Amazon Relational Database Service', 'Amazon Simple Storage Service',
+    'Amazon Elastic Container Service', 'Amazon CloudWatch', 'AWS Lambda', 'Amazon Virtual Private Cloud',
+    'Amazon ElastiCache', 'Amazon Elastic Kubernetes Service', 'AWS Key Management Service'
+]
+
+# Hourly datapoints per metric series over the analysis lookback (7 days)
+SERIES_LENGTH = 7 * 24
+
+# Distinct utilization patterns; resources share them so responses cost the fake nothing to build
+SERIES_PATTERNS = 64
+
+class SyntheticFleet:
+    """
+    Resources of one account/region, generated from a seed so every run sees the same estate
+    """
+
+    def __init__(self, scale=1.0, seed=0, now=None):
+        self.now = now or datetime.now(timezone.utc)
+        rng = random.Random(seed)
+        count = {name: max(1, int(size * scale)) for name, size in DEFAULT_SIZES.items()}
+
+        self.vpcs = [f"vpc-{i:017x}" for i in range(max(2, count['instances'] // 500))]
+        self.instances = []
+        self.volumes = []
+        for i in range(count['instances']):
+            instance_id = f"i-{i:017x}"
+            volume_id = f"vol-{i:017x}"
+            tags = [] if rng.random() < 0.2 else [
+                {'Key': 'Environment', 'Value': rng.choice(ENVIRONMENTS)},
+                {'Key': 'Project', 'Value': 'diagnyx'}
+            ]
+            instance = {
+                'InstanceId': instance_id,
+                'InstanceType': rng.choice(INSTANCE_TYPES),
+                'LaunchTime': self.now - timedelta(days=rng.randint(1, 720)),
+                'State': {'Name': 'running' if rng.random() < 0.9 else 'stopped'},
+                'VpcId': rng.choice(self.vpcs),
+                'Tags': tags,
+                'BlockDeviceMappings': [{'DeviceName': '/dev/xvda', 'Ebs': {'VolumeId': volume_id}}]
+            }
+            if rng.random() < 0.1:
+                instance['InstanceLifecycle'] = 'spot'
+            self.instances.append(instance)
+            self.volumes.append({
+                'VolumeId': volume_id,
+                'Size': rng.choice([8, 20, 50, 100, 500]),
+                'VolumeType': 'gp2' if rng.random() < 0.5 else 'gp3',
+                'State': 'in-use',
+                'Attachments': [{'InstanceId': instance_id, 'State': 'attached'}]
+            })
+        for i in range(count['instances'] // 10):
+            self.volumes.append({
+                'VolumeId': f"vol-{count['instances'] + i:017x}",
+                'Size': rng.choice([8, 20, 50, 100, 500]),
+                'VolumeType': rng.choice(['gp2', 'gp3', 'io1']),
+                'State': 'available',
+                'Attachments': []
+            })
+
+        self.snapshots = [
+            {
+                'SnapshotId': f"snap-{i:017x}",
+                'VolumeId': rng.choice(self.volumes)['VolumeId'],
+                'VolumeSize': rng.choice([8, 20, 50, 100, 500]),
+                'StartTime': self.now - timedelta(days=rng.randint(0, 365)),
+                'State': 'completed',
+                'OwnerId': ACCOUNT_ID
+            }
+            for i in range(count['snapshots'])
+        ]
+
+        self.databases = []
+        self.resource_tags = {}
+        for i in range(count['databases']):
+            environment = rng.choice(ENVIRONMENTS)
+            identifier = f"diagnyx-{environment}-db-{i}"
+            arn = f"arn:aws:rds:{REGION}:{ACCOUNT_ID}:db:{identifier}"
+            self.databases.append({
+                'DBInstanceIdentifier': identifier,
+                'DBInstanceArn': arn,
+                'DBInstanceClass': rng.choice(DB_CLASSES),
+                'Engine': 'postgres',
+                'MultiAZ': rng.random() < 0.3,
+                'DBInstanceStatus': 'available' if rng.random() < 0.8 else 'stopped'
+            })
+            self.resource_tags[arn] = [{'Key': 'Environment', 'Value': environment}]
+        for vpc_id in self.vpcs:
+            arn = f"arn:aws:ec2:{REGION}:{ACCOUNT_ID}:vpc/{vpc_id}"
+            self.resource_tags[arn] = [{'Key': 'Environment', 'Value': rng.choice(ENVIRONMENTS)}]
+
+        # Three private subnets per VPC, all routed to the gateway in the first AZ
+        self.subnets = [
+            {'SubnetId': f"subnet-{v:012x}{z:05x}", 'VpcId': vpc_id, 'AvailabilityZone': f"{REGION}{zone}"}
+            for v, vpc_id in enumerate(self.vpcs) for z, zone in enumerate('abc')
+        ]
+        self.nat_gateways = [
+            {'NatGatewayId': f"nat-{i:017x}", 'VpcId': self.vpcs[i % len(self.vpcs)],
+             'SubnetId': self.subnets[(i % len(self.vpcs)) * 3 + i // len(self.vpcs)]['SubnetId'], 'State': 'available'}
+            for i in range(len(self.vpcs) * 2)
+        ]
+        self.route_tables = [
+            {'RouteTableId': f"rtb-{i:017x}", 'VpcId': subnet['VpcId'],
+             'Routes': [{'DestinationCidrBlock': '0.0.0.0/0',
+                         'NatGatewayId': self.nat_gateways[i // 3]['NatGatewayId']}],
+             'Associations': [{'SubnetId': subnet['SubnetId']}]}
+            for i, subnet in enumerate(self.subnets)
+        ]
+        # Every other VPC already has an S3 gateway endpoint
+        self.vpc_endpoints = [
+            {'VpcEndpointId': f"vpce-{i:017x}", 'VpcId': vpc_id, 'VpcEndpointType': 'Gateway',
+             'ServiceName': f"com.amazonaws.{REGION}.s3"}
+            for i, vpc_id in enumerate(self.vpcs) if i % 2
+        ]
+        self.addresses = [
+            {'AllocationId': f"eipalloc-{i:017x}", 'PublicIp': f"203.0.113.{i % 256}",
+             **({'InstanceId': self.instances[i]['InstanceId']} if i % 4 else {})}
+            for i in range(min(200, count['instances']))
+        ]
+
+        cluster = 'diagnyx-development'
+        names = ['api-gateway', 'user-service', 'observability-service', 'diagnyx-ui'] + [
+            f"service-{i}" for i in range(count['ecs_services'] - 4)
+        ]
+        self.ecs_services = [
+            f"arn:aws:ecs:{REGION}:{ACCOUNT_ID}:service/{cluster}/{name}" for name in names[:count['ecs_services']]
+        ]
+        self.ecs_tasks = [
+            {
+                'taskArn': f"arn:aws:ecs:{REGION}:{ACCOUNT_ID}:task/{cluster}/{i:032x}",
+                **({'group': f"service:{names[i % len(names)]}"} if i % 5 else {'group': 'family:batch'})
+            }
+            for i in range(count['ecs_services'] * 2)
+        ]
+        self.buckets = [
+            f"diagnyx-{kind}-{i}" for i, kind in enumerate(['logs', 'backup', 'static-assets', 'metrics', 'tmp'] * 20)
+        ]
+        # Written by the handlers under test and read back, like the real bucket configuration
+        self.bucket_tags = {}
+        self.bucket_lifecycles = {}
+        self.nodegroups = ['system', 'monitoring'] + [f"workers-{i}" for i in range(8)]
+        self.auto_scaling_groups = [
+            {'AutoScalingGroupName': f"diagnyx-asg-{i}", 'MinSize': 1, 'DesiredCapacity': 2}
+            for i in range(20)
+        ]
+        self.cache_clusters = [
+            {'CacheClusterId': f"diagnyx-{environment}-cache-{i}"}
+            for i, environment in enumerate(ENVIRONMENTS * 3)
+        ]
+
+        # Daily spend per service over the trend window, with a spike on the last day
+        self.daily_costs = {
+            service: [rng.uniform(20, 200) for _ in range(120)] for service in SERVICES
+        }
+        self.daily_costs[SERVICES[0]][-1] *= 4
+
+        self.series = {
+            metric: [
+                [round(min(100.0, max(0.0, rng.gauss(mean, spread))), 2) for _ in range(SERIES_LENGTH)]
+                for mean in (rng.uniform(low, high) for _ in range(SERIES_PATTERNS))
+            ]
+            for metric, low, high, spread in (
+                ('CPUUtilization', 2, 70, 8),
+                ('mem_used_percent', 10, 80, 5),
+                ('DatabaseConnections', 0, 40, 3)
+            )
+        }
+        self.series['NetworkIn'] = [[value * 1e6 for value in row] for row in self.series['CPUUtilization']]
+        self.series['NetworkOut'] = [[value * 5e5 for value in row] for row in self.series['mem_used_percent']]
+        for metric, factor in (('BytesInFromSource', 2e7), ('BytesOutToDestination', 2e7),
+                               ('BytesInFromDestination', 1e8), ('BytesOutToSource', 1e8)):
+            self.series[metric] = [[value * factor for value in row] for row in self.series['CPUUtilization']]
+        # EBS hourly sums; the last pattern is an idle volume
+        cpu, memory = self.series['CPUUtilization'], self.series['mem_used_percent']
+        idle = [0.0] * SERIES_LENGTH
+        self.series['VolumeReadOps'] = [[value * 3600 * 20 for value in row] for row in cpu] + [idle]
+        self.series['VolumeWriteOps'] = [[value * 3600 * 10 for value in row] for row in memory] + [idle]
+        self.series['VolumeReadBytes'] = [[value * 3600 * 1e6 for value in row] for row in cpu] + [idle]
+        self.series['VolumeWriteBytes'] = [[value * 3600 * 5e5 for value in row] for row in memory] + [idle]
+        self.series['VolumeIdleTime'] = [[3600 * (1 - value / 100) for value in row] for row in cpu] + [[3600.0] * SERIES_LENGTH]
+
+        self.instances_by_id = {instance['InstanceId']: instance for instance in self.instances}
+        self.databases_by_id = {db['DBInstanceIdentifier']: db for db in self.databases}
+
+    def sizes(self):
+        return {
+            'instances': len(self.instances),
+            'volumes': len(self.volumes),
+            'snapshots': len(self.snapshots),
+            'databases': len(self.databases),
+            'ecs_services': len(self.ecs_services)
+        }
+
+    def add_instance(self, instance_id, instance_type='m5.large', launch_time=None, volume_count=1):
+        """
+        Add an untagged running instance with `volume_count` attached volumes
+        """
+        mappings = []
+        for index in range(volume_count):
+            volume_id = f"vol-{instance_id[2:]}{index:x}"
+            mappings.append({'DeviceName': f"/dev/xvd{chr(ord('a') + index % 26)}", 'Ebs': {'VolumeId': volume_id}})
+            self.volumes.append({
+                'VolumeId': volume_id, 'Size': 20, 'VolumeType': 'gp3', 'State': 'in-use',
+                'Attachments': [{'InstanceId': instance_id, 'State': 'attached'}]
+            })
+        instance = {
+            'InstanceId': instance_id,
+            'InstanceType': instance_type,
+            'LaunchTime': launch_time or self.now,
+            'State': {'Name': 'running'},
+            'VpcId': self.vpcs[0],
+            'Tags': [],
+            'BlockDeviceMappings': mappings
+        }
+        self.instances.append(instance)
+        self.instances_by_id[instance_id] = instance
+        return instance
+
+    def add_database(self, identifier):
+        """
+        Add an available, untagged database
+        """
+        database = {
+            'DBInstanceIdentifier': identifier,
+            'DBInstanceArn': f"arn:aws:rds:{REGION}:{ACCOUNT_ID}:db:{identifier}",
+            'DBInstanceClass': 'db.t3.medium',
+            'Engine': 'postgres',
+            'MultiAZ': False,
+            'DBInstanceStatus': 'available'
+        }
+        self.databases.append(database)
+        self.databases_by_id[identifier] = database
+        return database
+
+    def add_bucket(self, name):
+        """
+        Add a bucket without tags
+        """
+        self.buckets.append(name)
+        self.bucket_tags[name] = []
+        return name
+
+    def launch_events(self, instances, volumes_per_instance=1, databases=0, buckets=0, group_size=10, seed=0):
+        """
+        Add new resources and return their creation events, interleaved as they would arrive.
+        Instances launch in scale-out groups of `group_size` sharing an instance type and launch time.
+        """
+        rng = random.Random(seed)
+        events = []
+        for i in range(instances):
+            if i % group_size == 0:
+                instance_type = rng.choice(INSTANCE_TYPES)
+                launch_time = self.now - timedelta(minutes=(instances - i) // group_size)
+            # Leading 'f' keeps launched IDs apart from the base fleet's zero-padded ones
+            instance = self.add_instance(f"i-f{seed:05x}{i:011x}", instance_type, launch_time, volumes_per_instance)
+            events.append({'source': 'aws.ec2', 'detail-type': 'EC2 Instance State-change Notification',
+                           'detail': {'instance-id': instance['InstanceId'], 'state': 'running'}})
+        for i in range(databases):
+            database = self.add_database(f"diagnyx-replay-{seed}-db-{i}")
+            events.append({'source': 'aws.rds', 'detail-type': 'RDS DB Instance Event',
+                           'detail': {'SourceIdentifier': database['DBInstanceIdentifier']}})
+        for i in range(buckets):
+            bucket = self.add_bucket(f"diagnyx-replay-{seed}-{rng.choice(['logs', 'backup', 'assets'])}-{i}")
+            events.append({'source': 'aws.s3', 'detail-type': 'AWS API Call via CloudTrail',
+                           'detail': {'bucket': {'name': bucket}}})
+        # Launch events of a scale-out stay in order; other creates land in between
+        merged = events[:instances]
+        for event in events[instances:]:
+            merged.insert(rng.randint(0, len(merged)), event)
+        for i, event in enumerate(merged):
+            event['id'] = f"launch-{seed}-{i}"
+        return merged
+
+    def tagger_events(self, count, seed=0):
+        """
+        EventBridge events for newly running instances, available databases and created buckets
+        """
+        rng = random.Random(seed)
+        events = []
+        for i in range(count):
+            kind = i % 10
+            if kind < 7:
+                events.append({'source': 'aws.ec2', 'detail-type': 'EC2 Instance State-change Notification',
+                               'detail': {'instance-id': rng.choice(self.instances)['InstanceId'], 'state': 'running'}})
+            elif kind < 9:
+                events.append({'source': 'aws.rds', 'detail-type': 'RDS DB Instance Event',
+                               'detail': {'SourceIdentifier': rng.choice(self.databases)['DBInstanceIdentifier']}})
+            else:
+                events.append({'source': 'aws.s3', 'detail-type': 'AWS API Call via CloudTrail',
+                               'detail': {'bucket': {'name': rng.choice(self.buckets)}}})
+            events[-1]['id'] = f"event-{seed}-{i}"
+        return events
+
+    def series_for(self, metric_name, resource_id):
+        patterns = self.series.get(metric_name)
+        if not patterns:
+            return []
+        return patterns[zlib.crc32(resource_id.encode()) % len(patterns)]
+
+class FakeAws:
+    """
+    Answers every API call of the clients it is registered on from a SyntheticFleet.
+
+    Operations without a handler get an empty response. `calls` counts calls per
+    'service.Operation'; `latency` (seconds) is slept before each response.
+    """
+
+    def __init__(self, fleet, latency=0.0):
+        self.fleet = fleet
+        self.latency = latency
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def register(self, session):
+        """
+        Hook into a botocore session; register after any instrumentation that should see the calls
+        """
+        session.register('before-parameter-build', self.capture_params, unique_id=f'fake-aws-params-{id(self)}')
+        session.register('before-call', self.respond, unique_id=f'fake-aws-call-{id(self)}')
+
+    def capture_params(self, params, context, **kwargs):
+        context['fake_aws_params'] = dict(params)
+
+    def respond(self, event_name, context, **kwargs):
+        operation = event_name.split('.', 1)[1]
+        with self.lock:
+            self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        service, name = operation.split('.', 1)
+        handler = getattr(self, f"{service.replace('-', '_')}_{name}", None)
+        parsed = handler(context.get('fake_aws_params', {})) if handler else {}
+        parsed['ResponseMetadata'] = {'HTTPStatusCode': 200, 'RetryAttempts': 0}
+        return AWSResponse(f"https://{service}.{REGION}.amazonaws.com/", 200, {}, None), parsed
+
+    # EC2
+
+    def ec2_DescribeInstances(self, params):
+        if params.get('InstanceIds'):
+            instances = [
+                self.fleet.instances_by_id[i] for i in params['InstanceIds'] if i in self.fleet.instances_by_id
+            ]
+        else:
+            instances = _filtered(self.fleet.instances, params.get('Filters'), {
+                'instance-state-name': lambda instance: instance['State']['Name'],
+                'instance-id': lambda instance: instance['InstanceId']
+            })
+        items, token = _page(instances, params, 'NextToken', 'MaxResults', 1000)
+        return {
+            'Reservations': [{'ReservationId': f"r-{i['InstanceId'][2:]}", 'Instances': [i]} for i in items],
+            **token
+        }
+
+    def ec2_DescribeVolumes(self, params):
+        volumes = _filtered(self.fleet.volumes, params.get('Filters'), {
+            'status': lambda volume: volume['State'],
+            'volume-type': lambda volume: volume['VolumeType'],
+            'volume-id': lambda volume: volume['VolumeId']
+        })
+        items, token = _page(volumes, params, 'NextToken', 'MaxResults', 500)
+        return {'Volumes': items, **token}
+
+    def ec2_DescribeSnapshots(self, params):
+        snapshots = _filtered(self.fleet.snapshots, params.get('Filters'), {
+            'snapshot-id': lambda snapshot: snapshot['SnapshotId'],
+            'start-time': lambda snapshot: snapshot['StartTime'].isoformat()
+        })
+        items, token = _page(snapshots, params, 'NextToken', 'MaxResults', 1000)
+        return {'Snapshots': items, **token}
+
+    def ec2_DescribeNatGateways(self, params):
+        gateways = _filtered(self.fleet.nat_gateways, params.get('Filter'), {'state': lambda nat: nat['State']})
+        items, token = _page(gateways, params, 'NextToken', 'MaxResults', 1000)
+        return {'NatGateways': items, **token}
+
+    def ec2_DescribeRouteTables(self, params):
+        wanted = next((set(f['Values']) for f in params.get('Filters', []) if f['Name'] == 'route.nat-gateway-id'), None)
+        tables = [
+            table for table in self.fleet.route_tables
+            if wanted is None or any(route.get('NatGatewayId') in wanted for route in table['Routes'])
+        ]
+        items, token = _page(tables, params, 'NextToken', 'MaxResults', 100)
+        return {'RouteTables': items, **token}
+
+    def ec2_DescribeSubnets(self, params):
+        subnets = _filtered(self.fleet.subnets, params.get('Filters'), {'subnet-id': lambda subnet: subnet['SubnetId']})
+        items, token = _page(subnets, params, 'NextToken', 'MaxResults', 1000)
+        return {'Subnets': items, **token}
+
+    def ec2_DescribeVpcEndpoints(self, params):
+        endpoints = _filtered(self.fleet.vpc_endpoints, params.get('Filters'), {
+            'vpc-id': lambda endpoint: endpoint['VpcId'],
+            'vpc-endpoint-type': lambda endpoint: endpoint['VpcEndpointType']
+        })
+        items, token = _page(endpoints, params, 'NextToken', 'MaxResults', 1000)
+        return {'VpcEndpoints': items, **token}
+
+    def ec2_DescribeAddresses(self, params):
+        return {'Addresses': _filtered(self.fleet.addresses, params.get('Filters'), {
+            'allocation-id': lambda eip: eip['AllocationId']
+        })}
+
+    # RDS
+
+    def rds_DescribeDBInstances(self, params):
+        if params.get('DBInstanceIdentifier'):
+            db = self.fleet.databases_by_id.get(params['DBInstanceIdentifier'])
+            return {'DBInstances': [db] if db else []}
+        databases = _filtered(self.fleet.databases, params.get('Filters'), {
+            'db-instance-id': lambda db: db['DBInstanceIdentifier']
+        })
+        items, token = _page(databases, params, 'Marker', 'MaxRecords', 100)
+        return {'DBInstances': items, **token}
+
+    def rds_ListTagsForResource(self, params):
+        return {'TagList': self.fleet.resource_tags.get(params['ResourceName'], [])}
+
+    # CloudWatch
+
+    def cloudwatch_GetMetricData(self, params):
+        results = []
+        for query in params['MetricDataQueries']:
+            metric = query['MetricStat']['Metric']
+            # Agent metrics carry InstanceId among several appended dimensions
+            dimensions = {dimension['Name']: dimension['Value'] for dimension in metric['Dimensions']}
+            resource_id = dimensions.get('InstanceId', metric['Dimensions'][0]['Value'])
+            results.append({
+                'Id': query['Id'],
+                'Values': self.fleet.series_for(metric['MetricName'], resource_id),
+                'StatusCode': 'Complete'
+            })
+        return {'MetricDataResults': results}
+
+    # Resource Groups Tagging API
+
+    def resource_groups_tagging_api_GetResources(self, params):
+        arn_parts = {'rds:db': ':rds:', 'ec2:vpc': ':vpc/', 's3': ':s3:'}
+        types = [arn_parts.get(t, t) for t in params.get('ResourceTypeFilters', [])]
+        wanted = {f['Key']: set(f.get('Values') or []) for f in params.get('TagFilters', [])}
+        mappings = []
+        for arn, tags in self.fleet.resource_tags.items():
+            if types and not any(t in arn for t in types):
+                continue
+            values = {tag['Key']: tag['Value'] for tag in tags}
+            if all(key in values and (not allowed or values[key] in allowed) for key, allowed in wanted.items()):
+                mappings.append({'ResourceARN': arn, 'Tags': tags})
+        items, token = _page(mappings, params, 'PaginationToken', 'ResourcesPerPage', 50)
+        return {'ResourceTagMappingList': items, 'PaginationToken': token.get('PaginationToken', '')}
+
+    # Cost Explorer
+
+    def cost_explorer_GetCostAndUsage(self, params):
+        start = datetime.fromisoformat(params['TimePeriod']['Start']).date()
+        end = datetime.fromisoformat(params['TimePeriod']['End']).date()
+        today = self.fleet.now.date()
+        if params.get('Granularity') == 'MONTHLY':
+            total = sum(costs[-1] for costs in self.fleet.daily_costs.values()) * today.day
+            return {'ResultsByTime': [{
+                'TimePeriod': params['TimePeriod'],
+                'Total': {'UnblendedCost': {'Amount': f"{total:.2f}", 'Unit': 'USD'}}
+            }]}
+        days = []
+        day = start
+        while day < end:
+            index = (day - today).days
+            days.append({
+                'TimePeriod': {'Start': day.isoformat(), 'End': (day + timedelta(days=1)).isoformat()},
+                'Groups': [
+                    {'Keys': [service], 'Metrics': {'UnblendedCost': {'Amount': f"{costs[index]:.4f}", 'Unit': 'USD'}}}
+                    for service, costs in self.fleet.daily_costs.items()
+                    if -len(costs) <= index < 0
+                ]
+            })
+            day += timedelta(days=1)
+        return {'ResultsByTime': days}
+
+    def cost_explorer_GetReservationUtilization(self, params):
+        return {'UtilizationsByTime': [
+            {'Total': {'UtilizationPercentage': str(55 + i * 5)}} for i in range(7)
+        ]}
+
+    # ECS, EKS, Auto Scaling, ElastiCache
+
+    def ecs_ListServices(self, params):
+        items, token = _page(self.fleet.ecs_services, params, 'nextToken', 'maxResults', 10)
+        return {'serviceArns': items, **token}
+
+    def ecs_ListTasks(self, params):
+        items, token = _page([task['taskArn'] for task in self.fleet.ecs_tasks], params, 'nextToken', 'maxResults', 100)
+        return {'taskArns': items, **token}
+
+    def ecs_DescribeTasks(self, params):
+        wanted = set(params.get('tasks', []))
+        return {'tasks': [task for task in self.fleet.ecs_tasks if task['taskArn'] in wanted]}
+
+    def eks_ListNodegroups(self, params):
+        return {'nodegroups': self.fleet.nodegroups}
+
+    def auto_scaling_DescribeAutoScalingGroups(self, params):
+        return {'AutoScalingGroups': self.fleet.auto_scaling_groups}
+
+    def elasticache_DescribeCacheClusters(self, params):
+        return {'CacheClusters': self.fleet.cache_clusters}
+
+    # Pricing, with no products so the built-in price list is used
+
+    def pricing_GetProducts(self, params):
+        return {'PriceList': []}
+
+    # S3
+
+    def s3_GetBucketTagging(self, params):
+        return {'TagSet': self.fleet.bucket_tags.get(params['Bucket'], [{'Key': 'Owner', 'Value': 'platform'}])}
+
+    def s3_PutBucketTagging(self, params):
+        self.fleet.bucket_tags[params['Bucket']] = params['Tagging']['TagSet']
+        return {}
+
+    def s3_GetBucketLifecycleConfiguration(self, params):
+        return {'Rules': self.fleet.bucket_lifecycles.get(params['Bucket'], [])}
+
+    def s3_PutBucketLifecycleConfiguration(self, params):
+        self.fleet.bucket_lifecycles[params['Bucket']] = params['LifecycleConfiguration']['Rules']
+        return {}
+
+    def s3_ListBuckets(self, params):
+        return {'Buckets': [{'Name': name, 'BucketRegion': REGION} for name in self.fleet.buckets]}
+
+def _filtered(items, filters, getters):
+    """
+    Apply describe-style [{'Name', 'Values'}] filters the fake understands; others match everything
+    """
+    for f in filters or []:
+        getter = getters.get(f['Name'])
+        if getter:
+            values = set(f['Values'])
+            if any('*' in value for value in values):
+                items = [item for item in items if any(fnmatch(getter(item), value) for value in values)]
+            else:
+                items = [item for item in items if getter(item) in values]
+    return items
+
+def _page(items, params, token_key, limit_key, default_limit):
+    """
+    One page of items and the response's next-token entry, with offsets as tokens
+    """
+    offset = int(params.get(token_key) or 0)
+    limit = params.get(limit_key) or default_limit
+    end = offset + limit
+    return items[offset:end], ({token_key: str(end)} if end < len(items) else {})
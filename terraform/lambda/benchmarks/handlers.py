@@ -0,0 +1,217 @@
+"""
+Handler Benchmark
+Runs each Lambda handler against a synthetic AWS estate, offline, and reports wall time,
+API calls and peak memory, so performance regressions show up before deploy.
+
+The estate (see fake_aws.py) is generated from a fixed seed: 10k instances, 50k snapshots,
+1k RDS databases and 300 ECS services at --scale 1. Every run uses a fresh interpreter and
+empty caches, and worker counts are pinned, so results are comparable between runs and
+machines of the same kind. API calls are counted per operation and are exact; wall time
+and memory are medians over --runs.
+
+Usage:
+    python3 terraform/lambda/benchmarks/handlers.py [--scale 1] [--runs 3] [--save baseline.json]
+    python3 terraform/lambda/benchmarks/handlers.py --compare baseline.json [--tolerance 0.2]
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from startup import HANDLERS, LAMBDA_DIR, FakeContext
+
+# Events each handler is invoked with; auto_tagger gets a stream of --tagger-events events instead
+EVENTS = {
+    'cost_optimizer': {'source': 'aws.events', 'detail-type': 'Scheduled Event'},
+    'scheduled_scaling': {'action': 'scale_down'},
+    'cost_controller': {'source': 'aws.events', 'detail-type': 'Scheduled Event'}
+}
+
+# Environment shared by every run, so results only change when the code does
+PINNED_ENV = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'benchmark',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+    'AWS_LAMBDA_INITIALIZATION_TYPE': 'on-demand',
+    'ENVIRONMENT': 'development',
+    'METRICS_OUTPUT': 'none',
+    'ANALYZER_WORKERS': '8',
+    'RESOURCE_WORKERS': '4',
+    'COST_TREND_DAYS': '90',
+    'CHECKPOINT_ENABLED': 'false',
+    'SNS_TOPIC_ARN': 'arn:aws:sns:us-east-1:123456789012:benchmark',
+    # Spend is well over budget, so every cost controller action runs
+    'MAX_BUDGET': '1000',
+    'ACTIONS': json.dumps({
+        '50': ['alert'],
+        '80': ['scale_down', 'stop_batch_jobs'],
+        '100': ['emergency_scale_down', 'critical_only_mode', 'page_oncall', 'review_required']
+    })
+}
+
+def rss_mb():
+    """
+    Current resident set size in MB (Linux)
+    """
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+def run_child(name, scale, seed, latency, tagger_events):
+    """
+    Build the estate, import one handler, invoke it and print the measurements as JSON
+    """
+    import importlib.util
+
+    from fake_aws import SyntheticFleet, FakeAws
+
+    path = HANDLERS[name][0]
+    sys.path[:0] = [LAMBDA_DIR, os.path.dirname(path)]
+
+    fleet = SyntheticFleet(scale=scale, seed=seed)
+    events = fleet.tagger_events(tagger_events, seed) if name == 'auto_tagger' else [EVENTS[name]]
+
+    spec = importlib.util.spec_from_file_location('index', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    # Clients are created lazily, so hooking the shared session now still covers them all
+    import aws_clients
+    fake = FakeAws(fleet, latency)
+    fake.register(aws_clients.botocore_session)
+
+    statuses = []
+    baseline_mb = rss_mb()
+    start = time.perf_counter()
+    for event in events:
+        response = module.handler(dict(event), FakeContext())
+        statuses.append((response or {}).get('statusCode'))
+    wall_ms = (time.perf_counter() - start) * 1000
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print(json.dumps({
+        'wall_ms': wall_ms,
+        'peak_mb': peak_mb,
+        'handler_mb': max(0.0, peak_mb - baseline_mb),
+        'api_calls': sum(fake.calls.values()),
+        'calls_by_operation': dict(sorted(fake.calls.items())),
+        'statuses': {str(status): statuses.count(status) for status in sorted(set(statuses), key=str)},
+        'invocations': len(events),
+        'fleet': fleet.sizes()
+    }))
+
+def measure(name, args):
+    """
+    Run a handler in `args.runs` fresh interpreters and return the per-run results
+    """
+    results = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env = {
+                **os.environ,
+                **HANDLERS[name][2],
+                **PINNED_ENV,
+                'PRICE_CATALOG_URI': cache_dir,
+                'CE_CACHE_URI': cache_dir,
+                'CHECKPOINT_URI': cache_dir,
+                'SNAPSHOT_INDEX_URI': cache_dir,
+                'RESOURCE_STATE_URI': cache_dir,
+                'PYTHONHASHSEED': '0'
+            }
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', name,
+                 '--scale', str(args.scale), '--seed', str(args.seed),
+                 '--latency-ms', str(args.latency_ms), '--tagger-events', str(args.tagger_events)],
+                env=env, capture_output=True, text=True, check=True
+            ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+def summarize(results):
+    last = results[-1]
+    return {
+        'wall_ms': statistics.median(result['wall_ms'] for result in results),
+        'peak_mb': statistics.median(result['peak_mb'] for result in results),
+        'handler_mb': statistics.median(result['handler_mb'] for result in results),
+        'api_calls': last['api_calls'],
+        'calls_by_operation': last['calls_by_operation'],
+        'statuses': last['statuses'],
+        'invocations': last['invocations'],
+        'fleet': last['fleet']
+    }
+
+def compare(report, baseline, tolerance):
+    """
+    Lines describing regressions against a saved report: any extra API call, or wall
+    time or handler memory more than `tolerance` above the baseline
+    """
+    regressions = []
+    for name, row in report.items():
+        before = baseline.get('handlers', {}).get(name)
+        if not before:
+            continue
+        for operation, calls in row['calls_by_operation'].items():
+            previous = before['calls_by_operation'].get(operation, 0)
+            if calls > previous:
+                regressions.append(f"{name}: {operation} calls {previous} -> {calls}")
+        for key, unit in (('wall_ms', 'ms'), ('handler_mb', 'MB')):
+            if row[key] > before[key] * (1 + tolerance) and row[key] - before[key] > 1:
+                regressions.append(f"{name}: {key} {before[key]:.1f}{unit} -> {row[key]:.1f}{unit}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0, help='estate size relative to the default fleet')
+    parser.add_argument('--seed', type=int, default=0, help='estate generator seed')
+    parser.add_argument('--runs', type=int, default=3, help='fresh interpreters per handler')
+    parser.add_argument('--latency-ms', type=float, default=0, help='simulated latency per API call')
+    parser.add_argument('--tagger-events', type=int, default=1000, help='events replayed through auto_tagger')
+    parser.add_argument('--handler', action='append', choices=sorted(HANDLERS), help='handlers to measure')
+    parser.add_argument('--save', help='write the report as JSON to this file')
+    parser.add_argument('--compare', help='report regressions against a report saved with --save')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed wall time and memory growth')
+    parser.add_argument('--json', action='store_true', help='print raw results as JSON')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.scale, args.seed, args.latency_ms / 1000, args.tagger_events)
+        return
+
+    report = {name: summarize(measure(name, args)) for name in args.handler or HANDLERS}
+    settings = {key: getattr(args, key) for key in ('scale', 'seed', 'runs', 'latency_ms', 'tagger_events')}
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'settings': settings, 'handlers': report}, f, indent=2)
+
+    if args.json:
+        print(json.dumps({'settings': settings, 'handlers': report}, indent=2))
+    else:
+        print(f"Median of {args.runs} runs at scale {args.scale:g} (seed {args.seed}, {args.latency_ms:g} ms per call)")
+        print(f"{'handler':<20}{'wall ms':>10}{'API calls':>11}{'peak MB':>9}{'+MB':>7}  statuses")
+        for name, row in report.items():
+            print(
+                f"{name:<20}{row['wall_ms']:>10.1f}{row['api_calls']:>11}{row['peak_mb']:>9.1f}"
+                f"{row['handler_mb']:>7.1f}  {row['statuses']}"
+            )
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('settings') != settings:
+            print(f"Warning: baseline settings {baseline.get('settings')} differ from {settings}")
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Startup Benchmark
+Measures import time and first/second invocation latency of each Lambda handler, offline.
+
+Every run imports the handler in a fresh interpreter so imports are cold. AWS calls are
+answered with empty responses at the HTTP layer: the numbers cover model loading, client
+creation, request signing and response parsing, but no network time. Handlers that
+index into a response may fail on the empty data (status 500); everything up to that
+point is still timed.
+
+Usage:
+    python3 terraform/lambda/benchmarks/startup.py [--runs 5] [--init-type snap-start] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(os.path.dirname(LAMBDA_DIR))
+COST_CONTROLLER = os.path.join(
+    REPO_DIR, 'terraform', 'bootstrap', '04-cost-management', 'lambda', 'cost-controller.py'
+)
+
+# name -> (source file, test event, extra environment)
+HANDLERS = {
+    'cost_optimizer': (
+        os.path.join(LAMBDA_DIR, 'cost_optimizer.py'),
+        {'source': 'aws.events', 'detail-type': 'Scheduled Event'},
+        {}
+    ),
+    'auto_tagger': (
+        os.path.join(LAMBDA_DIR, 'auto_tagger.py'),
+        {'source': 'aws.ec2', 'detail-type': 'EC2 Instance State-change Notification',
+         'detail': {'instance-id': 'i-0123456789abcdef0', 'state': 'running'}},
+        {'DEFAULT_TAGS': json.dumps({'Environment': 'development', 'Project': 'diagnyx'})}
+    ),
+    'scheduled_scaling': (
+        os.path.join(LAMBDA_DIR, 'scheduled_scaling.py'),
+        {'action': 'scale_down'},
+        {'CLUSTER_NAME': 'diagnyx-development'}
+    ),
+    'cost_controller': (
+        COST_CONTROLLER,
+        {'source': 'aws.events', 'detail-type': 'Scheduled Event'},
+        {'MAX_BUDGET': '1000', 'ACTIONS': json.dumps({})}
+    )
+}
+
+class FakeContext:
+    """
+    Minimal Lambda context with a five minute budget
+    """
+    function_name = 'startup-benchmark'
+    invoked_function_arn = 'arn:aws:lambda:us-east-1:123456789012:function:startup-benchmark'
+    aws_request_id = 'startup-benchmark'
+
+    def __init__(self):
+        self.deadline = time.monotonic() + 300
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+class StaticBody:
+    """
+    Raw HTTP body for botocore's AWSResponse
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, **kwargs):
+        yield self.data
+
+def offline_response(request, event_name, **kwargs):
+    """
+    before-send hook answering every request with an empty, parseable response
+    """
+    from botocore.awsrequest import AWSResponse
+
+    content_type = request.headers.get('Content-Type', b'')
+    if isinstance(content_type, bytes):
+        content_type = content_type.decode()
+    body = b''
+    # Query-protocol parsers expect the operation's result wrapper
+    if content_type.startswith('application/x-www-form-urlencoded'):
+        operation = event_name.rsplit('.', 1)[-1]
+        body = f"<{operation}Response><{operation}Result/></{operation}Response>".encode()
+    return AWSResponse(request.url, 200, {}, StaticBody(body))
+
+def run_child(name):
+    """
+    Import and invoke one handler twice, printing timings as JSON
+    """
+    import importlib.util
+
+    path, event, _ = HANDLERS[name]
+    sys.path[:0] = [LAMBDA_DIR, os.path.dirname(path)]
+
+    start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location('index', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    import_ms = (time.perf_counter() - start) * 1000
+
+    # Clients are created lazily, so hooking the shared session now still covers them all
+    import aws_clients
+    aws_clients.botocore_session.register('before-send', offline_response)
+
+    timings = {'import_ms': import_ms}
+    for label in ('first_invoke_ms', 'second_invoke_ms'):
+        start = time.perf_counter()
+        response = module.handler(dict(event), FakeContext())
+        timings[label] = (time.perf_counter() - start) * 1000
+        timings['status'] = (response or {}).get('statusCode')
+
+    print(json.dumps(timings))
+
+def measure(name, runs, init_type):
+    """
+    Run a handler in `runs` fresh interpreters and return the per-run timings
+    """
+    results = []
+    for _ in range(runs):
+        # A fresh cache per run so no run is served from an earlier one's price or Cost Explorer cache
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env = {
+                **os.environ,
+                'AWS_DEFAULT_REGION': 'us-east-1',
+                'AWS_ACCESS_KEY_ID': 'benchmark',
+                'AWS_SECRET_ACCESS_KEY': 'benchmark',
+                'AWS_LAMBDA_INITIALIZATION_TYPE': init_type,
+                'ENVIRONMENT': 'development',
+                'PRICE_CATALOG_URI': cache_dir,
+                'CE_CACHE_URI': cache_dir,
+                'CHECKPOINT_URI': cache_dir,
+                **HANDLERS[name][2]
+            }
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', name],
+                env=env, capture_output=True, text=True, check=True
+            ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+def summarize(results):
+    return {
+        key: statistics.median(result[key] for result in results)
+        for key in ('import_ms', 'first_invoke_ms', 'second_invoke_ms')
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per handler')
+    parser.add_argument('--init-type', default='on-demand',
+                        choices=['on-demand', 'provisioned-concurrency', 'snap-start'],
+                        help='simulated AWS_LAMBDA_INITIALIZATION_TYPE')
+    parser.add_argument('--handler', action='append', choices=sorted(HANDLERS), help='handlers to measure')
+    parser.add_argument('--json', action='store_true', help='print raw results as JSON')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    report = {}
+    for name in args.handler or HANDLERS:
+        results = measure(name, args.runs, args.init_type)
+        report[name] = {**summarize(results), 'status': results[-1]['status']}
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Median of {args.runs} cold starts ({args.init_type}), milliseconds")
+    print(f"{'handler':<20}{'import':>10}{'1st call':>10}{'2nd call':>10}  status")
+    for name, row in report.items():
+        print(
+            f"{name:<20}{row['import_ms']:>10.1f}{row['first_invoke_ms']:>10.1f}"
+            f"{row['second_invoke_ms']:>10.1f}  {row['status']}"
+        )
+
+if __name__ == '__main__':
+    main()
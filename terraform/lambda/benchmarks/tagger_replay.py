@@ -0,0 +1,253 @@
+"""
+Auto Tagger Replay
+Drives auto_tagger.handler with a burst of resource creation events against the synthetic
+estate (see fake_aws.py) and reports throughput, AWS calls per event and tail latency.
+
+Events are either synthetic (EC2 launches with N volumes each, RDS creates, S3 bucket
+creates, in scale-out order) or recorded EventBridge events from a file, one JSON event
+per line or a JSON array; resources they reference are added to the estate so every
+event does its full work. Each --concurrency worker is a separate warm container with
+its own copy of the handler module, like concurrent Lambda environments. With
+--delivery sqs events arrive in batches of --batch-size, as through the SQS queue.
+
+Usage:
+    python3 terraform/lambda/benchmarks/tagger_replay.py [--instances 500] [--volumes-per-instance 2]
+        [--databases 20] [--buckets 20] [--events recorded.jsonl] [--delivery direct|sqs]
+        [--concurrency 4] [--latency-ms 10] [--save report.json] [--compare report.json] [--json]
+"""
+
+import argparse
+import json
+import os
+import queue
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from handlers import PINNED_ENV
+from startup import HANDLERS, LAMBDA_DIR, FakeContext
+
+def load_events(path):
+    """
+    EventBridge events from a JSON array or JSON Lines file
+    """
+    with open(path) as f:
+        text = f.read().strip()
+    if text.startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def register_resources(fleet, events, volumes_per_instance):
+    """
+    Add the instances, databases and buckets recorded events refer to but the estate lacks
+    """
+    for event in events:
+        detail = event.get('detail', {})
+        source = event.get('source')
+        if source == 'aws.ec2' and detail.get('instance-id') and detail['instance-id'] not in fleet.instances_by_id:
+            fleet.add_instance(detail['instance-id'], volume_count=volumes_per_instance)
+        elif source == 'aws.rds' and detail.get('SourceIdentifier') and detail['SourceIdentifier'] not in fleet.databases_by_id:
+            fleet.add_database(detail['SourceIdentifier'])
+        elif source == 'aws.s3' and detail.get('bucket', {}).get('name') and detail['bucket']['name'] not in fleet.buckets:
+            fleet.add_bucket(detail['bucket']['name'])
+
+def deliveries(events, delivery, batch_size):
+    """
+    Handler payloads: one per event, or SQS batches of up to batch_size events
+    """
+    if delivery == 'direct':
+        return list(events)
+    return [
+        {'Records': [
+            {'messageId': f"msg-{offset + index}", 'body': json.dumps(event)}
+            for index, event in enumerate(events[offset:offset + batch_size])
+        ]}
+        for offset in range(0, len(events), batch_size)
+    ]
+
+def load_handler(copy):
+    """
+    A separate copy of the auto_tagger module, standing in for one warm container
+    """
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location(f"index_{copy}", HANDLERS['auto_tagger'][0])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def percentile(values, share):
+    """
+    Nearest-rank percentile of a non-empty list
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(share * len(ordered))) - 1))]
+
+def replay(args):
+    """
+    Build the estate and events, replay them and return the measurements
+    """
+    from fake_aws import SyntheticFleet, FakeAws
+
+    fleet = SyntheticFleet(scale=args.scale, seed=args.seed)
+    if args.events:
+        events = load_events(args.events)
+        register_resources(fleet, events, args.volumes_per_instance)
+    else:
+        events = fleet.launch_events(
+            args.instances, args.volumes_per_instance, args.databases, args.buckets,
+            group_size=args.group_size, seed=args.seed
+        )
+
+    # At-least-once delivery: redeliver a share of the events right after the original
+    if args.duplicates:
+        step = max(1, round(1 / args.duplicates))
+        events = [copy for index, event in enumerate(events) for copy in ([event, event] if index % step == 0 else [event])]
+
+    containers = [load_handler(copy) for copy in range(args.concurrency)]
+
+    # Clients are created lazily, so hooking the shared session now still covers them all
+    import aws_clients
+    fake = FakeAws(fleet, args.latency_ms / 1000)
+    fake.register(aws_clients.botocore_session)
+
+    pending = queue.Queue()
+    for payload in deliveries(events, args.delivery, args.batch_size):
+        pending.put(payload)
+
+    latencies = []
+    statuses = Counter()
+    failed_events = []
+    lock = threading.Lock()
+
+    def worker(module):
+        while True:
+            try:
+                payload = pending.get_nowait()
+            except queue.Empty:
+                return
+            start = time.perf_counter()
+            response = module.handler(json.loads(json.dumps(payload)), FakeContext()) or {}
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[str(response.get('statusCode', 'sqs batch'))] += 1
+                failed_events.extend(response.get('batchItemFailures', []))
+
+    threads = [threading.Thread(target=worker, args=(module,)) for module in containers]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    api_calls = sum(fake.calls.values())
+    return {
+        'events': len(events),
+        'invocations': len(latencies),
+        'wall_s': wall,
+        'events_per_second': len(events) / wall if wall else None,
+        'api_calls': api_calls,
+        'calls_per_event': api_calls / len(events) if events else 0,
+        'calls_by_operation': dict(sorted(fake.calls.items())),
+        'latency_ms': {
+            'p50': statistics.median(latencies) * 1000,
+            'p95': percentile(latencies, 0.95) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'max': max(latencies) * 1000
+        } if latencies else {},
+        'statuses': dict(statuses),
+        'failed_events': len(failed_events)
+    }
+
+def compare(report, baseline, tolerance):
+    """
+    Lines describing regressions against a saved report: more calls per event, or
+    throughput or p99 latency more than `tolerance` worse than the baseline
+    """
+    before = baseline['results']
+    regressions = []
+    for operation, calls in report['calls_by_operation'].items():
+        previous = before['calls_by_operation'].get(operation, 0)
+        if calls > previous:
+            regressions.append(f"{operation} calls {previous} -> {calls}")
+    if report['events_per_second'] < before['events_per_second'] * (1 - tolerance):
+        regressions.append(f"events/s {before['events_per_second']:.1f} -> {report['events_per_second']:.1f}")
+    p99, previous_p99 = report['latency_ms'].get('p99', 0), before['latency_ms'].get('p99', 0)
+    if p99 > previous_p99 * (1 + tolerance) and p99 - previous_p99 > 1:
+        regressions.append(f"p99 latency {previous_p99:.1f}ms -> {p99:.1f}ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', help='recorded EventBridge events (JSON array or JSON Lines) instead of synthetic ones')
+    parser.add_argument('--instances', type=int, default=500, help='EC2 launch events')
+    parser.add_argument('--volumes-per-instance', type=int, default=2, help='EBS volumes attached to each launched instance')
+    parser.add_argument('--databases', type=int, default=20, help='RDS create events')
+    parser.add_argument('--buckets', type=int, default=20, help='S3 bucket create events')
+    parser.add_argument('--group-size', type=int, default=10, help='instances per scale-out sharing an instance type')
+    parser.add_argument('--duplicates', type=float, default=0.0, help='share of events delivered twice')
+    parser.add_argument('--delivery', choices=('direct', 'sqs'), default='direct', help='one event per invocation, or SQS batches')
+    parser.add_argument('--batch-size', type=int, default=500, help='events per SQS batch')
+    parser.add_argument('--concurrency', type=int, default=1, help='warm containers invoked in parallel')
+    parser.add_argument('--latency-ms', type=float, default=10, help='simulated latency per API call')
+    parser.add_argument('--scale', type=float, default=0.05, help='size of the existing estate relative to the default fleet')
+    parser.add_argument('--seed', type=int, default=0, help='estate and event generator seed')
+    parser.add_argument('--save', help='write the report as JSON to this file')
+    parser.add_argument('--compare', help='report regressions against a report saved with --save')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed throughput and p99 latency change')
+    parser.add_argument('--json', action='store_true', help='print raw results as JSON')
+    args = parser.parse_args()
+
+    # Pinned like the handler benchmark, with a private cache directory for this replay
+    cache_dir = tempfile.mkdtemp(prefix='tagger-replay-')
+    os.environ.update(PINNED_ENV)
+    os.environ.update(HANDLERS['auto_tagger'][2])
+    os.environ.update({'CHECKPOINT_URI': cache_dir, 'PYTHONHASHSEED': '0'})
+    os.environ.pop('TAG_STATE_URI', None)
+    sys.path.insert(0, LAMBDA_DIR)
+
+    results = replay(args)
+    settings = {key: value for key, value in vars(args).items() if key not in ('save', 'compare', 'json')}
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'settings': settings, 'results': results}, f, indent=2)
+
+    if args.json:
+        print(json.dumps({'settings': settings, 'results': results}, indent=2))
+    else:
+        latency = results['latency_ms']
+        print(
+            f"{results['events']} events in {results['invocations']} {args.delivery} invocations, "
+            f"{args.concurrency} containers, {args.latency_ms:g} ms per call"
+        )
+        print("Latency is per invocation: one event, or one SQS batch")
+        print(f"{'events/s':>10}{'calls/event':>13}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}  statuses")
+        print(
+            f"{results['events_per_second']:>10.1f}{results['calls_per_event']:>13.2f}{latency.get('p50', 0):>9.1f}"
+            f"{latency.get('p95', 0):>9.1f}{latency.get('p99', 0):>9.1f}{latency.get('max', 0):>9.1f}  "
+            f"{results['statuses']}"
+        )
+        for operation, calls in results['calls_by_operation'].items():
+            print(f"  {operation:<40}{calls:>8}")
+        if results['failed_events']:
+            print(f"{results['failed_events']} events reported as failed")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regressions against {args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.compare}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Throttling Benchmark
+Measures API throughput under simulated throttling, with and without the adaptive rate limiter.
+
+A stand-in EC2 endpoint accepts `--capacity` DescribeInstances calls per second (sliding
+one-second window) and answers the rest with RequestLimitExceeded, like EC2 does. Worker
+threads call it for `--seconds` through real botocore clients, so botocore's own retries,
+error parsing and the limiter's event hooks all run; only the network is simulated.
+
+Usage:
+    python3 terraform/lambda/benchmarks/throttling.py [--capacity 20] [--workers 8] [--seconds 10] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import deque
+
+import botocore.session
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import AdaptiveRateLimiter  # noqa: E402
+from startup import StaticBody  # noqa: E402
+
+SUCCESS_BODY = (
+    b'<DescribeInstancesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">'
+    b'<reservationSet/></DescribeInstancesResponse>'
+)
+THROTTLED_BODY = (
+    b'<Response><Errors><Error><Code>RequestLimitExceeded</Code>'
+    b'<Message>Request limit exceeded.</Message></Error></Errors><RequestID>benchmark</RequestID></Response>'
+)
+
+class ThrottledService:
+    """
+    before-send hook standing in for a service that accepts `capacity` requests per second
+    """
+
+    def __init__(self, capacity, latency):
+        self.capacity = capacity
+        self.latency = latency
+        self.accepted = deque()
+        self.requests = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, request, **kwargs):
+        from botocore.awsrequest import AWSResponse
+
+        time.sleep(self.latency)
+        with self.lock:
+            now = time.monotonic()
+            while self.accepted and now - self.accepted[0] >= 1:
+                self.accepted.popleft()
+            self.requests += 1
+            if len(self.accepted) >= self.capacity:
+                self.throttled += 1
+                return AWSResponse(request.url, 503, {}, StaticBody(THROTTLED_BODY))
+            self.accepted.append(now)
+        return AWSResponse(request.url, 200, {}, StaticBody(SUCCESS_BODY))
+
+def run(limited, capacity, workers, seconds, latency, rate):
+    """
+    Call the stand-in service from `workers` threads for `seconds` and return the totals
+    """
+    session = botocore.session.get_session()
+    limiter = AdaptiveRateLimiter(default_rate=rate)
+    if limited:
+        limiter.register(session)
+    service = ThrottledService(capacity, latency)
+    session.register('before-send', service)
+
+    client = session.create_client(
+        'ec2', region_name='us-east-1', aws_access_key_id='benchmark', aws_secret_access_key='benchmark'
+    )
+    deadline = time.monotonic() + seconds
+    latencies = []
+    failed = []
+
+    def worker():
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            try:
+                client.describe_instances()
+            except ClientError:
+                failed.append(1)
+                continue
+            latencies.append(time.monotonic() - start)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    return {
+        'calls_per_second': len(latencies) / elapsed,
+        'succeeded': len(latencies),
+        'failed': len(failed),
+        'requests': service.requests,
+        'throttled': service.throttled,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else None,
+        'p95_ms': statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else None,
+        'final_rate': limiter.stats().get('ec2.DescribeInstances', {}).get('rate')
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--capacity', type=int, default=20, help='requests per second the service accepts')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent caller threads')
+    parser.add_argument('--seconds', type=float, default=10, help='duration of each run')
+    parser.add_argument('--latency-ms', type=float, default=20, help='simulated service latency')
+    parser.add_argument('--rate', type=float, default=50, help='limiter starting and maximum rate (req/s)')
+    parser.add_argument('--json', action='store_true', help='print raw results as JSON')
+    args = parser.parse_args()
+
+    report = {
+        mode: run(mode == 'limited', args.capacity, args.workers, args.seconds, args.latency_ms / 1000, args.rate)
+        for mode in ('unlimited', 'limited')
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{args.workers} workers for {args.seconds:g}s against a {args.capacity} req/s service")
+    print(f"{'mode':<12}{'ok/s':>8}{'failed':>8}{'requests':>10}{'throttled':>11}{'p50 ms':>9}{'p95 ms':>9}")
+    for mode, row in report.items():
+        print(
+            f"{mode:<12}{row['calls_per_second']:>8.1f}{row['failed']:>8}{row['requests']:>10}"
+            f"{row['throttled']:>11}{row['p50_ms'] or 0:>9.1f}{row['p95_ms'] or 0:>9.1f}"
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Cost Explorer Cache
+Serves repeated Cost Explorer queries from an in-process LRU and a shared object store
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+logger = logging.getLogger()
+
+# Periods that ended this many days ago no longer change
+FINALIZED_AFTER_DAYS = 3
+
+# TTLs for finalized periods and for periods that still receive new cost data
+FINALIZED_TTL_SECONDS = 7 * 24 * 3600
+OPEN_PERIOD_TTL_SECONDS = 6 * 3600
+
+class LRUBackend:
+    """
+    Bounded in-process cache of recent entries
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+class StoreBackend:
+    """
+    Persistent cache entries in an object store (S3 or a local directory)
+    """
+
+    def __init__(self, store, prefix='ce-cache'):
+        self.store = store
+        self.prefix = prefix
+
+    def get(self, key):
+        data = self.store.get(f"{self.prefix}/{key}.json")
+        return json.loads(data) if data else None
+
+    def put(self, key, entry):
+        self.store.put(f"{self.prefix}/{key}.json", json.dumps(entry).encode())
+
+def normalize_request(operation, params, namespace=''):
+    """
+    Canonical form of a Cost Explorer request so equivalent queries share one cache key
+    """
+    normalized = dict(params)
+    # Metric order does not affect the response; GroupBy order does
+    if 'Metrics' in normalized:
+        normalized['Metrics'] = sorted(normalized['Metrics'])
+    return json.dumps(
+        {'namespace': namespace, 'operation': operation, 'params': normalized},
+        sort_keys=True
+    )
+
+def request_key(operation, params, namespace=''):
+    """
+    Stable cache key for a Cost Explorer request
+    """
+    return hashlib.sha256(normalize_request(operation, params, namespace).encode()).hexdigest()
+
+def ttl_for(params, open_period_ttl=OPEN_PERIOD_TTL_SECONDS):
+    """
+    How long a response may be cached, based on how fresh its time period is
+    """
+    period_end = params.get('TimePeriod', {}).get('End')
+    if period_end and (date.today() - date.fromisoformat(period_end)).days >= FINALIZED_AFTER_DAYS:
+        return FINALIZED_TTL_SECONDS
+    return open_period_ttl
+
+class CostExplorerCache:
+    """
+    Read-through cache in front of a Cost Explorer client
+    """
+
+    def __init__(self, ce_client, backends, namespace='', open_period_ttl=OPEN_PERIOD_TTL_SECONDS):
+        self.ce_client = ce_client
+        self.backends = backends
+        # Separates accounts that share a persistent backend
+        self.namespace = namespace
+        self.open_period_ttl = open_period_ttl
+
+    def call(self, operation, **params):
+        """
+        Return the cached response for operation(**params), calling Cost Explorer on a miss
+        """
+        key = request_key(operation, params, self.namespace)
+        now = time.time()
+
+        for index, backend in enumerate(self.backends):
+            try:
+                entry = backend.get(key)
+            except Exception as e:
+                logger.warning(f"Cost Explorer cache read failed: {str(e)}")
+                continue
+            if entry and entry['expires_at'] > now:
+                # Promote to the faster backends that missed
+                for faster in self.backends[:index]:
+                    faster.put(key, entry)
+                return entry['response']
+
+        response = self.fetch_all(operation, params)
+        entry = {'expires_at': now + ttl_for(params, self.open_period_ttl), 'response': response}
+
+        for backend in self.backends:
+            try:
+                backend.put(key, entry)
+            except Exception as e:
+                logger.warning(f"Cost Explorer cache write failed: {str(e)}")
+
+        return response
+
+    def fetch_all(self, operation, params):
+        """
+        Call Cost Explorer, following NextPageToken so only complete responses are cached.
+        Pages of ResultsByTime are merged per time period; other lists are concatenated.
+        """
+        response = getattr(self.ce_client, operation)(**params)
+        response.pop('ResponseMetadata', None)
+        while response.get('NextPageToken'):
+            page = getattr(self.ce_client, operation)(**params, NextPageToken=response['NextPageToken'])
+            for key, value in page.items():
+                if key == 'ResultsByTime':
+                    merge_results_by_time(response.setdefault(key, []), value)
+                elif isinstance(value, list):
+                    response.setdefault(key, []).extend(value)
+            response['NextPageToken'] = page.get('NextPageToken')
+        response.pop('NextPageToken', None)
+        return response
+
+def merge_results_by_time(results, page_results):
+    """
+    Append a page's ResultsByTime; a period split across pages gets the groups of both
+    """
+    for result in page_results:
+        if results and results[-1]['TimePeriod'] == result['TimePeriod']:
+            results[-1].setdefault('Groups', []).extend(result.get('Groups', []))
+        else:
+            results.append(result)
@@ -0,0 +1,200 @@
+"""
+Run Checkpoints
+Saves analysis progress before the Lambda deadline so a fresh invocation can continue the run
+"""
+
+import json
+import logging
+import threading
+import uuid
+from collections import deque
+
+from recommendations import RecommendationStore
+
+logger = logging.getLogger()
+
+# Time kept in reserve to save the checkpoint and start the continuation
+DEFAULT_RESERVE_MS = 30 * 1000
+
+class DeadlineReached(Exception):
+    """
+    Raised between batches when the invocation is about to run out of time
+    """
+
+class StreamCursor:
+    """
+    Position of the first unprocessed item in a paginated stream.
+
+    The inventory reports pages as it fetches them (possibly ahead of processing) and
+    the analyzer advances past items it has finished, so the saved position never
+    skips work that was fetched but not yet analyzed.
+    """
+
+    def __init__(self, token=None, offset=0, done=False):
+        # Starting token of the page holding the next unprocessed item, and how far into it we are
+        self.token = token
+        self.offset = offset
+        self.done = done
+        # (starting token, item count) of fetched pages that are not fully processed
+        self.pages = deque()
+        self.next_token = token
+        self.exhausted = False
+
+    def page_fetched(self, size, next_token):
+        """
+        Record a page of `size` items; next_token is None after the last page
+        """
+        self.pages.append((self.next_token, size))
+        self.next_token = next_token
+        self.exhausted = next_token is None
+
+    def advance(self, count):
+        """
+        Mark the next `count` fetched items as processed
+        """
+        self.offset += count
+        while self.pages and self.offset >= self.pages[0][1]:
+            self.offset -= self.pages.popleft()[1]
+            self.token = self.pages[0][0] if self.pages else self.next_token
+        if self.exhausted and not self.pages:
+            self.done = True
+
+    def to_dict(self):
+        return {'token': self.token, 'offset': self.offset, 'done': self.done}
+
+class Checkpoint:
+    """
+    Progress of one analysis run: finished analyzers, stream cursors and the
+    recommendations committed so far. Without a Lambda context it never expires.
+    """
+
+    def __init__(self, context=None, reserve_ms=DEFAULT_RESERVE_MS, run_id=None, state=None):
+        state = state or {}
+        self.context = context
+        self.reserve_ms = reserve_ms
+        self.run_id = run_id or uuid.uuid4().hex
+        self.invocation = state.get('invocation', 0) + 1
+        self.completed = set(state.get('completed', []))
+        self.recommendations = {
+            name: RecommendationStore(recs) for name, recs in state.get('recommendations', {}).items()
+        }
+        self.committed = {name: len(recs) for name, recs in self.recommendations.items()}
+        self.cursors = {
+            name: {stream: StreamCursor(**position) for stream, position in streams.items()}
+            for name, streams in state.get('cursors', {}).items()
+        }
+        self.suspended = set()
+        # Analyzers that missed the run's timeout; their threads may still be running
+        self.abandoned = set()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, state, context=None, reserve_ms=DEFAULT_RESERVE_MS):
+        return cls(context, reserve_ms, run_id=state['run_id'], state=state)
+
+    def remaining_ms(self):
+        """
+        Milliseconds left in the invocation, or None when there is no deadline
+        """
+        return self.context.get_remaining_time_in_millis() if self.context else None
+
+    def partial(self, analyzer):
+        """
+        Recommendation store an analyzer appends to, seeded with those from earlier invocations
+        """
+        with self.lock:
+            return self.recommendations.setdefault(analyzer, RecommendationStore())
+
+    def cursor(self, analyzer, stream):
+        """
+        Cursor for one of an analyzer's paginated streams
+        """
+        with self.lock:
+            return self.cursors.setdefault(analyzer, {}).setdefault(stream, StreamCursor())
+
+    def commit(self, analyzer, stream, count):
+        """
+        Record that `count` more items of a stream are fully analyzed, then stop
+        the analyzer with DeadlineReached if the invocation is nearly over
+        """
+        with self.lock:
+            if analyzer in self.abandoned:
+                raise DeadlineReached(analyzer)
+            self.cursors[analyzer][stream].advance(count)
+            self.committed[analyzer] = len(self.recommendations.get(analyzer, []))
+
+        remaining = self.remaining_ms()
+        if remaining is not None and remaining < self.reserve_ms:
+            with self.lock:
+                self.suspended.add(analyzer)
+            raise DeadlineReached(analyzer)
+
+    def abandon(self, analyzer):
+        """
+        Stop accepting progress from an analyzer that missed the run's timeout. Its cursor
+        and committed recommendations stay as they are; its next commit raises
+        DeadlineReached and a late complete() is ignored.
+        """
+        with self.lock:
+            self.abandoned.add(analyzer)
+            self.suspended.add(analyzer)
+
+    def complete(self, analyzer, recommendations):
+        """
+        Record an analyzer's final recommendations, unless it has been abandoned
+        """
+        if not isinstance(recommendations, RecommendationStore):
+            recommendations = RecommendationStore(recommendations)
+        with self.lock:
+            if analyzer in self.abandoned:
+                logger.warning(f"Ignoring results of {analyzer}, which finished after the timeout")
+                return
+            self.recommendations[analyzer] = recommendations
+            self.committed[analyzer] = len(recommendations)
+            self.completed.add(analyzer)
+            self.cursors.pop(analyzer, None)
+
+    def results(self, analyzer):
+        """
+        Committed recommendations of an analyzer
+        """
+        with self.lock:
+            return self.recommendations.get(analyzer, RecommendationStore())[:self.committed.get(analyzer, 0)]
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'run_id': self.run_id,
+                'invocation': self.invocation,
+                'completed': sorted(self.completed),
+                'recommendations': {
+                    name: recs[:self.committed.get(name, 0)].to_dicts()
+                    for name, recs in self.recommendations.items()
+                },
+                'cursors': {
+                    name: {stream: cursor.to_dict() for stream, cursor in streams.items()}
+                    for name, streams in self.cursors.items()
+                }
+            }
+
+class CheckpointStore:
+    """
+    Checkpoints saved as JSON in an object store (S3 or a local directory)
+    """
+
+    def __init__(self, store, prefix='checkpoints'):
+        self.store = store
+        self.prefix = prefix
+
+    def load(self, run_id):
+        data = self.store.get(f"{self.prefix}/{run_id}.json")
+        return json.loads(data) if data else None
+
+    def save(self, checkpoint):
+        self.store.put(f"{self.prefix}/{checkpoint.run_id}.json", json.dumps(checkpoint.to_dict()).encode())
+
+    def delete(self, run_id):
+        try:
+            self.store.delete(f"{self.prefix}/{run_id}.json")
+        except Exception as e:
+            logger.warning(f"Could not delete checkpoint {run_id}: {str(e)}")
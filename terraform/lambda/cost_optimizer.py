@@ -4,51 +4,187 @@ Analyzes AWS resources and provides cost optimization recommendations
 """
 
 import os
+import io
 import json
-import boto3
 import logging
+import time
 from datetime import datetime, timedelta
 from collections import defaultdict
+from functools import partial
+
+from anomaly import detect_anomalies
+from aws_clients import (
+    Scoped, api_metrics, current_target, default_client, preload_models, prepaid_init, scoped_client
+)
+from ce_cache import CostExplorerCache, LRUBackend, StoreBackend
+from checkpoint import Checkpoint, CheckpointStore, DeadlineReached
+from fanout import fan_out, load_targets
+from inventory import (
+    batched, iter_db_instances, iter_instances, iter_nat_gateways, iter_route_tables, iter_snapshots,
+    iter_subnets, iter_volumes, iter_vpc_endpoints
+)
+from metrics_engine import MAX_QUERIES_PER_REQUEST, MetricBatch
+from nat_traffic import QUERIES_PER_NAT_GATEWAY, cross_az_routing, monthly_traffic, queue_nat_metrics
+from object_store import store_from_uri
+from price_catalog import PriceCatalog
+from recommendations import RecommendationStore
+from report_renderer import bounded_message, write_artifacts, write_text
+from resource_state import ResourceStateStore, changed_resources, is_change_event
+from rightsizing import QUERIES_PER_INSTANCE, SIZE_FACTORS, queue_instance_metrics, recommend_sizes
+from scheduler import imap_bounded, run_tasks
+from snapshot_lineage import SnapshotIndex, deletion_savings_gb, lineage_storage
+from tag_index import TagIndex, TagIndexUnavailable
+from volume_sizing import (
+    GP3_BASELINE_IOPS, GP3_BASELINE_THROUGHPUT, QUERIES_PER_VOLUME, queue_volume_metrics, size_volumes
+)
 
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize AWS clients
-ce_client = boto3.client('ce')
-ec2_client = boto3.client('ec2')
-rds_client = boto3.client('rds')
-cloudwatch_client = boto3.client('cloudwatch')
-sns_client = boto3.client('sns')
+# Initialize AWS clients (created on first use, resolved against the account/region being analyzed)
+ce_client = scoped_client('ce')
+ec2_client = scoped_client('ec2')
+rds_client = scoped_client('rds')
+cloudwatch_client = scoped_client('cloudwatch')
+sns_client = scoped_client('sns')
+tagging_client = scoped_client('resourcegroupstaggingapi')
+preload_models(['ce', 'ec2', 'rds', 'cloudwatch', 'resourcegroupstaggingapi', 'pricing'])
+
+# Continuations always invoke this function in its own account
+lambda_client = default_client('lambda')
+
+# Tags for databases and VPCs, loaded in bulk once per account/region
+tag_index = Scoped('tag_index', lambda target: TagIndex(tagging_client, ['rds:db', 'ec2:vpc']))
+
+# On-demand prices, loaded once per container from a snapshot refreshed every PRICE_CATALOG_TTL_SECONDS
+price_catalog = PriceCatalog(
+    store=store_from_uri(os.environ.get('PRICE_CATALOG_URI', '/tmp/diagnyx-cache')),
+    ttl_seconds=int(os.environ.get('PRICE_CATALOG_TTL_SECONDS', str(7 * 24 * 3600)))
+)
+if prepaid_init():
+    # Read the Lambda region's snapshot now so the first cost lookup is served from memory
+    price_catalog.preload(current_target().region)
+
+# Cost Explorer responses, cached per account in memory and in the shared cache store
+ce_cache_store = StoreBackend(store_from_uri(os.environ.get('CE_CACHE_URI', '/tmp/diagnyx-cache')))
+ce_cache = Scoped('ce_cache', lambda target: CostExplorerCache(
+    ce_client,
+    [LRUBackend(), ce_cache_store],
+    namespace=target.account_id or 'self'
+))
+
+# Progress of runs that continue in a new invocation; must be shared storage (S3) across containers
+checkpoint_store = CheckpointStore(store_from_uri(os.environ.get('CHECKPOINT_URI', '/tmp/diagnyx-cache')))
+
+# Latest recommendations per resource, kept current by change events between full scans
+resource_state_store = store_from_uri(os.environ.get('RESOURCE_STATE_URI', '/tmp/diagnyx-cache'))
+
+# Snapshot index refreshed from a StartTime watermark between weekly full scans
+snapshot_index_store = store_from_uri(os.environ.get('SNAPSHOT_INDEX_URI', '/tmp/diagnyx-cache'))
+
+# Hours in an average month
+HOURS_PER_MONTH = 730
+
+# Resources analyzed per metrics batch (two statistics per resource)
+ANALYSIS_BATCH_SIZE = MAX_QUERIES_PER_REQUEST // 2
+
+# Instances rightsized per metrics batch
+RIGHTSIZING_BATCH_SIZE = MAX_QUERIES_PER_REQUEST // QUERIES_PER_INSTANCE
+
+# Attached volumes analyzed per metrics batch
+VOLUME_BATCH_SIZE = MAX_QUERIES_PER_REQUEST // QUERIES_PER_VOLUME
+
+# NAT gateways whose traffic is read per metrics batch
+NAT_BATCH_SIZE = MAX_QUERIES_PER_REQUEST // QUERIES_PER_NAT_GATEWAY
+
+# Devices root volumes are attached as; never flagged idle
+ROOT_DEVICES = ('/dev/xvda', '/dev/sda1')
+
+# Most values EC2 accepts in one describe filter
+FILTER_VALUES_LIMIT = 200
 
+# Services reachable through free VPC gateway endpoints instead of a NAT gateway
+GATEWAY_ENDPOINT_SERVICES = {'s3': 'S3', 'dynamodb': 'DynamoDB'}
+
+# NAT data processing cost per VPC (USD/month) worth a gateway endpoint recommendation
+NAT_ENDPOINT_MIN_COST = 10
+
+# Highest-savings recommendations listed in the report, overall and per type
+REPORT_TOP_OVERALL = 10
+REPORT_TOP_PER_TYPE = 3
+
+# Snapshots older than this are recommended for deletion
+SNAPSHOT_THRESHOLD_DAYS = 30
+
+# Analyzers that commit progress per batch and can resume from a checkpoint
+RESUMABLE_ANALYZERS = {'ec2_instances', 'rds_instances', 'ebs_volumes', 'old_snapshots'}
+
+@api_metrics.instrument
 def handler(event, context):
     """
     Main Lambda handler for cost optimization analysis
     """
     try:
         environment = os.environ.get('ENVIRONMENT', 'unknown')
-        recommendations = []
+        
+        # Resource changes only re-evaluate the resources they name
+        if is_change_event(event):
+            with api_metrics.scope('change_event'):
+                return handle_change_event(event)
         
         logger.info(f"Starting cost optimization analysis for {environment}")
         
-        # Analyze different resource types
-        recommendations.extend(analyze_ec2_instances())
-        recommendations.extend(analyze_rds_instances())
-        recommendations.extend(analyze_ebs_volumes())
-        recommendations.extend(analyze_elastic_ips())
-        recommendations.extend(analyze_nat_gateways())
-        recommendations.extend(analyze_old_snapshots())
-        recommendations.extend(analyze_reserved_instances())
+        # TARGET_ACCOUNTS switches to one run per (account, region) across the estate
+        targets = load_targets()
+        
+        # Scheduled reports reuse the incremental state until a full reconcile is due
+        stored = None
+        if (event or {}).get('mode') == 'report' and incremental_enabled():
+            stored = stored_recommendations(targets)
         
-        # Get cost trends
-        cost_analysis = analyze_cost_trends()
+        if stored is not None:
+            logger.info(f"Reporting {len(stored)} recommendations from the resource state")
+            recommendations, cost_analysis = stored, analyze_cost_trends()
+        elif targets:
+            recommendations, cost_analysis = analyze_estate(targets)
+        else:
+            # Tags may have changed since the last warm invocation
+            tag_index.invalidate()
+            checkpoint = start_checkpoint(event, context)
+            recommendations, cost_analysis = analyze_account(checkpoint=checkpoint)
+            
+            # Out of time: pick the run up again in a fresh invocation
+            if checkpoint.suspended and continue_run(checkpoint, context):
+                return {
+                    'statusCode': 202,
+                    'body': json.dumps({
+                        'message': 'Cost optimization analysis continues in a new invocation',
+                        'run_id': checkpoint.run_id,
+                        'invocation': checkpoint.invocation,
+                        'recommendations_so_far': len(recommendations),
+                        'timestamp': datetime.utcnow().isoformat()
+                    })
+                }
+            if checkpoint.invocation > 1:
+                checkpoint_store.delete(checkpoint.run_id)
+            
+            # Only a complete scan may replace the resource state
+            if incremental_enabled() and not checkpoint.suspended:
+                resource_state().reconcile(recommendations)
         
-        # Generate report
-        report = generate_report(recommendations, cost_analysis)
+        # Flag unusual spend in the cost trends
+        with api_metrics.scope('cost_anomalies'):
+            recommendations.extend(analyze_cost_anomalies(cost_analysis))
         
-        # Send notification if recommendations found
-        if recommendations:
-            send_notification(report)
+        # Full results go to object storage; the notification carries a summary and links
+        with api_metrics.scope('report'):
+            artifact_urls = publish_artifacts(recommendations)
+            report = generate_report(recommendations, cost_analysis, artifact_urls)
+            
+            # Send notification if recommendations found
+            if recommendations:
+                send_notification(report)
         
         return {
             'statusCode': 200,
@@ -67,131 +203,548 @@ def handler(event, context):
             'body': json.dumps({'error': str(e)})
         }
 
-def analyze_ec2_instances():
+def analyze_account(include_account_level=True, checkpoint=None):
+    """
+    Run all analyzers against the current account/region.
+    Returns (recommendations, cost_analysis).
+
+    Analyzers already finished in the checkpoint are not run again; those that
+    hit the checkpoint's deadline contribute the recommendations committed so far.
+    """
+    checkpoint = checkpoint or Checkpoint()
+    
+    # Analyzers run in this order; recommendations are merged in the same order
+    analyzers = [
+        ('ec2_instances', analyze_ec2_instances),
+        ('rds_instances', analyze_rds_instances),
+        ('ebs_volumes', analyze_ebs_volumes),
+        ('elastic_ips', analyze_elastic_ips),
+        ('nat_gateways', analyze_nat_gateways),
+        ('old_snapshots', analyze_old_snapshots)
+    ]
+    
+    # Cost Explorer is global, so account-level analyzers run once per account
+    if include_account_level:
+        analyzers.append(('reserved_instances', analyze_reserved_instances))
+    
+    def run_analyzer(name, analyzer):
+        try:
+            with api_metrics.scope(name):
+                if name in RESUMABLE_ANALYZERS:
+                    checkpoint.complete(name, analyzer(checkpoint))
+                else:
+                    checkpoint.complete(name, analyzer())
+        except DeadlineReached:
+            logger.info(f"Suspending {name} at the invocation deadline")
+    
+    # ANALYZER_WORKERS=1 keeps the original sequential behaviour
+    tasks = [
+        (name, partial(run_analyzer, name, analyzer), None)
+        for name, analyzer in analyzers
+        if name not in checkpoint.completed
+    ]
+    # Cost Explorer responses are cached, so continuations re-read trends cheaply
+    if include_account_level:
+        tasks.append(('cost_trends', api_metrics.scoped('cost_trends', analyze_cost_trends), None))
+    
+    timeout = float(os.environ.get('ANALYZER_TIMEOUT_SECONDS', '240'))
+    remaining_ms = checkpoint.remaining_ms()
+    if remaining_ms is not None:
+        # Analyzers stop themselves at the deadline; this only catches a stuck batch
+        timeout = max(1, (remaining_ms - checkpoint.reserve_ms / 2) / 1000)
+    # Analyzers still running at the timeout can no longer commit or complete
+    results = run_tasks(
+        tasks,
+        max_workers=int(os.environ.get('ANALYZER_WORKERS', '1')),
+        timeout=timeout,
+        on_timeout=checkpoint.abandon
+    )
+    
+    recommendations = RecommendationStore()
+    for name, _ in analyzers:
+        if name not in checkpoint.completed:
+            # Timed out or stopped at the deadline; resume from its cursor next time
+            checkpoint.suspended.add(name)
+        recommendations.extend(checkpoint.results(name))
+    return recommendations, results.get('cost_trends')
+
+def start_checkpoint(event, context):
+    """
+    Checkpoint for this invocation, resumed from the event's run ID when continuing a run.
+    Unless CHECKPOINT_ENABLED is set the run has no deadline and never stops early.
+    """
+    if os.environ.get('CHECKPOINT_ENABLED', 'false').lower() != 'true':
+        return Checkpoint()
+    
+    reserve_ms = int(float(os.environ.get('CHECKPOINT_RESERVE_SECONDS', '30')) * 1000)
+    run_id = (event or {}).get('checkpoint_run_id')
+    if run_id:
+        state = checkpoint_store.load(run_id)
+        if state:
+            logger.info(f"Resuming run {run_id} from checkpoint")
+            return Checkpoint.from_dict(state, context, reserve_ms)
+        logger.warning(f"Checkpoint {run_id} not found, starting a new run")
+    
+    return Checkpoint(context, reserve_ms)
+
+def continue_run(checkpoint, context):
+    """
+    Save the checkpoint and asynchronously invoke this function to continue it.
+    Returns False when the run should finish with partial results instead.
+    """
+    if checkpoint.context is None:
+        return False
+    
+    max_invocations = int(os.environ.get('CHECKPOINT_MAX_INVOCATIONS', '10'))
+    if checkpoint.invocation >= max_invocations:
+        logger.warning(f"Run {checkpoint.run_id} reached {max_invocations} invocations, reporting partial results")
+        return False
+    
+    try:
+        checkpoint_store.save(checkpoint)
+        lambda_client.invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType='Event',
+            Payload=json.dumps({'checkpoint_run_id': checkpoint.run_id})
+        )
+    except Exception as e:
+        logger.error(f"Failed to continue run {checkpoint.run_id}: {str(e)}")
+        return False
+    
+    logger.info(
+        f"Run {checkpoint.run_id} suspended in invocation {checkpoint.invocation} "
+        f"({', '.join(sorted(checkpoint.suspended))} pending)"
+    )
+    return True
+
+def analyze_estate(targets):
+    """
+    Run the analyzers in every (account, region) target and merge the results.
+    Cost trends come from this function's own account, which sees consolidated billing.
+    """
+    first_region = {}
+    for account_id, region in targets:
+        first_region.setdefault(account_id, region)
+    
+    def analyze_target(account_id, region):
+        return analyze_account(include_account_level=first_region[account_id] == region)
+    
+    results = fan_out(
+        targets,
+        analyze_target,
+        max_workers=int(os.environ.get('TARGET_WORKERS', '1')),
+        timeout=float(os.environ.get('ANALYZER_TIMEOUT_SECONDS', '240'))
+    )
+    
+    recommendations = RecommendationStore()
+    for account_id, region, result in results:
+        if result is None:
+            logger.warning(f"No results for account {account_id} in {region}")
+            continue
+        if incremental_enabled():
+            resource_state(account_id, region).reconcile(result[0])
+        recommendations.extend(result[0], account_id=account_id, region=region)
+    
+    with api_metrics.scope('cost_trends'):
+        return recommendations, analyze_cost_trends()
+
+def incremental_enabled():
+    """
+    Whether change events keep a resource state that scheduled reports can reuse
+    """
+    return os.environ.get('INCREMENTAL_ENABLED', 'false').lower() == 'true'
+
+def snapshot_index():
+    """
+    Snapshot index of the (account, region) being analyzed
+    """
+    target = current_target()
+    return SnapshotIndex(snapshot_index_store, f"{target.account_id or 'self'}/{target.region}")
+
+def snapshot_change_rate():
+    """
+    Share of a volume assumed to change per day between snapshots (SNAPSHOT_DAILY_CHANGE_RATE)
+    """
+    return float(os.environ.get('SNAPSHOT_DAILY_CHANGE_RATE', '0.02'))
+
+def resource_state(account_id=None, region=None):
+    """
+    Resource state of an (account, region) target, by default the one being analyzed
+    """
+    target = current_target()
+    return ResourceStateStore(
+        resource_state_store,
+        f"{account_id or target.account_id or 'self'}/{region or target.region}"
+    )
+
+def stored_recommendations(targets):
+    """
+    Recommendations from the resource state of every target, or None when any
+    target has not been reconciled within RECONCILE_INTERVAL_HOURS
+    """
+    max_age = float(os.environ.get('RECONCILE_INTERVAL_HOURS', '168')) * 3600
+    recommendations = RecommendationStore()
+    for account_id, region in targets or [(None, None)]:
+        reconciled_at, stored = resource_state(account_id, region).load_recommendations()
+        if not reconciled_at or time.time() - reconciled_at > max_age:
+            logger.info(f"Resource state of {account_id or 'self'}/{region or current_target().region} is due a full scan")
+            return None
+        if account_id:
+            recommendations.extend(stored, account_id=account_id, region=region)
+        else:
+            recommendations.extend(stored)
+    return recommendations
+
+def handle_change_event(event):
+    """
+    Re-evaluate the resources an EventBridge or CloudTrail change event names and
+    update the resource state, without scanning the rest of the account
+    """
+    changes = changed_resources(event)
+    evaluated, removed = {}, []
+    
+    targets = load_targets()
+    target = (event.get('account'), event.get('region'))
+    if targets and target not in targets:
+        logger.info(f"Ignoring change in {target[0]}/{target[1]}, which is not a target")
+    elif targets and changes:
+        # Re-evaluate inside the target account, with its role and region
+        [(_, _, result)] = fan_out([target], lambda a, r: reevaluate_resources(changes, resource_state(a, r)))
+        if result is None:
+            raise RuntimeError(f"Could not re-evaluate changes in {target[0]}/{target[1]}")
+        evaluated, removed = result
+    elif changes:
+        evaluated, removed = reevaluate_resources(changes, resource_state())
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': 'Changed resources re-evaluated',
+            'resources_evaluated': len(evaluated),
+            'resources_removed': len(removed),
+            'recommendations': sum(len(recs) for _, recs in evaluated.values()),
+            'timestamp': datetime.utcnow().isoformat()
+        })
+    }
+
+def reevaluate_resources(changes, state):
+    """
+    Run the per-resource checks for changed resources, in one bulk lookup per kind,
+    and store the results. Returns ({resource_id: (kind, recommendations)}, removed IDs).
+    """
+    # Tags may have changed since this container last loaded them
+    tag_index.invalidate()
+    
+    removed = [change.resource_id for change in changes if change.deleted]
+    ids_by_kind = defaultdict(list)
+    for change in changes:
+        # Deleting a snapshot changes what the rest of its lineage costs
+        if change.kind in RESOURCE_EVALUATORS and (not change.deleted or change.kind == 'snapshot'):
+            ids_by_kind[change.kind].append(change.resource_id)
+    
+    evaluated = {}
+    for kind, resource_ids in ids_by_kind.items():
+        found = RESOURCE_EVALUATORS[kind](resource_ids)
+        evaluated.update((resource_id, (kind, recs)) for resource_id, recs in found.items())
+        # Gone by the time we looked
+        removed.extend(resource_id for resource_id in resource_ids if resource_id not in found)
+    
+    removed = list(dict.fromkeys(removed))
+    state.apply(evaluated, removed)
+    logger.info(f"Re-evaluated {len(evaluated)} changed resources, removed {len(removed)}")
+    return evaluated, removed
+
+def reevaluate_instances(instance_ids):
+    """
+    {instance_id: recommendations} for the instances that still exist
+    """
+    instances = list(iter_instances(ec2_client, filters=[{'Name': 'instance-id', 'Values': instance_ids}]))
+    running = [instance for instance in instances if instance['State']['Name'] == 'running']
+    sizing_by_instance = get_instance_sizing(running) if running else {}
+    return {
+        instance['InstanceId']: (
+            evaluate_instance(instance, sizing_by_instance.get(instance['InstanceId']))
+            if instance['State']['Name'] == 'running' else []
+        )
+        for instance in instances
+    }
+
+def reevaluate_databases(db_ids):
+    """
+    {db_id: recommendations} for the databases that still exist
+    """
+    dbs = list(iter_db_instances(rds_client, filters=[{'Name': 'db-instance-id', 'Values': db_ids}]))
+    connections_by_db = get_rds_connections([db['DBInstanceIdentifier'] for db in dbs]) if dbs else {}
+    return {
+        db['DBInstanceIdentifier']: evaluate_database(db, connections_by_db.get(db['DBInstanceIdentifier']))
+        for db in dbs
+    }
+
+def reevaluate_volumes(volume_ids):
+    """
+    {volume_id: recommendations} for the volumes that still exist
+    """
+    volumes = list(iter_volumes(ec2_client, filters=[{'Name': 'volume-id', 'Values': volume_ids}]))
+    attached = [volume for volume in volumes if volume['State'] == 'in-use']
+    performance_by_volume = get_volume_performance(attached) if attached else {}
+    return {
+        volume['VolumeId']: evaluate_volume(volume, performance_by_volume.get(volume['VolumeId']))
+        for volume in volumes
+    }
+
+def reevaluate_snapshots(snapshot_ids):
+    """
+    {lineage_id: recommendations} for the lineages of changed snapshots, after
+    updating the snapshot index with the ones created or deleted
+    """
+    index = snapshot_index()
+    index.load()
+    affected = index.lineage_ids(snapshot_ids)
+    
+    snapshots = list(iter_snapshots(ec2_client, filters=[{'Name': 'snapshot-id', 'Values': snapshot_ids}]))
+    for snapshot in snapshots:
+        index.upsert(snapshot, time.time())
+    index.forget(set(snapshot_ids) - {snapshot['SnapshotId'] for snapshot in snapshots})
+    affected |= index.lineage_ids(snapshot_ids)
+    index.save()
+    
+    cutoff = time.time() - SNAPSHOT_THRESHOLD_DAYS * 86400
+    change_rate = snapshot_change_rate()
+    found = {lineage_id: [] for lineage_id in affected}
+    for lineage in index.lineages(affected):
+        found[lineage.lineage_id] = evaluate_lineage(lineage, cutoff, change_rate)
+    return found
+
+def reevaluate_addresses(allocation_ids):
+    """
+    {allocation_id: recommendations} for the Elastic IPs that still exist
+    """
+    response = ec2_client.describe_addresses(Filters=[{'Name': 'allocation-id', 'Values': allocation_ids}])
+    return {eip['AllocationId']: evaluate_address(eip) for eip in response['Addresses']}
+
+def analyze_ec2_instances(checkpoint=None):
     """
     Analyze EC2 instances for optimization opportunities
     """
-    recommendations = []
-    threshold_cpu = float(os.environ.get('THRESHOLD_UNDERUTILIZED', '30'))
+    checkpoint = checkpoint or Checkpoint()
+    recommendations = checkpoint.partial('ec2_instances')
     
     try:
-        # Get all running instances
-        response = ec2_client.describe_instances(
-            Filters=[{'Name': 'instance-state-name', 'Values': ['running']}]
+        # Stream running instances and size them one metrics batch at a time
+        running = iter_instances(
+            ec2_client,
+            filters=[{'Name': 'instance-state-name', 'Values': ['running']}],
+            cursor=checkpoint.cursor('ec2_instances', 'running')
         )
         
-        for reservation in response['Reservations']:
-            for instance in reservation['Instances']:
-                instance_id = instance['InstanceId']
-                instance_type = instance['InstanceType']
-                
-                # Check CPU utilization
-                cpu_stats = get_cpu_utilization(instance_id)
-                
-                if cpu_stats and cpu_stats['average'] < threshold_cpu:
-                    savings = estimate_downsize_savings(instance_type)
-                    recommendations.append({
-                        'type': 'EC2_UNDERUTILIZED',
-                        'resource_id': instance_id,
-                        'current_type': instance_type,
-                        'recommendation': f"Downsize from {instance_type} (CPU avg: {cpu_stats['average']:.1f}%)",
-                        'estimated_savings': savings
-                    })
-                
-                # Check for instances without reserved capacity
-                if instance.get('InstanceLifecycle') != 'spot':
-                    tags = {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
-                    if tags.get('Environment') == 'production':
-                        recommendations.append({
-                            'type': 'EC2_NO_RESERVATION',
-                            'resource_id': instance_id,
-                            'current_type': instance_type,
-                            'recommendation': 'Consider Reserved Instance or Savings Plan',
-                            'estimated_savings': estimate_reservation_savings(instance_type)
-                        })
+        sizing_batches = imap_bounded(
+            get_instance_sizing,
+            batched(running, RIGHTSIZING_BATCH_SIZE),
+            max_workers=resource_workers()
+        )
+        
+        for instances, sizing_by_instance in sizing_batches:
+            for instance in instances:
+                recommendations.extend(evaluate_instance(instance, sizing_by_instance.get(instance['InstanceId'])))
+            
+            checkpoint.commit('ec2_instances', 'running', len(instances))
                 
+    except DeadlineReached:
+        raise
     except Exception as e:
         logger.error(f"Error analyzing EC2 instances: {str(e)}")
     
     return recommendations
 
-def analyze_rds_instances():
+def evaluate_instance(instance, sizing):
     """
-    Analyze RDS instances for optimization
+    Recommendations for one running instance, given its rightsizing result (or None)
     """
     recommendations = []
+    instance_id = instance['InstanceId']
+    instance_type = instance['InstanceType']
+    
+    # Check CPU, memory and network percentiles against the headroom policy
+    if sizing:
+        target = sizing['target_type']
+        cpu_p50, cpu_p95, cpu_p99 = sizing['cpu']
+        memory = f", memory p95: {sizing['memory'][1]:.1f}%" if sizing['memory'] else ''
+        recommendations.append({
+            'type': 'EC2_UNDERUTILIZED',
+            'resource_id': instance_id,
+            'current_type': instance_type,
+            'target_type': target,
+            'recommendation': (
+                f"Downsize from {instance_type} to {target} "
+                f"(CPU p95: {cpu_p95:.1f}%, p99: {cpu_p99:.1f}%{memory})"
+            ),
+            'estimated_savings': estimate_downsize_savings(instance_type, target)
+        })
+    
+    # Check for instances without reserved capacity
+    if instance.get('InstanceLifecycle') != 'spot':
+        tags = {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
+        if tags.get('Environment') == 'production':
+            recommendations.append({
+                'type': 'EC2_NO_RESERVATION',
+                'resource_id': instance_id,
+                'current_type': instance_type,
+                'recommendation': 'Consider Reserved Instance or Savings Plan',
+                'estimated_savings': estimate_reservation_savings(instance_type)
+            })
+    
+    return recommendations
+
+def analyze_rds_instances(checkpoint=None):
+    """
+    Analyze RDS instances for optimization
+    """
+    checkpoint = checkpoint or Checkpoint()
+    recommendations = checkpoint.partial('rds_instances')
     
     try:
-        response = rds_client.describe_db_instances()
+        # Stream databases and fetch connection counts one batch at a time
+        databases = iter_db_instances(rds_client, cursor=checkpoint.cursor('rds_instances', 'databases'))
+        connection_batches = imap_bounded(
+            lambda dbs: get_rds_connections([db['DBInstanceIdentifier'] for db in dbs]),
+            batched(databases, ANALYSIS_BATCH_SIZE),
+            max_workers=resource_workers()
+        )
         
-        for db in response['DBInstances']:
-            db_id = db['DBInstanceIdentifier']
-            db_class = db['DBInstanceClass']
+        for dbs, connections_by_db in connection_batches:
+            for db in dbs:
+                recommendations.extend(evaluate_database(db, connections_by_db.get(db['DBInstanceIdentifier'])))
             
-            # Check connection count
-            connection_stats = get_rds_connections(db_id)
-            
-            if connection_stats and connection_stats['max'] < 10:
-                recommendations.append({
-                    'type': 'RDS_UNDERUTILIZED',
-                    'resource_id': db_id,
-                    'current_type': db_class,
-                    'recommendation': f"Downsize RDS instance (max connections: {connection_stats['max']})",
-                    'estimated_savings': estimate_rds_downsize_savings(db_class)
-                })
-            
-            # Check for Multi-AZ in non-production
-            if db['MultiAZ']:
-                tags = rds_client.list_tags_for_resource(ResourceName=db['DBInstanceArn'])
-                tag_dict = {tag['Key']: tag['Value'] for tag in tags['TagList']}
-                if tag_dict.get('Environment') != 'production':
-                    recommendations.append({
-                        'type': 'RDS_UNNECESSARY_MULTI_AZ',
-                        'resource_id': db_id,
-                        'recommendation': 'Disable Multi-AZ for non-production',
-                        'estimated_savings': estimate_multi_az_savings(db_class)
-                    })
-                    
+            checkpoint.commit('rds_instances', 'databases', len(dbs))
+                        
+    except DeadlineReached:
+        raise
     except Exception as e:
         logger.error(f"Error analyzing RDS instances: {str(e)}")
     
     return recommendations
 
-def analyze_ebs_volumes():
+def evaluate_database(db, connection_stats):
     """
-    Analyze EBS volumes for optimization
+    Recommendations for one RDS instance, given its connection statistics (or None)
     """
     recommendations = []
+    db_id = db['DBInstanceIdentifier']
+    db_class = db['DBInstanceClass']
+    
+    # Check connection count
+    if connection_stats and connection_stats['max'] < 10:
+        recommendations.append({
+            'type': 'RDS_UNDERUTILIZED',
+            'resource_id': db_id,
+            'current_type': db_class,
+            'recommendation': f"Downsize RDS instance (max connections: {connection_stats['max']})",
+            'estimated_savings': estimate_rds_downsize_savings(db_class)
+        })
+    
+    # Check for Multi-AZ in non-production
+    if db['MultiAZ']:
+        try:
+            tag_dict = tag_index.tags_for(db['DBInstanceArn'])
+        except TagIndexUnavailable:
+            # Without tags a production database would look non-production
+            return recommendations
+        if tag_dict.get('Environment') != 'production':
+            recommendations.append({
+                'type': 'RDS_UNNECESSARY_MULTI_AZ',
+                'resource_id': db_id,
+                'recommendation': 'Disable Multi-AZ for non-production',
+                'estimated_savings': estimate_multi_az_savings(db_class)
+            })
+    
+    return recommendations
+
+def analyze_ebs_volumes(checkpoint=None):
+    """
+    Analyze EBS volumes for optimization
+    """
+    checkpoint = checkpoint or Checkpoint()
+    recommendations = checkpoint.partial('ebs_volumes')
     
     try:
-        response = ec2_client.describe_volumes()
+        # Check for unattached volumes
+        unattached = iter_volumes(
+            ec2_client,
+            filters=[{'Name': 'status', 'Values': ['available']}],
+            cursor=checkpoint.cursor('ebs_volumes', 'unattached')
+        )
+        for volumes in batched(unattached, ANALYSIS_BATCH_SIZE):
+            for volume in volumes:
+                recommendations.extend(evaluate_volume(volume))
+            checkpoint.commit('ebs_volumes', 'unattached', len(volumes))
         
-        for volume in response['Volumes']:
-            volume_id = volume['VolumeId']
-            
-            # Check for unattached volumes
-            if volume['State'] == 'available':
-                recommendations.append({
-                    'type': 'EBS_UNATTACHED',
-                    'resource_id': volume_id,
-                    'recommendation': 'Delete unattached EBS volume',
-                    'estimated_savings': calculate_ebs_cost(volume)
-                })
-            
-            # Check for gp2 volumes that should be gp3
-            elif volume['VolumeType'] == 'gp2':
-                recommendations.append({
-                    'type': 'EBS_GP2_TO_GP3',
-                    'resource_id': volume_id,
-                    'recommendation': 'Convert gp2 to gp3 for 20% savings',
-                    'estimated_savings': calculate_gp3_savings(volume)
-                })
+        # Size attached volumes for gp3 and find idle ones, one metrics batch at a time
+        attached = iter_volumes(
+            ec2_client,
+            filters=[{'Name': 'status', 'Values': ['in-use']}],
+            cursor=checkpoint.cursor('ebs_volumes', 'attached')
+        )
+        performance_batches = imap_bounded(
+            get_volume_performance,
+            batched(attached, VOLUME_BATCH_SIZE),
+            max_workers=resource_workers()
+        )
+        for volumes, performance_by_volume in performance_batches:
+            for volume in volumes:
+                recommendations.extend(evaluate_volume(volume, performance_by_volume.get(volume['VolumeId'])))
+            checkpoint.commit('ebs_volumes', 'attached', len(volumes))
                 
+    except DeadlineReached:
+        raise
     except Exception as e:
         logger.error(f"Error analyzing EBS volumes: {str(e)}")
     
     return recommendations
 
+def evaluate_volume(volume, performance=None):
+    """
+    Recommendations for one EBS volume: delete it when unattached or idle, otherwise
+    move gp2 to a gp3 volume provisioned for its measured IOPS and throughput
+    """
+    if volume['State'] == 'available':
+        return [{
+            'type': 'EBS_UNATTACHED',
+            'resource_id': volume['VolumeId'],
+            'recommendation': 'Delete unattached EBS volume',
+            'estimated_savings': calculate_ebs_cost(volume)
+        }]
+    
+    devices = {attachment.get('Device') for attachment in volume.get('Attachments', [])}
+    if performance and performance['idle'] and not devices & set(ROOT_DEVICES):
+        return [{
+            'type': 'EBS_IDLE',
+            'resource_id': volume['VolumeId'],
+            'recommendation': (
+                f"Snapshot and delete idle volume (idle {performance['idle_share']:.0%} of the time, "
+                f"p99 {performance['iops'][2]:.1f} IOPS)"
+            ),
+            'estimated_savings': calculate_ebs_cost(volume)
+        }]
+    
+    if volume['VolumeType'] == 'gp2':
+        # Without metrics the gp3 baseline (3000 IOPS, 125 MiB/s) is assumed to be enough
+        if performance and not performance['fits_gp3']:
+            return []
+        iops = performance['gp3_iops'] if performance else GP3_BASELINE_IOPS
+        throughput = performance['gp3_throughput'] if performance else GP3_BASELINE_THROUGHPUT
+        savings = calculate_gp3_savings(volume, iops, throughput)
+        if savings <= 0:
+            return []
+        return [{
+            'type': 'EBS_GP2_TO_GP3',
+            'resource_id': volume['VolumeId'],
+            'target_iops': iops,
+            'target_throughput': throughput,
+            'recommendation': f"Convert gp2 to gp3 with {iops} IOPS and {throughput} MiB/s",
+            'estimated_savings': savings
+        }]
+    return []
+
 def analyze_elastic_ips():
     """
     Analyze Elastic IPs for waste
@@ -202,84 +755,217 @@ def analyze_elastic_ips():
         response = ec2_client.describe_addresses()
         
         for eip in response['Addresses']:
-            if 'InstanceId' not in eip and 'NetworkInterfaceId' not in eip:
-                recommendations.append({
-                    'type': 'EIP_UNATTACHED',
-                    'resource_id': eip.get('AllocationId', 'unknown'),
-                    'recommendation': 'Release unattached Elastic IP',
-                    'estimated_savings': 3.65  # $0.005/hour * 730 hours
-                })
+            recommendations.extend(evaluate_address(eip))
                 
     except Exception as e:
         logger.error(f"Error analyzing Elastic IPs: {str(e)}")
     
     return recommendations
 
+def evaluate_address(eip):
+    """
+    Recommendations for one Elastic IP
+    """
+    if 'InstanceId' in eip or 'NetworkInterfaceId' in eip:
+        return []
+    return [{
+        'type': 'EIP_UNATTACHED',
+        'resource_id': eip.get('AllocationId', 'unknown'),
+        'recommendation': 'Release unattached Elastic IP',
+        'estimated_savings': 3.65  # $0.005/hour * 730 hours
+    }]
+
 def analyze_nat_gateways():
     """
-    Analyze NAT Gateway usage
+    Analyze NAT Gateway usage: hourly and data processing cost per gateway and AZ,
+    missing S3/DynamoDB gateway endpoints and subnets routed to a gateway in another AZ
     """
     recommendations = []
     
     try:
-        response = ec2_client.describe_nat_gateways()
+        gateways = list(iter_nat_gateways(
+            ec2_client,
+            filters=[{'Name': 'state', 'Values': ['available']}]
+        ))
+        if not gateways:
+            return recommendations
         
-        nat_count_by_vpc = defaultdict(int)
-        for nat in response['NatGateways']:
-            if nat['State'] == 'available':
-                nat_count_by_vpc[nat['VpcId']] += 1
+        # Bytes processed by every gateway, one metrics batch per request's worth of gateways
+        traffic = {}
+        for _, batch_traffic in imap_bounded(
+            get_nat_traffic,
+            batched(gateways, NAT_BATCH_SIZE),
+            max_workers=resource_workers()
+        ):
+            traffic.update(batch_traffic)
         
-        for vpc_id, count in nat_count_by_vpc.items():
-            if count > 1:
-                # Check if this is production
-                vpc_tags = ec2_client.describe_tags(
-                    Filters=[
-                        {'Name': 'resource-id', 'Values': [vpc_id]},
-                        {'Name': 'key', 'Values': ['Environment']}
-                    ]
-                )
-                
-                is_production = any(tag['Value'] == 'production' for tag in vpc_tags.get('Tags', []))
-                
-                if not is_production:
+        # Which subnets route through which gateway, and the AZ of each
+        route_tables = []
+        gateway_ids = [nat['NatGatewayId'] for nat in gateways]
+        for chunk in batched(gateway_ids, FILTER_VALUES_LIMIT):
+            route_tables.extend(iter_route_tables(ec2_client, filters=[{'Name': 'route.nat-gateway-id', 'Values': chunk}]))
+        subnet_ids = {nat['SubnetId'] for nat in gateways} | {
+            association['SubnetId']
+            for route_table in route_tables
+            for association in route_table.get('Associations', [])
+            if association.get('SubnetId')
+        }
+        zone_by_subnet = {}
+        for chunk in batched(sorted(subnet_ids), FILTER_VALUES_LIMIT):
+            for subnet in iter_subnets(ec2_client, filters=[{'Name': 'subnet-id', 'Values': chunk}]):
+                zone_by_subnet[subnet['SubnetId']] = subnet['AvailabilityZone']
+        zone_by_gateway = {nat['NatGatewayId']: zone_by_subnet.get(nat['SubnetId']) for nat in gateways}
+        routing = cross_az_routing(route_tables, zone_by_subnet, zone_by_gateway)
+        
+        gateways_by_vpc = defaultdict(list)
+        for nat in gateways:
+            gateways_by_vpc[nat['VpcId']].append(nat)
+        endpoint_services = defaultdict(set)
+        for chunk in batched(sorted(gateways_by_vpc), FILTER_VALUES_LIMIT):
+            for endpoint in iter_vpc_endpoints(ec2_client, filters=[
+                {'Name': 'vpc-id', 'Values': chunk},
+                {'Name': 'vpc-endpoint-type', 'Values': ['Gateway']}
+            ]):
+                endpoint_services[endpoint['VpcId']].add(endpoint['ServiceName'].rsplit('.', 1)[-1])
+        
+        hourly_cost = unit_price('ec2', 'nat-gateway', 'hourly', default=0.045) * HOURS_PER_MONTH
+        gb_price = unit_price('ec2', 'nat-gateway', 'gb_processed', default=0.045)
+        cross_az_price = unit_price('ec2', 'data-transfer', 'cross_az_gb', default=0.02)
+        endpoint_share = float(os.environ.get('NAT_ENDPOINT_TRAFFIC_SHARE', '0.25'))
+        
+        processing_by_zone = defaultdict(float)
+        for nat in gateways:
+            usage = traffic.get(nat['NatGatewayId'], {'processed_gb': 0.0, 'source_gb': 0.0})
+            zone = zone_by_gateway[nat['NatGatewayId']] or 'unknown'
+            processing_cost = usage['processed_gb'] * gb_price
+            processing_by_zone[zone] += processing_cost
+            logger.info(
+                f"NAT gateway {nat['NatGatewayId']} ({zone}) processes {usage['processed_gb']:.1f} GB/month "
+                f"(${processing_cost:.2f})"
+            )
+        logger.info(
+            "NAT gateway data processing per AZ (USD/month): "
+            + ", ".join(f"{zone} {cost:.2f}" for zone, cost in sorted(processing_by_zone.items()))
+        )
+        
+        for vpc_id, vpc_gateways in gateways_by_vpc.items():
+            count = len(vpc_gateways)
+            processed_gb = sum(traffic.get(nat['NatGatewayId'], {}).get('processed_gb', 0.0) for nat in vpc_gateways)
+            processing_cost = processed_gb * gb_price
+            
+            # S3 and DynamoDB traffic through a gateway endpoint skips NAT processing
+            missing = [
+                service for service in GATEWAY_ENDPOINT_SERVICES
+                if service not in endpoint_services[vpc_id]
+            ]
+            if missing and processing_cost >= NAT_ENDPOINT_MIN_COST:
+                recommendations.append({
+                    'type': 'NAT_GATEWAY_ENDPOINT',
+                    'resource_id': vpc_id,
+                    'processed_gb': round(processed_gb, 1),
+                    'processing_cost': round(processing_cost, 2),
+                    'recommendation': (
+                        f"Add {'/'.join(GATEWAY_ENDPOINT_SERVICES[service] for service in missing)} "
+                        f"gateway endpoints; NAT gateways process {processed_gb:.0f} GB/month "
+                        f"(${processing_cost:.2f})"
+                    ),
+                    'estimated_savings': processing_cost * endpoint_share
+                })
+            
+            # Check if this is production; without tags both checks below could misfire
+            try:
+                is_production = tag_index.tags_for(vpc_id).get('Environment') == 'production'
+            except TagIndexUnavailable:
+                logger.warning(f"Tags of {vpc_id} unavailable, skipping its NAT redundancy and cross-AZ checks")
+                continue
+            
+            # Non-production VPCs consolidate gateways rather than add AZ-local ones
+            if not is_production:
+                if count > 1:
                     recommendations.append({
                         'type': 'NAT_GATEWAY_REDUNDANT',
                         'resource_id': vpc_id,
                         'recommendation': f'Use single NAT Gateway for non-production (currently {count})',
-                        'estimated_savings': (count - 1) * 45  # $45/month per NAT
+                        'estimated_savings': (count - 1) * hourly_cost
                     })
+                continue
+            
+            # Subnets mostly routed to another AZ's gateway pay cross-AZ transfer both ways
+            zones_with_gateway = {zone_by_gateway[nat['NatGatewayId']] for nat in vpc_gateways}
+            for nat in vpc_gateways:
+                share, remote_zones = routing.get(nat['NatGatewayId'], (0.0, set()))
+                if share <= 0.5:
+                    continue
+                cross_az_gb = traffic.get(nat['NatGatewayId'], {}).get('source_gb', 0.0) * share
+                new_gateways = len(remote_zones - zones_with_gateway)
+                savings = cross_az_gb * cross_az_price - new_gateways * hourly_cost
+                if savings <= 0:
+                    continue
+                recommendations.append({
+                    'type': 'NAT_GATEWAY_CROSS_AZ',
+                    'resource_id': nat['NatGatewayId'],
+                    'cross_az_gb': round(cross_az_gb, 1),
+                    'recommendation': (
+                        f"Route subnets in {', '.join(sorted(remote_zones))} to a NAT gateway in their own AZ "
+                        f"({share:.0%} of its subnets, {cross_az_gb:.0f} GB/month cross-AZ)"
+                    ),
+                    'estimated_savings': savings
+                })
                     
     except Exception as e:
         logger.error(f"Error analyzing NAT Gateways: {str(e)}")
     
     return recommendations
 
-def analyze_old_snapshots():
+def analyze_old_snapshots(checkpoint=None):
     """
-    Analyze old EBS snapshots
+    Analyze old EBS snapshots per volume lineage, from an index that only lists
+    snapshots started since the last run except during the weekly full scan
     """
     recommendations = []
-    threshold_days = 30
     
     try:
-        response = ec2_client.describe_snapshots(OwnerIds=['self'])
-        cutoff_date = datetime.utcnow() - timedelta(days=threshold_days)
+        index = snapshot_index()
+        index.refresh(
+            ec2_client,
+            full_scan_days=float(os.environ.get('SNAPSHOT_FULL_SCAN_DAYS', '7')),
+            checkpoint=checkpoint
+        )
         
-        for snapshot in response['Snapshots']:
-            start_time = snapshot['StartTime'].replace(tzinfo=None)
-            if start_time < cutoff_date:
-                recommendations.append({
-                    'type': 'SNAPSHOT_OLD',
-                    'resource_id': snapshot['SnapshotId'],
-                    'recommendation': f"Delete snapshot older than {threshold_days} days",
-                    'estimated_savings': calculate_snapshot_cost(snapshot)
-                })
+        cutoff = time.time() - SNAPSHOT_THRESHOLD_DAYS * 86400
+        change_rate = snapshot_change_rate()
+        for lineage in index.lineages():
+            recommendations.extend(evaluate_lineage(lineage, cutoff, change_rate))
                 
+    except DeadlineReached:
+        raise
     except Exception as e:
         logger.error(f"Error analyzing snapshots: {str(e)}")
     
     return recommendations
 
+def evaluate_lineage(lineage, cutoff, change_rate):
+    """
+    Recommendations for one snapshot lineage, flagged when it has snapshots started
+    before cutoff (epoch seconds). Savings count only the blocks no kept snapshot shares.
+    """
+    old_count = sum(1 for _, start, _ in lineage.snapshots if start < cutoff)
+    if not old_count:
+        return []
+    stored = lineage_storage(lineage, change_rate)
+    savings_gb = deletion_savings_gb(lineage, stored, old_count)
+    return [{
+        'type': 'SNAPSHOT_OLD',
+        'resource_id': lineage.lineage_id,
+        'snapshot_count': old_count,
+        'lineage_gb': round(sum(stored), 1),
+        'recommendation': (
+            f"Delete {old_count} of {len(lineage.snapshots)} snapshots "
+            f"older than {SNAPSHOT_THRESHOLD_DAYS} days"
+        ),
+        'estimated_savings': calculate_snapshot_cost(savings_gb)
+    }]
+
 def analyze_reserved_instances():
     """
     Analyze Reserved Instance utilization
@@ -291,7 +977,8 @@ def analyze_reserved_instances():
         end_date = datetime.utcnow().date()
         start_date = end_date - timedelta(days=7)
         
-        response = ce_client.get_reservation_utilization(
+        response = ce_cache.call(
+            'get_reservation_utilization',
             TimePeriod={
                 'Start': start_date.isoformat(),
                 'End': end_date.isoformat()
@@ -320,9 +1007,10 @@ def analyze_cost_trends():
     """
     try:
         end_date = datetime.utcnow().date()
-        start_date = end_date - timedelta(days=30)
+        start_date = end_date - timedelta(days=int(os.environ.get('COST_TREND_DAYS', '30')))
         
-        response = ce_client.get_cost_and_usage(
+        response = ce_cache.call(
+            'get_cost_and_usage',
             TimePeriod={
                 'Start': start_date.isoformat(),
                 'End': end_date.isoformat()
@@ -338,90 +1026,134 @@ def analyze_cost_trends():
         logger.error(f"Error analyzing cost trends: {str(e)}")
         return None
 
-def get_cpu_utilization(instance_id):
+def resource_workers():
     """
-    Get CPU utilization statistics for an instance
+    Number of per-resource metric batches fetched concurrently
     """
+    return int(os.environ.get('RESOURCE_WORKERS', '1'))
+
+def analyze_cost_anomalies(cost_analysis):
+    """
+    Detect spend anomalies per service in the cost trends
+    """
+    recommendations = []
+    
+    if not cost_analysis:
+        return recommendations
+    
     try:
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(days=7)
-        
-        response = cloudwatch_client.get_metric_statistics(
-            Namespace='AWS/EC2',
-            MetricName='CPUUtilization',
-            Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
-            StartTime=start_time,
-            EndTime=end_time,
-            Period=3600,
-            Statistics=['Average', 'Maximum']
+        anomalies = detect_anomalies(
+            cost_analysis.get('ResultsByTime', []),
+            z_threshold=float(os.environ.get('ANOMALY_Z_THRESHOLD', '3')),
+            eval_days=int(os.environ.get('ANOMALY_EVAL_DAYS', '1'))
         )
         
-        if response['Datapoints']:
-            avg = sum(d['Average'] for d in response['Datapoints']) / len(response['Datapoints'])
-            max_val = max(d['Maximum'] for d in response['Datapoints'])
-            return {'average': avg, 'maximum': max_val}
+        for anomaly in anomalies:
+            week_over_week = anomaly['week_over_week']
+            trend = f", {week_over_week:+.0f}% week over week" if week_over_week is not None else ''
+            recommendations.append({
+                'type': 'COST_ANOMALY',
+                'resource_id': anomaly['group'],
+                'recommendation': (
+                    f"Spend ${anomaly['cost']:,.2f} on {anomaly['day']} vs "
+                    f"${anomaly['baseline']:,.2f} baseline (z={anomaly['z_score']:.1f}{trend}), "
+                    f"${anomaly['excess']:,.2f} above baseline"
+                ),
+                'excess_cost': round(anomaly['excess'], 2),
+                # A spike is not a recurring saving, so it stays out of the savings totals
+                'estimated_savings': 0
+            })
             
     except Exception as e:
-        logger.error(f"Error getting CPU stats for {instance_id}: {str(e)}")
+        logger.error(f"Error detecting cost anomalies: {str(e)}")
     
-    return None
+    return recommendations
+
+# Kind of changed resource -> bulk re-evaluation
+RESOURCE_EVALUATORS = {
+    'instance': reevaluate_instances,
+    'database': reevaluate_databases,
+    'volume': reevaluate_volumes,
+    'snapshot': reevaluate_snapshots,
+    'address': reevaluate_addresses
+}
 
-def get_rds_connections(db_id):
+def get_instance_sizing(instances):
     """
-    Get RDS connection statistics
+    Get rightsizing targets for a batch of instances from their utilization percentiles
     """
-    try:
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(days=7)
-        
-        response = cloudwatch_client.get_metric_statistics(
-            Namespace='AWS/RDS',
-            MetricName='DatabaseConnections',
-            Dimensions=[{'Name': 'DBInstanceIdentifier', 'Value': db_id}],
-            StartTime=start_time,
-            EndTime=end_time,
-            Period=3600,
-            Statistics=['Average', 'Maximum']
+    batch = MetricBatch(cloudwatch_client)
+    for instance in instances:
+        queue_instance_metrics(batch, instance)
+    
+    known_types = price_catalog.types('ec2', current_target().region)
+    return recommend_sizes(instances, batch.execute(reduce=False), known_types)
+
+def get_volume_performance(volumes):
+    """
+    Get gp3 sizing and idleness for a batch of attached volumes from their I/O series
+    """
+    batch = MetricBatch(cloudwatch_client)
+    for volume in volumes:
+        queue_volume_metrics(batch, volume['VolumeId'])
+    
+    return size_volumes(volumes, batch.execute(reduce=False), period=batch.period)
+
+def get_nat_traffic(gateways):
+    """
+    Get the monthly traffic of a batch of NAT gateways
+    """
+    batch = MetricBatch(cloudwatch_client)
+    for nat in gateways:
+        queue_nat_metrics(batch, nat['NatGatewayId'])
+    
+    return monthly_traffic(batch.execute(), batch.lookback_days)
+
+def get_rds_connections(db_ids):
+    """
+    Get RDS connection statistics for a set of databases
+    """
+    batch = MetricBatch(cloudwatch_client)
+    for db_id in db_ids:
+        batch.add(
+            db_id,
+            'AWS/RDS',
+            'DatabaseConnections',
+            [{'Name': 'DBInstanceIdentifier', 'Value': db_id}]
         )
-        
-        if response['Datapoints']:
-            avg = sum(d['Average'] for d in response['Datapoints']) / len(response['Datapoints'])
-            max_val = max(d['Maximum'] for d in response['Datapoints'])
-            return {'average': avg, 'max': max_val}
-            
-    except Exception as e:
-        logger.error(f"Error getting RDS stats for {db_id}: {str(e)}")
     
-    return None
+    connection_stats = {}
+    for db_id, metrics in batch.execute().items():
+        stats = metrics.get('DatabaseConnections', {})
+        if 'Average' in stats and 'Maximum' in stats:
+            connection_stats[db_id] = {'average': stats['Average'], 'max': stats['Maximum']}
+    
+    return connection_stats
 
-def estimate_downsize_savings(instance_type):
+def unit_price(service, resource_type, attribute='hourly', default=None):
+    """
+    On-demand unit price of a resource type in the region being analyzed
+    """
+    return price_catalog.price(service, current_target().region, resource_type, attribute, default)
+
+def estimate_downsize_savings(instance_type, target_type):
     """
     Estimate savings from downsizing EC2 instance
     """
-    # Simplified pricing model
-    hourly_costs = {
-        't3.micro': 0.0104, 't3.small': 0.0208, 't3.medium': 0.0416,
-        't3.large': 0.0832, 't3.xlarge': 0.1664, 't3.2xlarge': 0.3328,
-        't4g.micro': 0.0084, 't4g.small': 0.0168, 't4g.medium': 0.0336,
-        't4g.large': 0.0672, 't4g.xlarge': 0.1344
-    }
-    
-    current_cost = hourly_costs.get(instance_type, 0.10) * 730  # Monthly
-    suggested_cost = current_cost * 0.5  # Assume 50% reduction
-    return current_cost - suggested_cost
+    current_hourly = unit_price('ec2', instance_type, default=0.10)
+    target_hourly = unit_price('ec2', target_type)
+    if target_hourly is None:
+        # Price scales with size within a family
+        current_size = instance_type.partition('.')[2]
+        target_size = target_type.partition('.')[2]
+        target_hourly = current_hourly * SIZE_FACTORS[target_size] / SIZE_FACTORS[current_size]
+    return (current_hourly - target_hourly) * HOURS_PER_MONTH
 
 def estimate_rds_downsize_savings(db_class):
     """
     Estimate savings from downsizing RDS instance
     """
-    hourly_costs = {
-        'db.t3.micro': 0.017, 'db.t3.small': 0.034, 'db.t3.medium': 0.068,
-        'db.t3.large': 0.136, 'db.t3.xlarge': 0.272,
-        'db.t4g.micro': 0.016, 'db.t4g.small': 0.032, 'db.t4g.medium': 0.065,
-        'db.t4g.large': 0.129, 'db.t4g.xlarge': 0.258
-    }
-    
-    current_cost = hourly_costs.get(db_class, 0.20) * 730
+    current_cost = unit_price('rds', db_class, default=0.20) * HOURS_PER_MONTH
     suggested_cost = current_cost * 0.5
     return current_cost - suggested_cost
 
@@ -429,36 +1161,45 @@ def calculate_total_savings(recommendations):
     """
     Calculate total potential savings
     """
-    return sum(r.get('estimated_savings', 0) for r in recommendations)
+    return recommendations.total_savings()
 
-def generate_report(recommendations, cost_analysis):
+def generate_report(recommendations, cost_analysis, artifact_urls=None):
     """
-    Generate optimization report
+    Generate the optimization summary: totals and the largest savings, bounded in size
     """
-    report = f"""
-Cost Optimization Report - {datetime.utcnow().strftime('%Y-%m-%d')}
-{'=' * 60}
-
-Environment: {os.environ.get('ENVIRONMENT', 'unknown')}
-Total Recommendations: {len(recommendations)}
-Potential Monthly Savings: ${calculate_total_savings(recommendations):,.2f}
-
-Top Recommendations:
-{'-' * 40}
-"""
+    report = io.StringIO()
+    write_text(
+        recommendations,
+        report,
+        os.environ.get('ENVIRONMENT', 'unknown'),
+        top_overall=REPORT_TOP_OVERALL,
+        per_type=REPORT_TOP_PER_TYPE
+    )
     
-    # Group by type
-    by_type = defaultdict(list)
-    for rec in recommendations:
-        by_type[rec['type']].append(rec)
+    if artifact_urls:
+        report.write(f"\nFull Results:\n{'-' * 40}\n")
+        for name, url in artifact_urls.items():
+            report.write(f"  - {name}: {url}\n")
     
-    for rec_type, items in by_type.items():
-        total = sum(r.get('estimated_savings', 0) for r in items)
-        report += f"\n{rec_type}: {len(items)} items (${total:,.2f}/month)\n"
-        for item in items[:3]:  # Top 3
-            report += f"  - {item['resource_id']}: {item['recommendation']}\n"
+    return report.getvalue()
+
+def publish_artifacts(recommendations):
+    """
+    Upload the full report, JSON Lines and gzip CSV to REPORT_URI and return their URLs
+    """
+    report_uri = os.environ.get('REPORT_URI')
+    if not report_uri:
+        return {}
     
-    return report
+    try:
+        environment = os.environ.get('ENVIRONMENT', 'unknown')
+        prefix = f"{environment}/{datetime.utcnow().strftime('%Y-%m-%d/%H%M%S')}"
+        urls = write_artifacts(recommendations, store_from_uri(report_uri), prefix, environment)
+        logger.info(f"Uploaded {len(recommendations)} recommendations to {report_uri}/{prefix}")
+        return urls
+    except Exception as e:
+        logger.error(f"Failed to upload report artifacts: {str(e)}")
+        return {}
 
 def send_notification(report):
     """
@@ -470,7 +1211,7 @@ def send_notification(report):
             sns_client.publish(
                 TopicArn=sns_topic,
                 Subject=f"Cost Optimization Report - {os.environ.get('ENVIRONMENT')}",
-                Message=report
+                Message=bounded_message(report)
             )
             logger.info("Cost optimization report sent")
     except Exception as e:
@@ -481,18 +1222,20 @@ def estimate_reservation_savings(instance_type):
     Estimate savings from Reserved Instances
     """
     # Assume 30% savings with 1-year commitment
-    hourly_costs = {'t3.large': 0.0832, 't3.xlarge': 0.1664}
-    monthly_cost = hourly_costs.get(instance_type, 0.10) * 730
+    monthly_cost = unit_price('ec2', instance_type, default=0.10) * HOURS_PER_MONTH
     return monthly_cost * 0.30
 
 def estimate_multi_az_savings(db_class):
     """
     Estimate savings from disabling Multi-AZ
     """
+    single_az = unit_price('rds', db_class, default=0.20)
+    multi_az = unit_price('rds', db_class, 'multi_az_hourly')
+    if multi_az:
+        return (multi_az - single_az) * HOURS_PER_MONTH
+    
     # Multi-AZ roughly doubles the cost
-    hourly_costs = {'db.t3.large': 0.136, 'db.t3.xlarge': 0.272}
-    monthly_cost = hourly_costs.get(db_class, 0.20) * 730
-    return monthly_cost * 0.5
+    return single_az * HOURS_PER_MONTH * 0.5
 
 def calculate_ebs_cost(volume):
     """
@@ -500,19 +1243,21 @@ def calculate_ebs_cost(volume):
     """
     size_gb = volume['Size']
     volume_type = volume['VolumeType']
-    costs_per_gb = {'gp2': 0.10, 'gp3': 0.08, 'io1': 0.125, 'io2': 0.125}
-    return size_gb * costs_per_gb.get(volume_type, 0.10)
+    return size_gb * unit_price('ebs', volume_type, 'gb_month', default=0.10)
 
-def calculate_gp3_savings(volume):
+def calculate_gp3_savings(volume, iops=GP3_BASELINE_IOPS, throughput=GP3_BASELINE_THROUGHPUT):
     """
-    Calculate savings from gp2 to gp3 conversion
+    Calculate savings from gp2 to gp3 conversion, paying for IOPS and throughput above the gp3 baseline
     """
     size_gb = volume['Size']
-    return size_gb * 0.02  # $0.02/GB/month savings
+    gp2 = unit_price('ebs', 'gp2', 'gb_month', default=0.10)
+    gp3 = unit_price('ebs', 'gp3', 'gb_month', default=0.08)
+    extra_iops = max(0, iops - GP3_BASELINE_IOPS) * unit_price('ebs', 'gp3', 'iops_month', default=0.005)
+    extra_throughput = max(0, throughput - GP3_BASELINE_THROUGHPUT) * unit_price('ebs', 'gp3', 'throughput_month', default=0.04)
+    return size_gb * (gp2 - gp3) - extra_iops - extra_throughput
 
-def calculate_snapshot_cost(snapshot):
+def calculate_snapshot_cost(size_gb):
     """
     Calculate snapshot storage cost
     """
-    size_gb = snapshot.get('VolumeSize', 0)
-    return size_gb * 0.05  # $0.05/GB/month for snapshots
\ No newline at end of file
+    return size_gb * unit_price('ebs', 'snapshot', 'gb_month', default=0.05)
@@ -0,0 +1,93 @@
+"""
+Multi-Account Fan-out
+Assumes roles into target accounts and runs work per (account, region) in parallel
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from aws_clients import Target, default_client, default_target, run_in_target, session_for
+from scheduler import run_tasks
+
+logger = logging.getLogger()
+
+# Refresh assumed-role credentials this long before they expire
+CREDENTIAL_REFRESH_MARGIN = timedelta(minutes=5)
+
+class CredentialCache:
+    """
+    Caches STS assume-role credentials per role ARN until shortly before expiry
+    """
+
+    def __init__(self, session_name='diagnyx-cost-optimizer'):
+        self.session_name = session_name
+        self.credentials = {}
+        self.lock = threading.Lock()
+
+    def get(self, role_arn):
+        """
+        Return valid credentials for role_arn, assuming the role if needed
+        """
+        with self.lock:
+            cached = self.credentials.get(role_arn)
+            if cached and cached['Expiration'] - CREDENTIAL_REFRESH_MARGIN > datetime.now(timezone.utc):
+                return cached
+
+            response = default_client('sts').assume_role(
+                RoleArn=role_arn,
+                RoleSessionName=self.session_name
+            )
+            self.credentials[role_arn] = response['Credentials']
+            return response['Credentials']
+
+    def target(self, account_id, region, role_name):
+        """
+        Build a Target backed by the assumed role in account_id
+        """
+        credentials = self.get(f"arn:aws:iam::{account_id}:role/{role_name}")
+        session = session_for(
+            aws_access_key_id=credentials['AccessKeyId'],
+            aws_secret_access_key=credentials['SecretAccessKey'],
+            aws_session_token=credentials['SessionToken'],
+            region_name=region
+        )
+        return Target(session, account_id=account_id, region=region)
+
+# Shared across warm invocations so credentials are reused until they expire
+credential_cache = CredentialCache()
+
+def load_targets():
+    """
+    Read (account_id, region) pairs from TARGET_ACCOUNTS and TARGET_REGIONS
+    """
+    accounts = json.loads(os.environ.get('TARGET_ACCOUNTS', '[]'))
+    regions = [r.strip() for r in os.environ.get('TARGET_REGIONS', '').split(',') if r.strip()]
+    if not regions:
+        regions = [default_target.region]
+    return [(account_id, region) for account_id in accounts for region in regions]
+
+def fan_out(targets, func, max_workers=1, timeout=None):
+    """
+    Run func(account_id, region) once per target and return [(account_id, region, result)] in target order.
+
+    A target whose role cannot be assumed or whose run fails yields None.
+    """
+    role_name = os.environ.get('TARGET_ROLE_NAME', 'OrganizationAccountAccessRole')
+
+    def run_target(account_id, region):
+        target = credential_cache.target(account_id, region, role_name)
+        return run_in_target(target, func, account_id, region)
+
+    tasks = [
+        (f"{account_id}/{region}", lambda a=account_id, r=region: run_target(a, r), None)
+        for account_id, region in targets
+    ]
+    results = run_tasks(tasks, max_workers=max_workers, timeout=timeout)
+
+    return [
+        (account_id, region, results[f"{account_id}/{region}"])
+        for account_id, region in targets
+    ]
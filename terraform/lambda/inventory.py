@@ -0,0 +1,151 @@
+"""
+Resource Inventory
+Streams AWS resources page by page so analyzers see complete results in bounded memory
+"""
+
+from itertools import islice
+
+from botocore.paginate import TokenEncoder
+
+# Largest page size each describe call accepts
+EC2_INSTANCE_PAGE_SIZE = 1000
+EBS_VOLUME_PAGE_SIZE = 500
+EBS_SNAPSHOT_PAGE_SIZE = 1000
+NAT_GATEWAY_PAGE_SIZE = 1000
+ROUTE_TABLE_PAGE_SIZE = 100
+SUBNET_PAGE_SIZE = 1000
+VPC_ENDPOINT_PAGE_SIZE = 1000
+RDS_INSTANCE_PAGE_SIZE = 100
+
+def paginate_items(client, operation, page_items, page_size, cursor=None, token_key='NextToken', **params):
+    """
+    Yield the items of every page of a describe call.
+
+    With a cursor (see checkpoint.StreamCursor) the stream resumes from the cursor's
+    position and reports each page so progress can be saved between invocations.
+    """
+    config = {'PageSize': page_size}
+    skip = 0
+    if cursor:
+        if cursor.done:
+            return
+        if cursor.token:
+            config['StartingToken'] = cursor.token
+        skip = cursor.offset
+
+    paginator = client.get_paginator(operation)
+    for page in paginator.paginate(**params, PaginationConfig=config):
+        items = page_items(page)
+        if cursor:
+            next_token = page.get(token_key)
+            cursor.page_fetched(
+                len(items),
+                TokenEncoder().encode({token_key: next_token}) if next_token else None
+            )
+        yield from items[skip:]
+        skip = 0
+
+def iter_instances(ec2_client, filters=None, cursor=None):
+    """
+    Yield EC2 instances matching the given filters
+    """
+    return paginate_items(
+        ec2_client, 'describe_instances',
+        lambda page: [instance for reservation in page['Reservations'] for instance in reservation['Instances']],
+        EC2_INSTANCE_PAGE_SIZE, cursor,
+        Filters=filters or []
+    )
+
+def iter_volumes(ec2_client, filters=None, cursor=None):
+    """
+    Yield EBS volumes matching the given filters
+    """
+    return paginate_items(
+        ec2_client, 'describe_volumes', lambda page: page['Volumes'],
+        EBS_VOLUME_PAGE_SIZE, cursor,
+        Filters=filters or []
+    )
+
+def iter_snapshots(ec2_client, owner_ids=('self',), filters=None, cursor=None):
+    """
+    Yield EBS snapshots owned by the given accounts
+    """
+    return paginate_items(
+        ec2_client, 'describe_snapshots', lambda page: page['Snapshots'],
+        EBS_SNAPSHOT_PAGE_SIZE, cursor,
+        OwnerIds=list(owner_ids), Filters=filters or []
+    )
+
+def iter_nat_gateways(ec2_client, filters=None, cursor=None):
+    """
+    Yield NAT gateways matching the given filters
+    """
+    return paginate_items(
+        ec2_client, 'describe_nat_gateways', lambda page: page['NatGateways'],
+        NAT_GATEWAY_PAGE_SIZE, cursor,
+        Filter=filters or []
+    )
+
+def iter_route_tables(ec2_client, filters=None, cursor=None):
+    """
+    Yield VPC route tables matching the given filters
+    """
+    return paginate_items(
+        ec2_client, 'describe_route_tables', lambda page: page['RouteTables'],
+        ROUTE_TABLE_PAGE_SIZE, cursor,
+        Filters=filters or []
+    )
+
+def iter_subnets(ec2_client, filters=None, cursor=None):
+    """
+    Yield VPC subnets matching the given filters
+    """
+    return paginate_items(
+        ec2_client, 'describe_subnets', lambda page: page['Subnets'],
+        SUBNET_PAGE_SIZE, cursor,
+        Filters=filters or []
+    )
+
+def iter_vpc_endpoints(ec2_client, filters=None, cursor=None):
+    """
+    Yield VPC endpoints matching the given filters
+    """
+    return paginate_items(
+        ec2_client, 'describe_vpc_endpoints', lambda page: page['VpcEndpoints'],
+        VPC_ENDPOINT_PAGE_SIZE, cursor,
+        Filters=filters or []
+    )
+
+def iter_db_instances(rds_client, filters=None, cursor=None):
+    """
+    Yield RDS DB instances matching the given filters
+    """
+    return paginate_items(
+        rds_client, 'describe_db_instances', lambda page: page['DBInstances'],
+        RDS_INSTANCE_PAGE_SIZE, cursor, token_key='Marker',
+        Filters=filters or []
+    )
+
+def iter_buckets(s3_client, cursor=None):
+    """
+    Yield S3 buckets; ListBuckets returns every bucket of the account in one response
+    """
+    if cursor and cursor.done:
+        return
+    buckets = s3_client.list_buckets().get('Buckets', [])
+    skip = 0
+    if cursor:
+        cursor.page_fetched(len(buckets), None)
+        skip = cursor.offset
+    yield from buckets[skip:]
+
+def batched(iterable, size):
+    """
+    Group an iterable into lists of at most `size` items
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
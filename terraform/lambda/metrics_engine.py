@@ -0,0 +1,93 @@
+"""
+CloudWatch Metrics Engine
+Batches per-resource metric queries into GetMetricData requests
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger()
+
+# GetMetricData accepts at most 500 queries per request
+MAX_QUERIES_PER_REQUEST = 500
+
+# How each CloudWatch statistic is reduced across the returned datapoints
+STAT_REDUCERS = {
+    'Average': lambda values: sum(values) / len(values),
+    'Maximum': max,
+    'Minimum': min,
+    'Sum': sum,
+    'SampleCount': sum
+}
+
+class MetricBatch:
+    """
+    Collects metric queries for many resources and resolves them in bulk
+    """
+
+    def __init__(self, cloudwatch_client, period=3600, lookback_days=7):
+        self.cloudwatch_client = cloudwatch_client
+        self.period = period
+        self.lookback_days = lookback_days
+        self.queries = []
+        self.targets = {}
+
+    def add(self, resource_id, namespace, metric_name, dimensions, stats=('Average', 'Maximum')):
+        """
+        Queue one query per statistic for a resource metric
+        """
+        for stat in stats:
+            query_id = f"q{len(self.queries)}"
+            self.queries.append({
+                'Id': query_id,
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': namespace,
+                        'MetricName': metric_name,
+                        'Dimensions': dimensions
+                    },
+                    'Period': self.period,
+                    'Stat': stat
+                },
+                'ReturnData': True
+            })
+            self.targets[query_id] = (resource_id, metric_name, stat)
+
+    def execute(self, reduce=True):
+        """
+        Run all queued queries and return {resource_id: {metric_name: {stat: value}}}.
+        With reduce=False each value is the raw list of datapoints instead.
+        """
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(days=self.lookback_days)
+        values_by_query = {}
+
+        for offset in range(0, len(self.queries), MAX_QUERIES_PER_REQUEST):
+            chunk = self.queries[offset:offset + MAX_QUERIES_PER_REQUEST]
+            try:
+                paginator = self.cloudwatch_client.get_paginator('get_metric_data')
+                for page in paginator.paginate(
+                    MetricDataQueries=chunk,
+                    StartTime=start_time,
+                    EndTime=end_time
+                ):
+                    for result in page['MetricDataResults']:
+                        values_by_query.setdefault(result['Id'], []).extend(result['Values'])
+            except Exception as e:
+                logger.error(f"Error fetching metric data batch at offset {offset}: {str(e)}")
+
+        return self._collect(values_by_query, reduce)
+
+    def _collect(self, values_by_query, reduce):
+        """
+        Group datapoints by resource, metric and statistic, optionally collapsing each to one value
+        """
+        stats = {}
+        for query_id, values in values_by_query.items():
+            if not values:
+                continue
+            resource_id, metric_name, stat = self.targets[query_id]
+            if reduce:
+                values = STAT_REDUCERS.get(stat, STAT_REDUCERS['Average'])(values)
+            stats.setdefault(resource_id, {}).setdefault(metric_name, {})[stat] = values
+        return stats
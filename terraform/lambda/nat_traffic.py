@@ -0,0 +1,69 @@
+"""
+NAT Gateway Traffic
+Monthly bytes processed per NAT gateway from CloudWatch, and how much of it
+crosses Availability Zones on the way to the gateway
+"""
+
+from collections import defaultdict
+
+# Bytes in a GB as billed for data processing and transfer
+GB = 1024 ** 3
+
+# Average days in a month, for extrapolating the lookback window
+DAYS_PER_MONTH = 30.4
+
+# Hourly byte sums queued per gateway; processing is billed on the bytes that enter it
+NAT_METRICS = ('BytesInFromSource', 'BytesInFromDestination', 'BytesOutToDestination', 'BytesOutToSource')
+
+# Queries queued per gateway by queue_nat_metrics
+QUERIES_PER_NAT_GATEWAY = len(NAT_METRICS)
+
+def queue_nat_metrics(batch, nat_gateway_id):
+    """
+    Queue the hourly byte sums of a NAT gateway
+    """
+    dimensions = [{'Name': 'NatGatewayId', 'Value': nat_gateway_id}]
+    for metric_name in NAT_METRICS:
+        batch.add(nat_gateway_id, 'AWS/NATGateway', metric_name, dimensions, stats=('Sum',))
+
+def monthly_traffic(series, lookback_days):
+    """
+    {nat_gateway_id: {'processed_gb', 'source_gb'}} per month, extrapolated from the lookback
+    window. source_gb is the traffic between the gateway and the instances using it, both
+    ways, which is what crosses AZs when they are in another zone.
+    """
+    traffic = {}
+    scale = DAYS_PER_MONTH / lookback_days / GB
+    for nat_gateway_id, metrics in series.items():
+        def total(metric_name):
+            return metrics.get(metric_name, {}).get('Sum', 0) * scale
+        traffic[nat_gateway_id] = {
+            'processed_gb': total('BytesInFromSource') + total('BytesInFromDestination'),
+            'source_gb': total('BytesInFromSource') + total('BytesOutToSource')
+        }
+    return traffic
+
+def cross_az_routing(route_tables, zone_by_subnet, zone_by_gateway):
+    """
+    {nat_gateway_id: (share of the subnets routed through it that are in another AZ, those AZs)}.
+
+    Route tables without explicit subnet associations (main route tables) are skipped,
+    since the subnets they serve are not listed.
+    """
+    subnets_by_gateway = defaultdict(set)
+    for route_table in route_tables:
+        gateways = {route['NatGatewayId'] for route in route_table.get('Routes', []) if route.get('NatGatewayId')}
+        subnets = {
+            association['SubnetId'] for association in route_table.get('Associations', [])
+            if association.get('SubnetId')
+        }
+        for nat_gateway_id in gateways:
+            subnets_by_gateway[nat_gateway_id] |= subnets
+
+    routing = {}
+    for nat_gateway_id, subnets in subnets_by_gateway.items():
+        zones = [zone_by_subnet[subnet_id] for subnet_id in subnets if subnet_id in zone_by_subnet]
+        if zones and nat_gateway_id in zone_by_gateway:
+            remote = [zone for zone in zones if zone != zone_by_gateway[nat_gateway_id]]
+            routing[nat_gateway_id] = (len(remote) / len(zones), set(remote))
+    return routing
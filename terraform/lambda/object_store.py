@@ -0,0 +1,212 @@
+"""
+Object Store
+Small key/value blob store backed by S3, with a local directory stand-in
+"""
+
+import io
+import os
+from contextlib import contextmanager
+
+from aws_clients import default_client
+
+# Parts of a streamed S3 upload; every part but the last must be at least 5 MiB
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+
+class LocalObjectStore:
+    """
+    Stores objects as files under a root directory
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def get(self, key):
+        """
+        Return the bytes stored under key, or None
+        """
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        """
+        Atomically write bytes under key
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def open_write(self, key):
+        """
+        Binary stream whose contents appear under key, atomically, when the block exits
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                yield f
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def delete(self, key):
+        """
+        Remove key if present
+        """
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key):
+        """
+        Link to the object under key
+        """
+        return f"file://{self._path(key)}"
+
+class S3ObjectStore:
+    """
+    Stores objects in an S3 bucket under a key prefix
+    """
+
+    def __init__(self, s3_client, bucket, prefix=''):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def get(self, key):
+        """
+        Return the bytes stored under key, or None
+        """
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self._key(key))
+            return response['Body'].read()
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+
+    def put(self, key, data):
+        """
+        Write bytes under key
+        """
+        self.s3_client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    @contextmanager
+    def open_write(self, key, part_size=MULTIPART_PART_SIZE):
+        """
+        Binary stream uploaded to key as it is written, in multipart chunks of part_size.
+        The object appears when the block exits; on error the upload is aborted.
+        """
+        upload = MultipartUpload(self.s3_client, self.bucket, self._key(key), part_size)
+        stream = io.BufferedWriter(upload, buffer_size=part_size)
+        try:
+            yield stream
+            stream.flush()
+            upload.complete()
+        except BaseException:
+            upload.abort()
+            raise
+
+    def delete(self, key):
+        """
+        Remove key if present
+        """
+        self.s3_client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def url(self, key):
+        """
+        S3 console link to the object under key
+        """
+        return f"https://s3.console.aws.amazon.com/s3/object/{self.bucket}?prefix={self._key(key)}"
+
+class MultipartUpload(io.RawIOBase):
+    """
+    Writable stream that uploads to S3 in parts, holding at most one part in memory.
+    Small objects are sent with a single PutObject.
+    """
+
+    def __init__(self, s3_client, bucket, key, part_size=MULTIPART_PART_SIZE):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(self.buffer[:self.part_size])
+            del self.buffer[:self.part_size]
+        return len(data)
+
+    def _upload_part(self, data):
+        if self.upload_id is None:
+            self.upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key
+            )['UploadId']
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            PartNumber=part_number, Body=bytes(data)
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+    def complete(self):
+        """
+        Upload what is left and finish the object
+        """
+        if self.upload_id is None:
+            self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+        else:
+            if self.buffer:
+                self._upload_part(self.buffer)
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={'Parts': self.parts}
+            )
+        self.buffer = bytearray()
+
+    def abort(self):
+        """
+        Discard uploaded parts
+        """
+        if self.upload_id is not None:
+            try:
+                self.s3_client.abort_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+                )
+            except Exception:
+                pass  # The bucket's incomplete-upload lifecycle rule cleans up
+            self.upload_id = None
+        self.buffer = bytearray()
+
+def store_from_uri(uri):
+    """
+    Build a store from s3://bucket/prefix or a local directory path
+    """
+    if uri.startswith('s3://'):
+        bucket, _, prefix = uri[len('s3://'):].partition('/')
+        return S3ObjectStore(default_client('s3'), bucket, prefix)
+    if uri.startswith('file://'):
+        uri = uri[len('file://'):]
+    return LocalObjectStore(uri)
@@ -0,0 +1,243 @@
+"""
+Price Catalog
+Indexed on-demand prices loaded from the AWS Pricing API and cached as a snapshot
+"""
+
+import json
+import logging
+import threading
+import time
+
+from aws_clients import default_client
+
+logger = logging.getLogger()
+
+# Snapshots older than this are refreshed from the Pricing API
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+# The Pricing API is only served from a few regions
+PRICING_API_REGION = 'us-east-1'
+
+# After a failed Pricing API fetch, a warm container tries again after this long
+FETCH_RETRY_SECONDS = 15 * 60
+
+# us-east-1 list prices used when the Pricing API is unavailable
+# Keys are (service, type, attribute); hourly prices in USD, storage in USD per GB-month
+BUILTIN_PRICES = {
+    ('ec2', 't3.micro', 'hourly'): 0.0104, ('ec2', 't3.small', 'hourly'): 0.0208,
+    ('ec2', 't3.medium', 'hourly'): 0.0416, ('ec2', 't3.large', 'hourly'): 0.0832,
+    ('ec2', 't3.xlarge', 'hourly'): 0.1664, ('ec2', 't3.2xlarge', 'hourly'): 0.3328,
+    ('ec2', 't4g.micro', 'hourly'): 0.0084, ('ec2', 't4g.small', 'hourly'): 0.0168,
+    ('ec2', 't4g.medium', 'hourly'): 0.0336, ('ec2', 't4g.large', 'hourly'): 0.0672,
+    ('ec2', 't4g.xlarge', 'hourly'): 0.1344,
+    ('rds', 'db.t3.micro', 'hourly'): 0.017, ('rds', 'db.t3.small', 'hourly'): 0.034,
+    ('rds', 'db.t3.medium', 'hourly'): 0.068, ('rds', 'db.t3.large', 'hourly'): 0.136,
+    ('rds', 'db.t3.xlarge', 'hourly'): 0.272,
+    ('rds', 'db.t4g.micro', 'hourly'): 0.016, ('rds', 'db.t4g.small', 'hourly'): 0.032,
+    ('rds', 'db.t4g.medium', 'hourly'): 0.065, ('rds', 'db.t4g.large', 'hourly'): 0.129,
+    ('rds', 'db.t4g.xlarge', 'hourly'): 0.258,
+    ('ebs', 'gp2', 'gb_month'): 0.10, ('ebs', 'gp3', 'gb_month'): 0.08,
+    ('ebs', 'io1', 'gb_month'): 0.125, ('ebs', 'io2', 'gb_month'): 0.125,
+    ('ebs', 'snapshot', 'gb_month'): 0.05,
+    ('ebs', 'gp3', 'iops_month'): 0.005, ('ebs', 'gp3', 'throughput_month'): 0.04,
+    ('ec2', 'nat-gateway', 'hourly'): 0.045, ('ec2', 'nat-gateway', 'gb_processed'): 0.045,
+    # Inter-AZ transfer within a region, billed on both sides ($0.01/GB each)
+    ('ec2', 'data-transfer', 'cross_az_gb'): 0.02
+}
+
+def _ec2_instance_key(attributes):
+    return ('ec2', attributes['instanceType'], 'hourly')
+
+def _rds_instance_key(attributes):
+    attribute = 'multi_az_hourly' if attributes.get('deploymentOption') == 'Multi-AZ' else 'hourly'
+    return ('rds', attributes['instanceType'], attribute)
+
+def _ebs_key(attributes):
+    if attributes.get('productFamily') == 'Storage Snapshot':
+        # Skip fast snapshot restore, archive tier, etc.
+        if not attributes.get('usagetype', '').endswith('EBS:SnapshotUsage'):
+            return None
+        return ('ebs', 'snapshot', 'gb_month')
+    return ('ebs', attributes['volumeApiName'], 'gb_month')
+
+def _ebs_performance_key(attributes):
+    # Provisioned gp3 IOPS (per IOPS-month) and throughput (per MiB/s-month)
+    if attributes.get('volumeApiName') != 'gp3':
+        return None
+    attribute = 'iops_month' if attributes.get('productFamily') == 'System Operation' else 'throughput_month'
+    return ('ebs', 'gp3', attribute)
+
+def _nat_gateway_key(attributes):
+    attribute = 'gb_processed' if 'Bytes' in attributes.get('usagetype', '') else 'hourly'
+    return ('ec2', 'nat-gateway', attribute)
+
+# Pricing API queries that feed the catalog: (service code, filters, product -> key or None)
+PRICING_QUERIES = [
+    ('AmazonEC2', {
+        'productFamily': 'Compute Instance', 'operatingSystem': 'Linux', 'tenancy': 'Shared',
+        'preInstalledSw': 'NA', 'capacitystatus': 'Used'
+    }, _ec2_instance_key),
+    ('AmazonRDS', {
+        'productFamily': 'Database Instance', 'databaseEngine': 'PostgreSQL'
+    }, _rds_instance_key),
+    ('AmazonEC2', {'productFamily': 'Storage'}, _ebs_key),
+    ('AmazonEC2', {'productFamily': 'Storage Snapshot'}, _ebs_key),
+    ('AmazonEC2', {'productFamily': 'System Operation', 'volumeApiName': 'gp3'}, _ebs_performance_key),
+    ('AmazonEC2', {'productFamily': 'Provisioned Throughput', 'volumeApiName': 'gp3'}, _ebs_performance_key),
+    ('AmazonEC2', {'productFamily': 'NAT Gateway'}, _nat_gateway_key)
+]
+
+class PriceCatalog:
+    """
+    (service, region, type, attribute) -> price lookups served from memory
+    """
+
+    def __init__(self, store=None, ttl_seconds=DEFAULT_TTL_SECONDS, pricing_client=None):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.pricing_client = pricing_client
+        self.prices = {}
+        self.loaded_regions = set()
+        # Regions served from builtin or stale prices after a failed fetch -> when to try again
+        self.retry_at = {}
+        self.lock = threading.Lock()
+
+    def price(self, service, region, resource_type, attribute='hourly', default=None):
+        """
+        Return the on-demand price for a resource type in a region
+        """
+        if region not in self.loaded_regions or self._retry_due(region):
+            self.load_region(region)
+        key = (service, region, resource_type, attribute)
+        if key in self.prices:
+            return self.prices[key]
+        return BUILTIN_PRICES.get((service, resource_type, attribute), default)
+
+    def types(self, service, region, attribute='hourly'):
+        """
+        Resource types with a known price in a region, from the catalog and the builtin prices
+        """
+        if region not in self.loaded_regions or self._retry_due(region):
+            self.load_region(region)
+        known = {key[1] for key in BUILTIN_PRICES if key[0] == service and key[2] == attribute}
+        known.update(
+            key[2] for key in list(self.prices)
+            if key[0] == service and key[1] == region and key[3] == attribute
+        )
+        return known
+
+    def load_region(self, region):
+        """
+        Load a region's prices from the snapshot, refreshing it from the Pricing API when stale
+        """
+        with self.lock:
+            if region in self.loaded_regions and not self._retry_due(region):
+                return
+
+            snapshot = self._read_snapshot(region)
+            if snapshot is None or time.time() - snapshot['loaded_at'] > self.ttl_seconds:
+                fetched = self._fetch_region(region)
+                if fetched:
+                    snapshot = {'loaded_at': time.time(), 'prices': fetched}
+                    self._write_snapshot(region, snapshot)
+                    self.retry_at.pop(region, None)
+                else:
+                    self.retry_at[region] = time.time() + FETCH_RETRY_SECONDS
+            else:
+                self.retry_at.pop(region, None)
+
+            if snapshot:
+                self._apply_snapshot(region, snapshot)
+            self.loaded_regions.add(region)
+
+    def preload(self, region):
+        """
+        Load a region's prices from a fresh snapshot without calling the Pricing API.
+        A missing or stale snapshot is left to the first lookup, which refreshes it.
+        """
+        with self.lock:
+            if region in self.loaded_regions:
+                return
+            snapshot = self._read_snapshot(region)
+            if snapshot is None or time.time() - snapshot['loaded_at'] > self.ttl_seconds:
+                return
+            self._apply_snapshot(region, snapshot)
+            self.loaded_regions.add(region)
+
+    def _apply_snapshot(self, region, snapshot):
+        for compact_key, value in snapshot['prices'].items():
+            service, resource_type, attribute = compact_key.split('|')
+            self.prices[(service, region, resource_type, attribute)] = value
+
+    def _retry_due(self, region):
+        retry_at = self.retry_at.get(region)
+        return retry_at is not None and time.time() >= retry_at
+
+    def _fetch_region(self, region):
+        """
+        Build {"service|type|attribute": price} for a region from the Pricing API
+        """
+        client = self.pricing_client or default_client('pricing', PRICING_API_REGION)
+        prices = {}
+        skipped = 0
+        try:
+            paginator = client.get_paginator('get_products')
+            for service_code, attributes, key_for in PRICING_QUERIES:
+                filters = [{'Type': 'TERM_MATCH', 'Field': 'regionCode', 'Value': region}]
+                filters.extend(
+                    {'Type': 'TERM_MATCH', 'Field': field, 'Value': value}
+                    for field, value in attributes.items()
+                )
+                for page in paginator.paginate(ServiceCode=service_code, Filters=filters):
+                    for item in page['PriceList']:
+                        # One malformed product must not cost the whole region its prices
+                        try:
+                            product = json.loads(item)
+                            product_attributes = {
+                                **product['product']['attributes'],
+                                'productFamily': product['product'].get('productFamily')
+                            }
+                            key = key_for(product_attributes)
+                            price = _on_demand_price(product)
+                        except (KeyError, TypeError, ValueError):
+                            skipped += 1
+                            continue
+                        if key and price:
+                            prices['|'.join(key)] = price
+        except Exception as e:
+            logger.error(f"Error loading prices for {region} from the Pricing API: {str(e)}")
+            return None
+
+        if skipped:
+            logger.warning(f"Skipped {skipped} malformed Pricing API products for {region}")
+        logger.info(f"Loaded {len(prices)} prices for {region} from the Pricing API")
+        return prices
+
+    def _read_snapshot(self, region):
+        if not self.store:
+            return None
+        try:
+            data = self.store.get(f"price-catalog/{region}.json")
+            return json.loads(data) if data else None
+        except Exception as e:
+            logger.warning(f"Could not read price snapshot for {region}: {str(e)}")
+            return None
+
+    def _write_snapshot(self, region, snapshot):
+        if not self.store:
+            return
+        try:
+            self.store.put(f"price-catalog/{region}.json", json.dumps(snapshot).encode())
+        except Exception as e:
+            logger.warning(f"Could not write price snapshot for {region}: {str(e)}")
+
+def _on_demand_price(product):
+    """
+    First non-zero USD on-demand price in a Pricing API product
+    """
+    for term in product.get('terms', {}).get('OnDemand', {}).values():
+        for dimension in term['priceDimensions'].values():
+            price = float(dimension['pricePerUnit'].get('USD', 0))
+            if price > 0:
+                return price
+    return None
@@ -0,0 +1,181 @@
+"""
+API Rate Limiter
+Adaptive token buckets per (service, operation), shared by every client and thread in the process
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger()
+
+# Requests per second each operation starts at and never exceeds (API_RATE_LIMIT overrides)
+DEFAULT_RATE = 20.0
+
+# Lowest rate an operation is slowed to while it keeps being throttled
+MIN_RATE = 0.5
+
+# Rate multiplier applied on throttling
+BACKOFF = 0.5
+
+# Throttles within this many seconds of a slowdown are the same overload and don't slow down again
+BACKOFF_INTERVAL = 1.0
+
+# Error codes services return when a request is throttled. LimitExceededException is left
+# out: services also use it for quota errors (e.g. too many resources) that retrying won't fix.
+THROTTLING_CODES = frozenset([
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+    'TooManyRequestsException', 'RequestLimitExceeded', 'RequestThrottled', 'SlowDown',
+    'ProvisionedThroughputExceededException', 'BandwidthLimitExceeded',
+    'PriorRequestNotComplete', 'EC2ThrottledException'
+])
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second, holding at most one second of tokens.
+
+    Callers that find it empty sleep until the next token is due and check again,
+    so a slowdown also applies to threads that are already waiting. Throttling
+    halves the rate, at most once per BACKOFF_INTERVAL; each success adds 1/rate,
+    about +1 req/s for every second spent at full rate, until the configured rate
+    is reached again.
+    """
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.max_rate = rate
+        self.rate = rate
+        self.tokens = max(1.0, rate)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.backed_off = None
+        self.throttles = 0
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Take one token, sleeping until it is available. Returns the seconds waited.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.waited += waited
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+            waited += wait
+
+    def throttled(self):
+        """
+        Slow down after a throttling response and drop any saved-up burst
+        """
+        with self.lock:
+            self.throttles += 1
+            self._refill()
+            if self.backed_off is not None and self.updated - self.backed_off < BACKOFF_INTERVAL:
+                return
+            self.backed_off = self.updated
+            self.rate = max(MIN_RATE, self.rate * BACKOFF)
+            self.tokens = 0.0
+
+    def succeeded(self):
+        """
+        Speed back up towards the configured rate after a successful response
+        """
+        with self.lock:
+            if self.rate < self.max_rate:
+                self._refill()
+                self.rate = min(self.max_rate, self.rate + 1 / self.rate)
+
+class AdaptiveRateLimiter:
+    """
+    One TokenBucket per service operation, driven by botocore events.
+
+    A token is taken before every HTTP attempt (retries included), and responses
+    feed back through needs-retry, which botocore emits for every response. Rates are
+    keyed like 'ec2' or 'ec2.DescribeInstances', using the event names' service ids.
+    A rate of 0 leaves that service or operation unlimited.
+    """
+
+    def __init__(self, default_rate=DEFAULT_RATE, rates=None, clock=time.monotonic, sleep=time.sleep):
+        self.default_rate = default_rate
+        self.rates = rates or {}
+        self.clock = clock
+        self.sleep = sleep
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_environ(cls):
+        """
+        Limiter configured by API_RATE_LIMIT (default req/s) and API_RATE_LIMITS
+        (JSON of per-service or per-operation overrides)
+        """
+        return cls(
+            float(os.environ.get('API_RATE_LIMIT', DEFAULT_RATE)),
+            json.loads(os.environ.get('API_RATE_LIMITS', '{}'))
+        )
+
+    def bucket(self, operation):
+        """
+        Bucket for an operation ('service.Operation'), or None when it is unlimited
+        """
+        bucket = self.buckets.get(operation)
+        if bucket is None and operation not in self.buckets:
+            with self.lock:
+                if operation not in self.buckets:
+                    service = operation.split('.', 1)[0]
+                    rate = float(self.rates.get(operation, self.rates.get(service, self.default_rate)))
+                    self.buckets[operation] = TokenBucket(rate, self.clock, self.sleep) if rate > 0 else None
+                bucket = self.buckets[operation]
+        return bucket
+
+    def register(self, session):
+        """
+        Hook the limiter into a botocore session; clients created from it afterwards are limited
+        """
+        session.register('before-send', self.before_send, unique_id=f'rate-limiter-send-{id(self)}')
+        session.register('needs-retry', self.after_response, unique_id=f'rate-limiter-retry-{id(self)}')
+
+    def before_send(self, event_name, **kwargs):
+        bucket = self.bucket(_operation(event_name))
+        if bucket:
+            bucket.acquire()
+
+    def after_response(self, event_name, response=None, **kwargs):
+        # No response means a connection error, which says nothing about the rate
+        bucket = self.bucket(_operation(event_name))
+        if not bucket or response is None:
+            return
+        http_response, parsed = response
+        if http_response.status_code == 429 or parsed.get('Error', {}).get('Code') in THROTTLING_CODES:
+            bucket.throttled()
+            logger.debug(f"{_operation(event_name)} throttled, slowing to {bucket.rate:.1f} req/s")
+        elif http_response.status_code < 400:
+            bucket.succeeded()
+
+    def stats(self):
+        """
+        {operation: {'rate', 'throttles', 'waited'}} for every limited operation used so far
+        """
+        with self.lock:
+            buckets = {operation: bucket for operation, bucket in self.buckets.items() if bucket}
+        return {
+            operation: {'rate': bucket.rate, 'throttles': bucket.throttles, 'waited': bucket.waited}
+            for operation, bucket in buckets.items()
+        }
+
+def _operation(event_name):
+    # 'before-send.ec2.DescribeInstances' -> 'ec2.DescribeInstances'
+    return event_name.split('.', 1)[1]
@@ -0,0 +1,184 @@
+"""
+Recommendation Store
+Columnar storage for recommendations with interned type codes and bounded-heap ranking
+"""
+
+import heapq
+import threading
+from array import array
+
+# Fields every recommendation has; anything else is kept as per-row details
+CORE_FIELDS = ('type', 'resource_id', 'recommendation', 'estimated_savings')
+
+# Type name <-> small integer code, shared by every store in the process
+_type_codes = {}
+_type_names = []
+_type_lock = threading.Lock()
+
+def type_code(name):
+    """
+    Interned code for a recommendation type
+    """
+    code = _type_codes.get(name)
+    if code is None:
+        with _type_lock:
+            code = _type_codes.get(name)
+            if code is None:
+                code = len(_type_names)
+                _type_names.append(name)
+                _type_codes[name] = code
+    return code
+
+class Recommendation:
+    """
+    One recommendation read back from a store
+    """
+    __slots__ = ('type', 'resource_id', 'recommendation', 'estimated_savings', 'details')
+
+    def __init__(self, type, resource_id, recommendation, estimated_savings, details=None):
+        self.type = type
+        self.resource_id = resource_id
+        self.recommendation = recommendation
+        self.estimated_savings = estimated_savings
+        self.details = details or {}
+
+    def to_dict(self):
+        return {
+            'type': self.type,
+            'resource_id': self.resource_id,
+            'recommendation': self.recommendation,
+            'estimated_savings': self.estimated_savings,
+            **self.details
+        }
+
+class RecommendationStore:
+    """
+    Append-only recommendations kept as parallel columns.
+
+    Types are stored as 2-byte codes and savings as 8-byte floats. Extra fields are
+    kept as (keys, values) tuples, and repeated strings and key tuples (messages,
+    instance types, account IDs) are pooled so each is stored once. Analyzers append
+    plain dicts, which are not kept.
+    """
+
+    def __init__(self, recommendations=()):
+        self.type_codes = array('H')
+        self.savings = array('d')
+        self.resource_ids = []
+        self.messages = []
+        self.details = []
+        self.pool = {}
+        self.extend(recommendations)
+
+    def _pooled(self, value):
+        if isinstance(value, (str, tuple)):
+            return self.pool.setdefault(value, value)
+        return value
+
+    def append(self, recommendation):
+        """
+        Add a recommendation dict (or Recommendation)
+        """
+        if isinstance(recommendation, Recommendation):
+            recommendation = recommendation.to_dict()
+        self.type_codes.append(type_code(recommendation['type']))
+        self.savings.append(float(recommendation.get('estimated_savings') or 0))
+        self.resource_ids.append(recommendation['resource_id'])
+        self.messages.append(self._pooled(recommendation['recommendation']))
+        extra = [(key, value) for key, value in recommendation.items() if key not in CORE_FIELDS]
+        if extra:
+            keys, values = zip(*extra)
+            self.details.append((self._pooled(keys), tuple(self._pooled(value) for value in values)))
+        else:
+            self.details.append(None)
+
+    def extend(self, recommendations, **details):
+        """
+        Add many recommendations, optionally setting extra details (e.g. account_id) on each
+        """
+        if isinstance(recommendations, RecommendationStore) and not details:
+            self.type_codes.extend(recommendations.type_codes)
+            self.savings.extend(recommendations.savings)
+            self.resource_ids.extend(recommendations.resource_ids)
+            self.messages.extend(recommendations.messages)
+            self.details.extend(recommendations.details)
+            return
+        for recommendation in recommendations:
+            if details:
+                recommendation = {**_as_dict(recommendation), **details}
+            self.append(recommendation)
+
+    def __len__(self):
+        return len(self.type_codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            store = RecommendationStore()
+            store.type_codes = self.type_codes[index]
+            store.savings = self.savings[index]
+            store.resource_ids = self.resource_ids[index]
+            store.messages = self.messages[index]
+            store.details = self.details[index]
+            store.pool = self.pool
+            return store
+        if index < 0:
+            index += len(self)
+        details = self.details[index]
+        return Recommendation(
+            _type_names[self.type_codes[index]],
+            self.resource_ids[index],
+            self.messages[index],
+            self.savings[index],
+            dict(zip(*details)) if details else None
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_dicts(self):
+        return [recommendation.to_dict() for recommendation in self]
+
+    def total_savings(self):
+        return sum(self.savings)
+
+    def summary_by_type(self):
+        """
+        {type: (count, total savings)}, largest total first
+        """
+        counts = {}
+        totals = {}
+        for code, savings in zip(self.type_codes, self.savings):
+            counts[code] = counts.get(code, 0) + 1
+            totals[code] = totals.get(code, 0.0) + savings
+        ranked = sorted(totals, key=totals.get, reverse=True)
+        return {_type_names[code]: (counts[code], totals[code]) for code in ranked}
+
+    def top(self, n):
+        """
+        The n recommendations with the highest savings, highest first
+        """
+        indexes = heapq.nlargest(n, range(len(self)), key=self.savings.__getitem__)
+        return [self[index] for index in indexes]
+
+    def top_by_type(self, n):
+        """
+        {type: the n highest-savings recommendations of that type}, in one pass with
+        one n-sized heap per type
+        """
+        heaps = {}
+        for index, (code, savings) in enumerate(zip(self.type_codes, self.savings)):
+            heap = heaps.setdefault(code, [])
+            # Earlier rows win ties
+            entry = (savings, -index)
+            if len(heap) < n:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+        return {
+            _type_names[code]: [self[-key] for _, key in sorted(heap, reverse=True)]
+            for code, heap in heaps.items()
+        }
+
+def _as_dict(recommendation):
+    return recommendation.to_dict() if isinstance(recommendation, Recommendation) else recommendation
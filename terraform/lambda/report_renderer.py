@@ -0,0 +1,122 @@
+"""
+Report Renderer
+Streams recommendation reports as text, JSON Lines and gzip CSV to any writable stream
+"""
+
+import csv
+import gzip
+import io
+import json
+from contextlib import contextmanager
+from datetime import datetime
+
+# Columns of the CSV export; details a recommendation doesn't have are left empty
+CSV_FIELDS = (
+    'type', 'resource_id', 'recommendation', 'estimated_savings',
+    'current_type', 'target_type', 'account_id', 'region'
+)
+
+# SNS rejects messages above 256 KB
+SNS_MESSAGE_LIMIT = 256 * 1024
+
+@contextmanager
+def text_stream(binary):
+    """
+    UTF-8 text view of a binary stream that leaves the stream open
+    """
+    text = io.TextIOWrapper(binary, encoding='utf-8', newline='')
+    try:
+        yield text
+    finally:
+        text.flush()
+        text.detach()
+
+def format_recommendation(item):
+    """
+    Resource and recommendation text, prefixed with its account/region in fan-out runs
+    """
+    location = f"[{item.details['account_id']}/{item.details['region']}] " if 'account_id' in item.details else ''
+    return f"{location}{item.resource_id}: {item.recommendation}"
+
+def write_text(recommendations, out, environment, top_overall=10, per_type=3):
+    """
+    Write the text report: totals, the largest savings overall, then each type.
+    per_type=None lists every recommendation of each type instead of the top few.
+    """
+    out.write(
+        f"\nCost Optimization Report - {datetime.utcnow().strftime('%Y-%m-%d')}\n"
+        f"{'=' * 60}\n\n"
+        f"Environment: {environment}\n"
+        f"Total Recommendations: {len(recommendations)}\n"
+        f"Potential Monthly Savings: ${recommendations.total_savings():,.2f}\n\n"
+        f"Top Recommendations:\n{'-' * 40}\n"
+    )
+
+    # Largest savings first, overall and within each type
+    for item in recommendations.top(top_overall):
+        out.write(f"  - ${item.estimated_savings:,.2f}/month {item.type} {format_recommendation(item)}\n")
+
+    out.write(f"\nBy Type:\n{'-' * 40}\n")
+    top_by_type = recommendations.top_by_type(per_type) if per_type else None
+    for rec_type, (count, total) in recommendations.summary_by_type().items():
+        out.write(f"\n{rec_type}: {count} items (${total:,.2f}/month)\n")
+        items = top_by_type[rec_type] if top_by_type else (
+            item for item in recommendations if item.type == rec_type
+        )
+        for item in items:
+            out.write(f"  - {format_recommendation(item)}\n")
+
+def write_jsonl(recommendations, out):
+    """
+    Write one JSON object per recommendation
+    """
+    for item in recommendations:
+        out.write(json.dumps(item.to_dict(), default=str))
+        out.write('\n')
+
+def write_csv(recommendations, out):
+    """
+    Write recommendations as CSV with a header row
+    """
+    writer = csv.writer(out)
+    writer.writerow(CSV_FIELDS)
+    for item in recommendations:
+        writer.writerow([
+            item.type, item.resource_id, item.recommendation, f"{item.estimated_savings:.2f}",
+            *(item.details.get(field, '') for field in CSV_FIELDS[4:])
+        ])
+
+def write_artifacts(recommendations, store, prefix, environment):
+    """
+    Stream the full text report, JSON Lines and gzip CSV into an object store.
+    Returns {artifact name: url}.
+    """
+    urls = {}
+
+    key = f"{prefix}/report.txt"
+    with store.open_write(key) as binary, text_stream(binary) as out:
+        write_text(recommendations, out, environment, per_type=None)
+    urls['report'] = store.url(key)
+
+    key = f"{prefix}/recommendations.jsonl"
+    with store.open_write(key) as binary, text_stream(binary) as out:
+        write_jsonl(recommendations, out)
+    urls['jsonl'] = store.url(key)
+
+    key = f"{prefix}/recommendations.csv.gz"
+    with store.open_write(key) as binary:
+        with gzip.GzipFile(fileobj=binary, mode='wb') as compressed, text_stream(compressed) as out:
+            write_csv(recommendations, out)
+    urls['csv'] = store.url(key)
+
+    return urls
+
+def bounded_message(text, limit=SNS_MESSAGE_LIMIT, suffix='\n... truncated, see the full report\n'):
+    """
+    Text cut to at most `limit` UTF-8 bytes, on a line boundary where possible
+    """
+    data = text.encode('utf-8')
+    if len(data) <= limit:
+        return text
+    cut = data[:limit - len(suffix.encode('utf-8'))].decode('utf-8', errors='ignore')
+    return cut[:cut.rfind('\n') + 1 or len(cut)] + suffix
@@ -0,0 +1,232 @@
+"""
+Resource State
+Latest recommendations per resource, persisted between runs, and the resources a change event affects
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from recommendations import RecommendationStore
+
+logger = logging.getLogger()
+
+# Recommendation type prefix -> kind of resource its resource_id names
+KINDS_BY_TYPE_PREFIX = {
+    'EC2_': 'instance',
+    'RDS_': 'database',
+    'EBS_': 'volume',
+    'SNAPSHOT_': 'snapshot',
+    'EIP_': 'address',
+    'NAT_': 'vpc',
+    'RI_': 'account',
+    'COST_': 'service'
+}
+
+# Kinds whose recommendations describe a moment rather than a resource, never stored
+TRANSIENT_KINDS = {'service'}
+
+# Resource ID prefix -> kind, for events that only carry IDs
+KINDS_BY_ID_PREFIX = {
+    'i-': 'instance',
+    'vol-': 'volume',
+    'snap-': 'snapshot',
+    'eipalloc-': 'address'
+}
+
+# CloudTrail EC2/RDS calls that change what a resource's recommendations would be: name -> (kind, deletes)
+CLOUDTRAIL_EVENTS = {
+    'RunInstances': ('instance', False),
+    'StartInstances': ('instance', False),
+    'StopInstances': ('instance', False),
+    'TerminateInstances': ('instance', True),
+    'ModifyInstanceAttribute': ('instance', False),
+    'CreateVolume': ('volume', False),
+    'ModifyVolume': ('volume', False),
+    'AttachVolume': ('volume', False),
+    'DetachVolume': ('volume', False),
+    'DeleteVolume': ('volume', True),
+    'CreateSnapshot': ('snapshot', False),
+    'DeleteSnapshot': ('snapshot', True),
+    'AllocateAddress': ('address', False),
+    'AssociateAddress': ('address', False),
+    'DisassociateAddress': ('address', False),
+    'ReleaseAddress': ('address', True),
+    'CreateDBInstance': ('database', False),
+    'ModifyDBInstance': ('database', False),
+    'StartDBInstance': ('database', False),
+    'StopDBInstance': ('database', False),
+    'DeleteDBInstance': ('database', True),
+    'CreateTags': (None, False),
+    'DeleteTags': (None, False)
+}
+
+# Request/response fields holding the ID of the resource a CloudTrail call acts on
+CLOUDTRAIL_ID_FIELDS = ('instanceId', 'volumeId', 'snapshotId', 'allocationId', 'dBInstanceIdentifier')
+
+# A resource named by a change event, and whether the event deleted it
+Change = namedtuple('Change', ('kind', 'resource_id', 'deleted'))
+
+def kind_of_type(recommendation_type):
+    for prefix, kind in KINDS_BY_TYPE_PREFIX.items():
+        if recommendation_type.startswith(prefix):
+            return kind
+    return 'other'
+
+def is_change_event(event):
+    """
+    Whether an invocation event is an EventBridge resource change rather than a schedule or continuation
+    """
+    return isinstance(event, dict) and event.get('source') in ('aws.ec2', 'aws.rds') and 'detail' in event
+
+def changed_resources(event):
+    """
+    Changes named by an EventBridge state-change or CloudTrail event, de-duplicated
+    """
+    detail = event.get('detail') or {}
+    detail_type = event.get('detail-type', '')
+    changes = []
+
+    if detail_type == 'EC2 Instance State-change Notification':
+        if detail.get('instance-id'):
+            deleted = detail.get('state') in ('shutting-down', 'terminated')
+            changes.append(Change('instance', detail['instance-id'], deleted))
+
+    elif detail_type == 'EBS Volume Notification':
+        deleted = detail.get('event') == 'deleteVolume'
+        for arn in event.get('resources', []):
+            changes.append(Change('volume', arn.rsplit('/', 1)[-1], deleted))
+
+    elif detail_type == 'EBS Snapshot Notification':
+        # Sent for created, copied and shared snapshots only; deletions arrive through CloudTrail
+        arn = detail.get('snapshot_id') or ''
+        if arn:
+            changes.append(Change('snapshot', arn.rsplit('/', 1)[-1], False))
+
+    elif detail_type == 'RDS DB Instance Event':
+        if detail.get('SourceIdentifier'):
+            deleted = 'deletion' in detail.get('EventCategories', [])
+            changes.append(Change('database', detail['SourceIdentifier'], deleted))
+
+    elif detail_type == 'AWS API Call via CloudTrail' and not detail.get('errorCode'):
+        kind, deleted = CLOUDTRAIL_EVENTS.get(detail.get('eventName'), (None, False))
+        if detail.get('eventName') in CLOUDTRAIL_EVENTS:
+            for resource_id in _cloudtrail_ids(detail):
+                # Responses can name related resources too (e.g. the volumes of RunInstances)
+                resource_kind = _kind_of_id(resource_id) or kind
+                if resource_kind:
+                    changes.append(Change(resource_kind, resource_id, deleted and resource_kind == kind))
+
+    return list(dict.fromkeys(changes))
+
+def _kind_of_id(resource_id):
+    for prefix, kind in KINDS_BY_ID_PREFIX.items():
+        if resource_id.startswith(prefix):
+            return kind
+    return None
+
+def _cloudtrail_ids(detail):
+    """
+    Resource IDs in a CloudTrail record's request parameters and response elements,
+    including item sets (instancesSet, resourcesSet)
+    """
+    ids = []
+
+    def collect(value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if key in CLOUDTRAIL_ID_FIELDS and isinstance(item, str):
+                    ids.append(item)
+                elif key == 'resourceId' and isinstance(item, str):
+                    ids.append(item)
+                else:
+                    collect(item)
+        elif isinstance(value, list):
+            for item in value:
+                collect(item)
+
+    collect(detail.get('requestParameters'))
+    collect(detail.get('responseElements'))
+    return list(dict.fromkeys(ids))
+
+class ResourceStateStore:
+    """
+    {resource_id: recommendations} of one account/region, saved as one JSON object.
+
+    A full scan replaces the whole state (reconcile); change events replace single
+    resources. Event updates re-read the state just before saving and apply only
+    their own resources, so concurrent events rarely overwrite each other, and the
+    next reconcile repairs any that do.
+    """
+
+    def __init__(self, store, namespace, prefix='resource-state'):
+        self.store = store
+        self.key = f"{prefix}/{namespace}.json"
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        {'reconciled_at': epoch seconds or None, 'resources': {resource_id: entry}}
+        """
+        try:
+            data = self.store.get(self.key)
+        except Exception as e:
+            logger.warning(f"Could not read resource state {self.key}: {str(e)}")
+            data = None
+        state = json.loads(data) if data else {}
+        state.setdefault('reconciled_at', None)
+        state.setdefault('resources', {})
+        return state
+
+    def _save(self, state):
+        self.store.put(self.key, json.dumps(state, default=str).encode())
+
+    def reconcile(self, recommendations):
+        """
+        Replace the state with the results of a full scan.
+        Spend anomalies are not kept; they are recomputed from cost trends on every run.
+        """
+        resources = {}
+        now = time.time()
+        for recommendation in recommendations:
+            row = recommendation.to_dict()
+            if kind_of_type(row['type']) in TRANSIENT_KINDS:
+                continue
+            entry = resources.setdefault(row['resource_id'], {
+                'kind': kind_of_type(row['type']),
+                'updated_at': now,
+                'recommendations': []
+            })
+            entry['recommendations'].append(row)
+        with self.lock:
+            self._save({'reconciled_at': now, 'resources': resources})
+        logger.info(f"Reconciled resource state {self.key} with {len(resources)} resources")
+
+    def apply(self, evaluated, removed=()):
+        """
+        Store re-evaluated resources ({resource_id: (kind, [recommendation dicts])}) and drop removed ones
+        """
+        now = time.time()
+        with self.lock:
+            state = self.load()
+            resources = state['resources']
+            for resource_id in removed:
+                resources.pop(resource_id, None)
+            for resource_id, (kind, recommendations) in evaluated.items():
+                if recommendations:
+                    resources[resource_id] = {'kind': kind, 'updated_at': now, 'recommendations': recommendations}
+                else:
+                    resources.pop(resource_id, None)
+            self._save(state)
+
+    def load_recommendations(self):
+        """
+        (reconciled_at, every stored recommendation as a RecommendationStore)
+        """
+        state = self.load()
+        store = RecommendationStore()
+        for entry in state['resources'].values():
+            store.extend(entry['recommendations'])
+        return state['reconciled_at'], store
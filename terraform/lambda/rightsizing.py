@@ -0,0 +1,198 @@
+"""
+Rightsizing Engine
+Maps instances to a target size from CPU, memory and network percentiles across the fleet
+"""
+
+import logging
+import math
+import os
+import warnings
+
+try:
+    import numpy as np
+except ImportError:  # Provided by a Lambda layer; percentiles are computed in pure Python without it
+    np = None
+
+logger = logging.getLogger()
+
+# Relative capacity of each size within a family (EC2 normalization factors)
+SIZE_FACTORS = {
+    'nano': 0.25, 'micro': 0.5, 'small': 1, 'medium': 2, 'large': 4, 'xlarge': 8,
+    '2xlarge': 16, '4xlarge': 32, '8xlarge': 64, '12xlarge': 96, '16xlarge': 128,
+    '24xlarge': 192, '32xlarge': 256, '48xlarge': 384
+}
+SIZE_LADDER = sorted(SIZE_FACTORS, key=SIZE_FACTORS.get)
+
+# Headroom policy: highest utilization allowed on the target size
+MAX_CPU_P95 = 60.0
+MAX_CPU_P99 = 85.0
+MAX_MEMORY_P95 = 75.0
+
+# Sustained network throughput assumed per normalization unit (bytes/second)
+NETWORK_BYTES_PER_UNIT = 8 * 1024 * 1024
+
+PERCENTILES = (50, 95, 99)
+
+# Queries queued per instance by queue_instance_metrics
+QUERIES_PER_INSTANCE = 4
+
+# Dimensions the CloudWatch agent appends to mem_used_percent (its default append_dimensions)
+DEFAULT_MEMORY_DIMENSIONS = 'AutoScalingGroupName,ImageId,InstanceId,InstanceType'
+
+def memory_dimensions(instance):
+    """
+    Dimensions of the agent's mem_used_percent series for an instance, from MEMORY_METRIC_DIMENSIONS.
+    AutoScalingGroupName is only appended for instances in a group.
+    """
+    values = {
+        'InstanceId': instance['InstanceId'],
+        'ImageId': instance.get('ImageId'),
+        'InstanceType': instance.get('InstanceType'),
+        'AutoScalingGroupName': next(
+            (tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'aws:autoscaling:groupName'), None
+        )
+    }
+    names = os.environ.get('MEMORY_METRIC_DIMENSIONS', DEFAULT_MEMORY_DIMENSIONS).split(',')
+    return [
+        {'Name': name.strip(), 'Value': values[name.strip()]}
+        for name in names
+        if values.get(name.strip())
+    ]
+
+def queue_instance_metrics(batch, instance):
+    """
+    Queue the hourly CPU, network and CloudWatch agent memory series for an instance
+    """
+    instance_id = instance['InstanceId']
+    dimensions = [{'Name': 'InstanceId', 'Value': instance_id}]
+    batch.add(instance_id, 'AWS/EC2', 'CPUUtilization', dimensions, stats=('Maximum',))
+    batch.add(instance_id, 'AWS/EC2', 'NetworkIn', dimensions, stats=('Sum',))
+    batch.add(instance_id, 'AWS/EC2', 'NetworkOut', dimensions, stats=('Sum',))
+    batch.add(instance_id, 'CWAgent', 'mem_used_percent', memory_dimensions(instance), stats=('Maximum',))
+
+def percentiles(values):
+    """
+    PERCENTILES of a list by linear interpolation, as NumPy computes them; None when empty
+    """
+    ordered = sorted(value for value in values if not math.isnan(value))
+    if not ordered:
+        return None
+    result = []
+    for share in PERCENTILES:
+        position = (len(ordered) - 1) * share / 100
+        lower = math.floor(position)
+        upper = min(lower + 1, len(ordered) - 1)
+        result.append(ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower))
+    return tuple(result)
+
+def fleet_percentiles(series, instance_ids, metric_name, stat):
+    """
+    p50/p95/p99 of one metric for every instance, as a list of tuples (None without data).
+    With NumPy the whole batch is computed in one nanpercentile pass.
+    """
+    rows = [series.get(instance_id, {}).get(metric_name, {}).get(stat, []) for instance_id in instance_ids]
+    if np is None:
+        return [percentiles(row) for row in rows]
+
+    width = max((len(row) for row in rows), default=0)
+    matrix = np.full((len(rows), max(width, 1)), np.nan)
+    for index, row in enumerate(rows):
+        matrix[index, :len(row)] = row
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # All-NaN rows for missing series
+        table = np.nanpercentile(matrix, PERCENTILES, axis=1).T
+    return [None if np.isnan(row[0]) else tuple(float(value) for value in row) for row in table]
+
+# Families whose sizes run unbroken from smallest_size() up; GPU, storage and other
+# specialised families (g5, p3, x1e, d2, ...) offer a few sizes only
+LADDER_FAMILY_PREFIXES = ('t', 'm', 'c', 'r')
+
+def smallest_size(family):
+    """
+    Smallest size generally offered in a general purpose, compute or memory family
+    """
+    if family.startswith('t'):
+        return 'nano'
+    # Graviton families (m6g, c7gn, r6gd, ...) start at medium
+    generation = family.lstrip('abcdefghijklmnopqrstuvwxyz')
+    if 'g' in generation:
+        return 'medium'
+    return 'large'
+
+def family_sizes(family, known_types=None):
+    """
+    Sizes offered in an instance family, smallest first: those of known_types (e.g. the
+    types the price catalog lists) when it has any for the family, otherwise the ladder
+    of a general purpose, compute or memory family. Empty for other families.
+    """
+    known = [size for size in SIZE_LADDER if f"{family}.{size}" in (known_types or ())]
+    if known:
+        return known
+    if not family.startswith(LADDER_FAMILY_PREFIXES) or not family[1:2].isdigit():
+        return []
+    return SIZE_LADDER[SIZE_LADDER.index(smallest_size(family)):]
+
+def target_type(instance_type, required_factor, known_types=None):
+    """
+    Smallest size in the instance's family with at least required_factor capacity, never
+    larger than today; the instance type itself when its family has no known sizes
+    """
+    family, _, size = instance_type.partition('.')
+    if size not in SIZE_FACTORS:
+        return instance_type
+
+    for candidate in family_sizes(family, known_types):
+        if SIZE_FACTORS[candidate] > SIZE_FACTORS[size]:
+            break
+        if SIZE_FACTORS[candidate] >= required_factor:
+            return f"{family}.{candidate}"
+    return instance_type
+
+def recommend_sizes(instances, series, known_types=None):
+    """
+    Return {instance_id: sizing} for instances that can move to a smaller size, choosing
+    among known_types (instance types with a known price) where the family has any.
+    Memory is capped only where the CloudWatch agent reports it; instances without
+    it are sized on CPU and network alone.
+    """
+    instance_ids = [instance['InstanceId'] for instance in instances]
+    if not instance_ids:
+        return {}
+
+    cpu = fleet_percentiles(series, instance_ids, 'CPUUtilization', 'Maximum')
+    memory = fleet_percentiles(series, instance_ids, 'mem_used_percent', 'Maximum')
+    network_in = fleet_percentiles(series, instance_ids, 'NetworkIn', 'Sum')
+    network_out = fleet_percentiles(series, instance_ids, 'NetworkOut', 'Sum')
+
+    sizing = {}
+    for index, instance in enumerate(instances):
+        current = SIZE_FACTORS.get(instance['InstanceType'].partition('.')[2])
+        # Skip instances of an unknown size or without CPU data
+        if current is None or cpu[index] is None:
+            continue
+
+        # Hourly byte sums -> bytes/second
+        network = tuple(
+            max(values) / 3600
+            for values in zip(*(row for row in (network_in[index], network_out[index]) if row))
+        ) or (0.0,) * len(PERCENTILES)
+
+        # Capacity the instance needs so the target stays within the headroom policy
+        required = current * max(
+            cpu[index][1] / MAX_CPU_P95,
+            cpu[index][2] / MAX_CPU_P99,
+            memory[index][1] / MAX_MEMORY_P95 if memory[index] else 0.0,
+            network[2] / (NETWORK_BYTES_PER_UNIT * current)
+        )
+        target = target_type(instance['InstanceType'], required, known_types)
+        if target == instance['InstanceType']:
+            continue
+        sizing[instance['InstanceId']] = {
+            'target_type': target,
+            'cpu': cpu[index],
+            'memory': memory[index],
+            'network': network
+        }
+
+    return sizing
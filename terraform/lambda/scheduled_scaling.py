@@ -5,18 +5,26 @@ Automatically scales EKS node groups based on schedule for cost optimization
 
 import os
 import json
-import boto3
 import logging
 from datetime import datetime
 
+from aws_clients import api_metrics, default_client, preload_models
+from tag_index import TagIndex
+
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize AWS clients
-eks_client = boto3.client('eks')
-autoscaling_client = boto3.client('autoscaling')
+# AWS clients, created on first use
+eks_client = default_client('eks')
+autoscaling_client = default_client('autoscaling')
+rds_client = default_client('rds')
+elasticache_client = default_client('elasticache')
+sns_client = default_client('sns')
+tagging_client = default_client('resourcegroupstaggingapi')
+preload_models(['eks', 'autoscaling', 'rds', 'resourcegroupstaggingapi'])
 
+@api_metrics.instrument
 def handler(event, context):
     """
     Main Lambda handler for scheduled scaling
@@ -31,12 +39,13 @@ def handler(event, context):
         
         logger.info(f"Executing {action} for cluster {cluster_name} in {environment}")
         
-        if action == 'scale_down':
-            scale_down(cluster_name)
-        elif action == 'scale_up':
-            scale_up(cluster_name)
-        else:
-            raise ValueError(f"Unknown action: {action}")
+        with api_metrics.scope(action):
+            if action == 'scale_down':
+                scale_down(cluster_name)
+            elif action == 'scale_up':
+                scale_up(cluster_name)
+            else:
+                raise ValueError(f"Unknown action: {action}")
         
         return {
             'statusCode': 200,
@@ -144,25 +153,21 @@ def scale_rds(action):
     Start or stop RDS instances for cost optimization
     """
     try:
-        rds_client = boto3.client('rds')
         environment = os.environ['ENVIRONMENT']
         
+        # Load the tags of this environment's databases in bulk
+        tag_index = TagIndex(
+            tagging_client,
+            ['rds:db'],
+            tag_filters=[{'Key': 'Environment', 'Values': [environment]}]
+        )
+        
         # List RDS instances with environment tag
         response = rds_client.describe_db_instances()
         
         for db in response['DBInstances']:
             # Check if instance belongs to this environment
-            tags_response = rds_client.list_tags_for_resource(
-                ResourceName=db['DBInstanceArn']
-            )
-            
-            env_tag = next(
-                (tag for tag in tags_response['TagList'] 
-                 if tag['Key'] == 'Environment' and tag['Value'] == environment),
-                None
-            )
-            
-            if not env_tag:
+            if tag_index.tags_for(db['DBInstanceArn']).get('Environment') != environment:
                 continue
             
             db_identifier = db['DBInstanceIdentifier']
@@ -183,7 +188,6 @@ def scale_elasticache(action):
     Scale ElastiCache clusters for cost optimization
     """
     try:
-        elasticache_client = boto3.client('elasticache')
         environment = os.environ['ENVIRONMENT']
         
         # List cache clusters
@@ -215,7 +219,6 @@ def send_notification(message):
     try:
         sns_topic = os.environ.get('SNS_TOPIC_ARN')
         if sns_topic:
-            sns_client = boto3.client('sns')
             sns_client.publish(
                 TopicArn=sns_topic,
                 Subject=f"Scheduled Scaling Event - {os.environ['ENVIRONMENT']}",
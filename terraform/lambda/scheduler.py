@@ -0,0 +1,84 @@
+"""
+Analyzer Scheduler
+Runs I/O-bound analyzers and per-resource calls on bounded thread pools
+"""
+
+import contextvars
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+
+def run_tasks(tasks, max_workers=1, timeout=None, on_timeout=None):
+    """
+    Run (name, func, default) tasks and return {name: result} in task order.
+
+    A task that raises or misses the shared deadline yields its default, so one
+    failing analyzer never takes down the others. Threads can't be killed, so a task
+    that misses the deadline keeps running; on_timeout(name) is called for it first,
+    so the caller can stop accepting that task's output.
+    """
+    if max_workers <= 1:
+        return {name: _run_isolated(name, func, default) for name, func, default in tasks}
+
+    deadline = time.monotonic() + timeout if timeout else None
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analyzer')
+    futures = [
+        (name, _submit(executor, _run_isolated, name, func, default), default)
+        for name, func, default in tasks
+    ]
+
+    results = {}
+    try:
+        for name, future, default in futures:
+            remaining = max(0, deadline - time.monotonic()) if deadline else None
+            try:
+                results[name] = future.result(timeout=remaining)
+            except Exception:
+                logger.error(f"Task {name} did not finish within {timeout}s, skipping its results")
+                if on_timeout:
+                    on_timeout(name)
+                results[name] = default
+    finally:
+        # Don't block on stragglers that already missed the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+def imap_bounded(func, items, max_workers=1):
+    """
+    Yield (item, func(item)) in input order with at most max_workers calls in flight
+    """
+    if max_workers <= 1:
+        for item in items:
+            yield item, func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='resource') as executor:
+        pending = deque()
+        for item in items:
+            pending.append((item, _submit(executor, func, item)))
+            if len(pending) >= max_workers:
+                head, future = pending.popleft()
+                yield head, future.result()
+        while pending:
+            head, future = pending.popleft()
+            yield head, future.result()
+
+def _submit(executor, func, *args):
+    """
+    Submit func so it sees the caller's context (e.g. the active fan-out target)
+    """
+    return executor.submit(contextvars.copy_context().run, func, *args)
+
+def _run_isolated(name, func, default):
+    """
+    Run a task, logging and swallowing any error
+    """
+    try:
+        return func()
+    except Exception as e:
+        logger.error(f"Error in task {name}: {str(e)}")
+        return default
@@ -0,0 +1,196 @@
+"""
+Snapshot Lineage
+Persistent index of EBS snapshots, kept current from a StartTime watermark, and a
+block-sharing cost model for the per-volume chains the snapshots form
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from checkpoint import DeadlineReached
+from inventory import batched, iter_snapshots
+
+logger = logging.getLogger()
+
+SECONDS_PER_DAY = 86400
+
+# Snapshots committed to the checkpoint at a time during a full scan
+SCAN_BATCH_SIZE = 1000
+
+# Most values one DescribeSnapshots filter accepts
+FILTER_MAX_VALUES = 200
+
+# Volume ID of snapshots that were copied or imported rather than taken from a volume
+UNKNOWN_VOLUME_ID = 'vol-ffffffff'
+
+# Share of a volume's blocks assumed to change per day between two snapshots
+DEFAULT_DAILY_CHANGE_RATE = 0.02
+
+# A chain of snapshots sharing blocks: lineage_id is the volume ID (or the snapshot ID
+# of a copy) and snapshots is [(snapshot_id, start epoch seconds, size GB)], oldest first
+Lineage = namedtuple('Lineage', ('lineage_id', 'snapshots'))
+
+def epoch(value):
+    """
+    Epoch seconds of an API timestamp; naive datetimes are UTC
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+class SnapshotIndex:
+    """
+    {snapshot_id: [volume_id, start, size_gb, seen]} of one account/region, saved as one JSON object.
+
+    A full scan lists every snapshot and then drops those it did not see. Between full
+    scans, refresh() only lists snapshots started since the watermark day; deleted
+    snapshots are dropped with forget() as their DeleteSnapshot events arrive, and by the
+    next full scan otherwise. A full scan that reaches the checkpoint deadline saves what
+    it has seen and continues from the checkpoint's cursor; `seen` tells which entries
+    the current scan has confirmed.
+    """
+
+    def __init__(self, store, namespace, prefix='snapshot-index'):
+        self.store = store
+        self.key = f"{prefix}/{namespace}.json"
+        self.lock = threading.Lock()
+        self.state = None
+
+    def load(self):
+        try:
+            data = self.store.get(self.key)
+        except Exception as e:
+            logger.warning(f"Could not read snapshot index {self.key}: {str(e)}")
+            data = None
+        self.state = json.loads(data) if data else {}
+        for key in ('watermark', 'full_scan_at', 'scan_started_at'):
+            self.state.setdefault(key, None)
+        self.state.setdefault('snapshots', {})
+        return self.state
+
+    def save(self):
+        with self.lock:
+            self.store.put(self.key, json.dumps(self.state, separators=(',', ':')).encode())
+
+    def refresh(self, ec2_client, full_scan_days=7, checkpoint=None):
+        """
+        Bring the index up to date: a full scan when none finished in the last
+        full_scan_days (or one is under way), otherwise only the snapshots started
+        on or after the watermark day
+        """
+        state = self.state if self.state is not None else self.load()
+        now = time.time()
+        due = not state['full_scan_at'] or now - state['full_scan_at'] > full_scan_days * SECONDS_PER_DAY
+        if due or state['scan_started_at']:
+            self._full_scan(ec2_client, checkpoint)
+        else:
+            self._scan_since_watermark(ec2_client)
+        self.save()
+
+    def _full_scan(self, ec2_client, checkpoint):
+        state = self.state
+        if not state['scan_started_at']:
+            state['scan_started_at'] = time.time()
+        scan_started_at = state['scan_started_at']
+
+        snapshots = iter_snapshots(
+            ec2_client,
+            owner_ids=['self'],
+            cursor=checkpoint.cursor('old_snapshots', 'snapshots') if checkpoint else None
+        )
+        try:
+            for batch in batched(snapshots, SCAN_BATCH_SIZE):
+                for snapshot in batch:
+                    self.upsert(snapshot, scan_started_at)
+                if checkpoint:
+                    checkpoint.commit('old_snapshots', 'snapshots', len(batch))
+        except DeadlineReached:
+            self.save()
+            raise
+
+        # Everything the scan did not see has been deleted
+        entries = state['snapshots']
+        for snapshot_id in [sid for sid, entry in entries.items() if entry[3] < scan_started_at]:
+            del entries[snapshot_id]
+        state['full_scan_at'] = scan_started_at
+        state['scan_started_at'] = None
+        logger.info(f"Full snapshot scan indexed {len(entries)} snapshots")
+
+    def _scan_since_watermark(self, ec2_client):
+        state = self.state
+        start = datetime.fromtimestamp(state['watermark'] or state['full_scan_at'], timezone.utc).date()
+        today = datetime.now(timezone.utc).date()
+        days = [start + timedelta(days=offset) for offset in range((today - start).days + 1)]
+        # start-time matches with wildcards; one value per day since the watermark
+        values = [f"{day.isoformat()}*" for day in days]
+        found = 0
+        for chunk in batched(values, FILTER_MAX_VALUES):
+            for snapshot in iter_snapshots(ec2_client, owner_ids=['self'], filters=[{'Name': 'start-time', 'Values': chunk}]):
+                self.upsert(snapshot, time.time())
+                found += 1
+        logger.info(f"Incremental snapshot scan found {found} snapshots since {start.isoformat()}")
+
+    def upsert(self, snapshot, seen):
+        start = epoch(snapshot['StartTime'])
+        with self.lock:
+            self.state['snapshots'][snapshot['SnapshotId']] = [
+                snapshot.get('VolumeId') or UNKNOWN_VOLUME_ID, start, snapshot.get('VolumeSize', 0), seen
+            ]
+            self.state['watermark'] = max(self.state['watermark'] or 0, start)
+
+    def forget(self, snapshot_ids):
+        with self.lock:
+            for snapshot_id in snapshot_ids:
+                self.state['snapshots'].pop(snapshot_id, None)
+
+    def lineages(self, volume_ids=None):
+        """
+        Lineages of every indexed snapshot, or only of the given volumes / copied snapshots
+        """
+        chains = {}
+        for snapshot_id, (volume_id, start, size_gb, _) in self.state['snapshots'].items():
+            lineage_id = snapshot_id if volume_id == UNKNOWN_VOLUME_ID else volume_id
+            if volume_ids is None or lineage_id in volume_ids:
+                chains.setdefault(lineage_id, []).append((snapshot_id, start, size_gb))
+        return [Lineage(lineage_id, sorted(chain, key=lambda s: s[1])) for lineage_id, chain in chains.items()]
+
+    def lineage_ids(self, snapshot_ids):
+        """
+        IDs of the lineages the given (indexed) snapshots belong to
+        """
+        entries = self.state['snapshots']
+        return {
+            snapshot_id if entries[snapshot_id][0] == UNKNOWN_VOLUME_ID else entries[snapshot_id][0]
+            for snapshot_id in snapshot_ids if snapshot_id in entries
+        }
+
+def lineage_storage(lineage, change_rate=DEFAULT_DAILY_CHANGE_RATE):
+    """
+    Estimated GB each snapshot of a lineage stores: the oldest holds a full copy and
+    every later one only the blocks changed since its predecessor, modelled as
+    change_rate of the volume per day (at least one day, at most the whole volume)
+    """
+    stored = []
+    previous = None
+    for _, start, size_gb in lineage.snapshots:
+        if previous is None:
+            stored.append(float(size_gb))
+        else:
+            days = max(1.0, (start - previous) / SECONDS_PER_DAY)
+            stored.append(size_gb * min(1.0, change_rate * days))
+        previous = start
+    return stored
+
+def deletion_savings_gb(lineage, stored, count):
+    """
+    GB freed by deleting the oldest `count` snapshots of a lineage. Blocks they share
+    with the oldest kept snapshot move to it, so it becomes the new full copy.
+    """
+    if count >= len(stored):
+        return sum(stored)
+    kept_size = lineage.snapshots[count][2]
+    return max(0.0, sum(stored[:count + 1]) - kept_size)
@@ -0,0 +1,173 @@
+"""
+Tag Backfill
+Sweeps the EC2 instances, EBS volumes, RDS databases and S3 buckets of an account/region
+and applies the default tags they are missing through the Resource Groups Tagging API
+"""
+
+import logging
+from collections import Counter, defaultdict
+
+from botocore.exceptions import ClientError
+
+from checkpoint import Checkpoint, DeadlineReached
+from inventory import batched, iter_buckets, iter_db_instances, iter_instances, iter_volumes
+from scheduler import imap_bounded
+from tag_index import TagIndex, TagIndexUnavailable
+
+logger = logging.getLogger()
+
+# Most ARNs TagResources accepts in one call
+TAG_RESOURCES_MAX_ARNS = 20
+
+# Resources compared and tagged between checkpoint commits
+BACKFILL_BATCH_SIZE = 500
+
+# Tags recording the tagger's own work; added alongside missing default tags, never on their own
+MARKER_TAGS = ('AutoTagged', 'LastModified')
+
+def tags_to_add(existing_tags, default_tags):
+    """
+    {key: value} of default tags the resource lacks, marker tags included; empty unless
+    a non-marker tag is missing. Keys the resource already has are never sent.
+    """
+    missing = {key: str(value) for key, value in default_tags.items() if key not in existing_tags}
+    if not set(missing) - set(MARKER_TAGS):
+        return {}
+    return missing
+
+def tag_map(tags):
+    """
+    {key: value} from a [{'Key', 'Value'}] tag list
+    """
+    return {tag['Key']: tag['Value'] for tag in tags or []}
+
+def resource_streams(ec2_client, rds_client, s3_client, tagging_client, account_id):
+    """
+    {stream: function(cursor) yielding (arn, existing tags)} for every resource type swept.
+
+    Describe calls list every resource, including those never tagged, which GetResources
+    leaves out; RDS and S3 tags come from one bulk GetResources scan instead of a call each.
+    When that scan fails, tags are read per resource, and resources whose tags cannot be
+    read are skipped (yielded with no ARN) rather than tagged as if they had none.
+    """
+    region = ec2_client.meta.region_name
+    tag_index = TagIndex(tagging_client, ['rds:db', 's3'])
+
+    def database_tags(arn):
+        try:
+            return tag_index.tags_for(arn)
+        except TagIndexUnavailable:
+            pass
+        try:
+            return tag_map(rds_client.list_tags_for_resource(ResourceName=arn)['TagList'])
+        except Exception as e:
+            logger.warning(f"Could not read tags of {arn}, skipping: {str(e)}")
+            return None
+
+    def bucket_tags(name, arn):
+        try:
+            return tag_index.tags_for(arn)
+        except TagIndexUnavailable:
+            pass
+        try:
+            return tag_map(s3_client.get_bucket_tagging(Bucket=name)['TagSet'])
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchTagSet':
+                return {}
+            logger.warning(f"Could not read tags of {arn}, skipping: {str(e)}")
+        except Exception as e:
+            logger.warning(f"Could not read tags of {arn}, skipping: {str(e)}")
+        return None
+
+    def instances(cursor):
+        states = [{'Name': 'instance-state-name', 'Values': ['pending', 'running', 'stopping', 'stopped']}]
+        for instance in iter_instances(ec2_client, filters=states, cursor=cursor):
+            arn = f"arn:aws:ec2:{region}:{account_id}:instance/{instance['InstanceId']}"
+            yield arn, tag_map(instance.get('Tags'))
+
+    def volumes(cursor):
+        for volume in iter_volumes(ec2_client, cursor=cursor):
+            yield f"arn:aws:ec2:{region}:{account_id}:volume/{volume['VolumeId']}", tag_map(volume.get('Tags'))
+
+    def databases(cursor):
+        for database in iter_db_instances(rds_client, cursor=cursor):
+            tags = database_tags(database['DBInstanceArn'])
+            yield (database['DBInstanceArn'] if tags is not None else None), tags or {}
+
+    def buckets(cursor):
+        for bucket in iter_buckets(s3_client, cursor=cursor):
+            # Buckets in other regions are swept by the backfill of their own region
+            if bucket.get('BucketRegion', region) != region:
+                yield None, {}
+                continue
+            arn = f"arn:aws:s3:::{bucket['Name']}"
+            tags = bucket_tags(bucket['Name'], arn)
+            yield (arn if tags is not None else None), tags or {}
+
+    return {'instances': instances, 'volumes': volumes, 'databases': databases, 'buckets': buckets}
+
+def tag_resources(tagging_client, arns, tags):
+    """
+    Apply tags to up to TAG_RESOURCES_MAX_ARNS resources; returns {arn: error} for those that failed
+    """
+    try:
+        response = tagging_client.tag_resources(ResourceARNList=arns, Tags=tags)
+    except Exception as e:
+        logger.error(f"Error tagging {len(arns)} resources: {str(e)}")
+        return {arn: str(e) for arn in arns}
+    return {
+        arn: failure.get('ErrorMessage', failure.get('ErrorCode', 'unknown error'))
+        for arn, failure in response.get('FailedResourcesMap', {}).items()
+    }
+
+def apply_missing_tags(tagging_client, resources, default_tags, max_workers=1):
+    """
+    Tag [(arn, existing tags)] with the default tags each lacks, sharing TagResources calls
+    between resources missing the same tags. Returns (tagged count, {arn: error}).
+    """
+    arns_by_tags = defaultdict(list)
+    for arn, existing_tags in resources:
+        tags = tags_to_add(existing_tags, default_tags) if arn else {}
+        if tags:
+            arns_by_tags[tuple(sorted(tags.items()))].append(arn)
+
+    calls = [
+        (arns, dict(tags))
+        for tags, all_arns in arns_by_tags.items()
+        for arns in batched(all_arns, TAG_RESOURCES_MAX_ARNS)
+    ]
+    failed = {}
+    for (arns, tags), failures in imap_bounded(
+        lambda call: tag_resources(tagging_client, *call), calls, max_workers=max_workers
+    ):
+        failed.update(failures)
+    return sum(len(arns) for arns, _ in calls) - len(failed), failed
+
+def backfill(streams, tagging_client, default_tags, checkpoint=None, max_workers=1):
+    """
+    Sweep every stream, committing progress per batch of BACKFILL_BATCH_SIZE resources.
+
+    When the checkpoint's deadline is reached the sweep stops with the stream in
+    checkpoint.suspended, and a later invocation resumes from the saved cursors.
+    Returns {stream: Counter(scanned, tagged, failed)} for this invocation.
+    """
+    checkpoint = checkpoint or Checkpoint()
+    summary = {}
+
+    try:
+        for name, stream in streams.items():
+            if name in checkpoint.completed:
+                continue
+            counts = summary.setdefault(name, Counter())
+            for resources in batched(stream(checkpoint.cursor(name, 'resources')), BACKFILL_BATCH_SIZE):
+                tagged, failed = apply_missing_tags(tagging_client, resources, default_tags, max_workers)
+                for arn, error in failed.items():
+                    logger.warning(f"Could not tag {arn}: {error}")
+                counts.update(scanned=len(resources), tagged=tagged, failed=len(failed))
+                checkpoint.commit(name, 'resources', len(resources))
+            checkpoint.complete(name, [])
+            logger.info(f"Backfilled {name}: {dict(counts)}")
+    except DeadlineReached as e:
+        logger.info(f"Backfill of {e} stopped at the deadline")
+
+    return summary
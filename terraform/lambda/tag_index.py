@@ -0,0 +1,92 @@
+"""
+Resource Tag Index
+Loads tags account-wide from the Resource Groups Tagging API for O(1) lookups
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger()
+
+# GetResources returns at most 100 resources per page
+TAGGING_PAGE_SIZE = 100
+
+def resource_id_from_arn(arn):
+    """
+    Extract the short resource ID (vpc-123, my-db, ...) from an ARN
+    """
+    resource = arn.split(':', 5)[-1]
+    if '/' in resource:
+        return resource.split('/')[-1]
+    return resource.split(':')[-1]
+
+class TagIndexUnavailable(Exception):
+    """
+    Raised by lookups when the index could not be loaded completely, so a missing
+    tag is never mistaken for an untagged resource
+    """
+
+class TagIndex:
+    """
+    ARN/ID -> tags map populated in bulk on first lookup. A failed load is remembered
+    until invalidate(), so lookups fail fast instead of re-scanning per resource.
+    """
+
+    def __init__(self, tagging_client, resource_types, tag_filters=None):
+        self.tagging_client = tagging_client
+        self.resource_types = list(resource_types)
+        self.tag_filters = tag_filters or []
+        self.tags = None
+        self.error = None
+        self.lock = threading.Lock()
+
+    def tags_for(self, arn_or_id):
+        """
+        Return the tags of a resource, or {} if it has none.
+        Raises TagIndexUnavailable when the index could not be loaded.
+        """
+        if self.tags is None:
+            self.load()
+        if self.error is not None:
+            raise TagIndexUnavailable(f"Tags of {self.resource_types} unavailable: {self.error}")
+        return self.tags.get(arn_or_id, {})
+
+    def load(self):
+        """
+        Populate the index from paginated GetResources calls
+        """
+        with self.lock:
+            if self.tags is not None or self.error is not None:
+                return
+
+            tags = {}
+            loaded = 0
+            try:
+                paginator = self.tagging_client.get_paginator('get_resources')
+                for page in paginator.paginate(
+                    ResourceTypeFilters=self.resource_types,
+                    TagFilters=self.tag_filters,
+                    ResourcesPerPage=TAGGING_PAGE_SIZE
+                ):
+                    for mapping in page['ResourceTagMappingList']:
+                        arn = mapping['ResourceARN']
+                        resource_tags = {tag['Key']: tag['Value'] for tag in mapping.get('Tags', [])}
+                        tags[arn] = resource_tags
+                        tags[resource_id_from_arn(arn)] = resource_tags
+                        loaded += 1
+            except Exception as e:
+                # A partial map would make tagged resources look untagged
+                logger.error(f"Error loading tag index for {self.resource_types}: {str(e)}")
+                self.error = e
+                return
+
+            logger.info(f"Loaded tags for {loaded} resources of types {self.resource_types}")
+            self.tags = tags
+
+    def invalidate(self):
+        """
+        Drop cached tags so the next lookup reloads them
+        """
+        with self.lock:
+            self.tags = None
+            self.error = None
@@ -0,0 +1,109 @@
+"""
+Tag State
+Remembers which resources were recently tagged, and with which default tags, so
+duplicate and repeated events skip the describe + tag cycle
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+from ce_cache import LRUBackend, StoreBackend
+from object_store import store_from_uri
+
+logger = logging.getLogger()
+
+# Tags whose value changes on every invocation and so never count as a difference
+VOLATILE_TAGS = {'LastModified'}
+
+# How long a resource counts as tagged without looking at it again
+DEFAULT_TTL_SECONDS = 3600
+
+def semantic_hash(value):
+    """
+    Stable hash of JSON-like data, independent of dict key order
+    """
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def fingerprint(tags):
+    """
+    Stable hash of a tag set, ignoring VOLATILE_TAGS
+    """
+    return semantic_hash({key: str(value) for key, value in tags.items() if key not in VOLATILE_TAGS})
+
+class TagStateCache:
+    """
+    Recently tagged resources ({kind}/{resource_id} -> applied tag fingerprint) and
+    recently handled event IDs, each kept for ttl_seconds.
+
+    Resources are kept in an in-process LRU and, when a store is given, in a shared
+    object store so other containers skip them too; event IDs only in-process, since
+    EventBridge and SQS retries usually reach a warm container.
+    """
+
+    def __init__(self, store=None, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=10000):
+        self.ttl_seconds = ttl_seconds
+        self.backends = [LRUBackend(max_entries)]
+        if store is not None:
+            self.backends.append(StoreBackend(store, prefix='tag-state'))
+        self.events = LRUBackend(max_entries)
+
+    @classmethod
+    def from_environ(cls):
+        """
+        Cache configured by TAG_STATE_TTL_SECONDS, TAG_STATE_MAX_ENTRIES and TAG_STATE_URI
+        (s3://bucket/prefix or a local directory; unset keeps the state in-process only)
+        """
+        uri = os.environ.get('TAG_STATE_URI')
+        return cls(
+            store=store_from_uri(uri) if uri else None,
+            ttl_seconds=float(os.environ.get('TAG_STATE_TTL_SECONDS', DEFAULT_TTL_SECONDS)),
+            max_entries=int(os.environ.get('TAG_STATE_MAX_ENTRIES', '10000'))
+        )
+
+    def is_current(self, kind, resource_id, tags_fingerprint):
+        """
+        Whether the resource was tagged with this fingerprint within the TTL
+        """
+        key = f"{kind}/{resource_id}"
+        now = time.time()
+        for index, backend in enumerate(self.backends):
+            try:
+                entry = backend.get(key)
+            except Exception as e:
+                logger.warning(f"Tag state read failed: {str(e)}")
+                continue
+            if entry and entry['expires_at'] > now:
+                # Promote to the faster backends that missed
+                for faster in self.backends[:index]:
+                    faster.put(key, entry)
+                return entry['fingerprint'] == tags_fingerprint
+        return False
+
+    def mark(self, kind, resource_ids, tags_fingerprint):
+        """
+        Record that resources now carry the tags with this fingerprint
+        """
+        entry = {'fingerprint': tags_fingerprint, 'expires_at': time.time() + self.ttl_seconds}
+        for resource_id in resource_ids:
+            for backend in self.backends:
+                try:
+                    backend.put(f"{kind}/{resource_id}", entry)
+                except Exception as e:
+                    logger.warning(f"Tag state write failed: {str(e)}")
+
+    def is_duplicate(self, event_id):
+        """
+        Whether an event with this ID was handled within the TTL
+        """
+        entry = self.events.get(event_id) if event_id else None
+        return bool(entry) and entry['expires_at'] > time.time()
+
+    def record_event(self, event_id):
+        """
+        Remember a successfully handled event; failed events are left for their retry
+        """
+        if event_id:
+            self.events.put(event_id, {'expires_at': time.time() + self.ttl_seconds})
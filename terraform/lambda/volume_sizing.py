@@ -0,0 +1,169 @@
+"""
+Volume Sizing Engine
+Works out the gp3 IOPS and throughput each EBS volume needs, and which attached
+volumes are idle, from hourly CloudWatch series across the fleet
+"""
+
+import logging
+import math
+import warnings
+from itertools import zip_longest
+
+try:
+    import numpy as np
+except ImportError:  # Provided by a Lambda layer; percentiles are computed in pure Python without it
+    np = None
+
+from rightsizing import PERCENTILES, percentiles
+
+logger = logging.getLogger()
+
+# gp3 performance included in the storage price, and the most that can be provisioned
+GP3_BASELINE_IOPS = 3000
+GP3_BASELINE_THROUGHPUT = 125  # MiB/s
+GP3_MAX_IOPS = 16000
+GP3_MAX_THROUGHPUT = 1000  # MiB/s
+GP3_MAX_IOPS_PER_GB = 500
+GP3_MAX_THROUGHPUT_PER_IOPS = 0.25  # MiB/s
+
+# Headroom policy: provisioned performance over the p99 of hourly averages, which hide bursts
+PERFORMANCE_HEADROOM = 1.5
+
+# A volume is idle when it is idle this share of the time and its p99 stays below IDLE_MAX_IOPS
+IDLE_TIME_SHARE = 0.99
+IDLE_MAX_IOPS = 1.0
+
+MIB = 1024 * 1024
+
+# Queries queued per volume by queue_volume_metrics
+QUERIES_PER_VOLUME = 5
+
+def queue_volume_metrics(batch, volume_id):
+    """
+    Queue the hourly operation, byte and idle time sums of a volume
+    """
+    dimensions = [{'Name': 'VolumeId', 'Value': volume_id}]
+    for metric_name in ('VolumeReadOps', 'VolumeWriteOps', 'VolumeReadBytes', 'VolumeWriteBytes', 'VolumeIdleTime'):
+        batch.add(volume_id, 'AWS/EBS', metric_name, dimensions, stats=('Sum',))
+
+def fleet_matrix(series, volume_ids, metric_name, stat='Sum', width=0):
+    """
+    One metric for every volume as a (volumes x datapoints) array, NaN-padded to at least `width`
+    """
+    rows = [series.get(volume_id, {}).get(metric_name, {}).get(stat, []) for volume_id in volume_ids]
+    width = max([width] + [len(row) for row in rows])
+    matrix = np.full((len(rows), max(width, 1)), np.nan)
+    for index, row in enumerate(rows):
+        matrix[index, :len(row)] = row
+    return matrix
+
+def combined_rate(read, write, period):
+    """
+    Per-second rate of read + write sums; NaN only where both are missing
+    """
+    missing = np.isnan(read) & np.isnan(write)
+    return np.where(missing, np.nan, np.nan_to_num(read) + np.nan_to_num(write)) / period
+
+def series_rate(read, write, period):
+    """
+    Per-second rate of read + write sums as a list, for one volume without NumPy
+    """
+    return [
+        ((read_value or 0.0) + (write_value or 0.0)) / period
+        for read_value, write_value in zip_longest(read, write)
+    ]
+
+def fleet_statistics(series, volume_ids, period):
+    """
+    (IOPS percentiles, MiB/s percentiles, idle share) per volume, None where data is missing.
+    With NumPy the whole batch is computed in one pass per metric.
+    """
+    def metric(volume_id, name):
+        return series.get(volume_id, {}).get(name, {}).get('Sum', [])
+
+    if np is None:
+        statistics = []
+        for volume_id in volume_ids:
+            idle_time = metric(volume_id, 'VolumeIdleTime')
+            statistics.append((
+                percentiles(series_rate(metric(volume_id, 'VolumeReadOps'), metric(volume_id, 'VolumeWriteOps'), period)),
+                percentiles([
+                    rate / MIB for rate in
+                    series_rate(metric(volume_id, 'VolumeReadBytes'), metric(volume_id, 'VolumeWriteBytes'), period)
+                ]),
+                sum(idle_time) / len(idle_time) / period if idle_time else None
+            ))
+        return statistics
+
+    # Read and write series can differ in length, so pad every matrix to the same width
+    width = max(
+        (len(values) for volume_id in volume_ids for values in (
+            metric(volume_id, 'VolumeReadOps'), metric(volume_id, 'VolumeWriteOps'),
+            metric(volume_id, 'VolumeReadBytes'), metric(volume_id, 'VolumeWriteBytes')
+        )),
+        default=0
+    )
+    iops = combined_rate(
+        fleet_matrix(series, volume_ids, 'VolumeReadOps', width=width),
+        fleet_matrix(series, volume_ids, 'VolumeWriteOps', width=width),
+        period
+    )
+    throughput = combined_rate(
+        fleet_matrix(series, volume_ids, 'VolumeReadBytes', width=width),
+        fleet_matrix(series, volume_ids, 'VolumeWriteBytes', width=width),
+        period
+    ) / MIB
+    idle_time = fleet_matrix(series, volume_ids, 'VolumeIdleTime')
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # All-NaN rows for missing series
+        iops_pct = np.nanpercentile(iops, PERCENTILES, axis=1).T
+        throughput_pct = np.nanpercentile(throughput, PERCENTILES, axis=1).T
+        idle_share = np.nanmean(idle_time, axis=1) / period
+
+    def row(values):
+        return None if np.isnan(values[0]) else tuple(float(value) for value in values)
+
+    return [
+        (row(iops_pct[index]), row(throughput_pct[index]), None if np.isnan(idle_share[index]) else float(idle_share[index]))
+        for index in range(len(volume_ids))
+    ]
+
+def size_volumes(volumes, series, period=3600):
+    """
+    Return {volume_id: performance} for volumes with metrics: IOPS and MiB/s percentiles,
+    idle share, the gp3 IOPS/throughput to provision and whether gp3 can serve the volume
+    """
+    volume_ids = [volume['VolumeId'] for volume in volumes]
+    if not volume_ids:
+        return {}
+
+    performance = {}
+    for volume, (iops, throughput, idle_share) in zip(volumes, fleet_statistics(series, volume_ids, period)):
+        # Skip volumes without any operation data
+        if iops is None:
+            continue
+        throughput = throughput or (0.0,) * len(PERCENTILES)
+
+        # Provision for the p99 with headroom, never below the gp3 baseline
+        gp3_throughput = max(math.ceil(throughput[2] * PERFORMANCE_HEADROOM), GP3_BASELINE_THROUGHPUT)
+        gp3_iops = max(
+            math.ceil(iops[2] * PERFORMANCE_HEADROOM),
+            GP3_BASELINE_IOPS,
+            # Throughput above the baseline needs IOPS to go with it
+            math.ceil(gp3_throughput / GP3_MAX_THROUGHPUT_PER_IOPS) if gp3_throughput > GP3_BASELINE_THROUGHPUT else 0
+        )
+        performance[volume['VolumeId']] = {
+            'iops': iops,
+            'throughput': throughput,
+            'idle_share': idle_share,
+            'idle': idle_share is not None and idle_share >= IDLE_TIME_SHARE and iops[2] < IDLE_MAX_IOPS,
+            'gp3_iops': gp3_iops,
+            'gp3_throughput': gp3_throughput,
+            'fits_gp3': (
+                gp3_iops <= min(GP3_MAX_IOPS, volume['Size'] * GP3_MAX_IOPS_PER_GB)
+                and gp3_throughput <= GP3_MAX_THROUGHPUT
+            )
+        }
+
+    return performance
@@ -125,6 +125,28 @@ resource "aws_s3_bucket_intelligent_tiering_configuration" "metrics" {
   }
 }
 
+# Cost optimizer reports are linked from alerts, so they outlive the temp bucket
+resource "aws_s3_bucket_lifecycle_configuration" "metrics" {
+  bucket = aws_s3_bucket.metrics.id
+  
+  rule {
+    id     = "expire-cost-reports"
+    status = "Enabled"
+    
+    filter {
+      prefix = "cost-optimizer/reports/"
+    }
+    
+    expiration {
+      days = var.environment == "production" ? 365 : 90  # Keep a year of reports in production
+    }
+    
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
+}
+
 # ML Models and Artifacts Bucket
 resource "aws_s3_bucket" "ml_artifacts" {
   bucket = "${local.name_prefix}-ml-artifacts"
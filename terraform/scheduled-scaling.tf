@@ -82,6 +82,13 @@ resource "aws_iam_role_policy" "scaling_lambda" {
         ]
         Resource = "*"
       },
+      {
+        Effect = "Allow"
+        Action = [
+          "tag:GetResources"
+        ]
+        Resource = "*"
+      },
       {
         Effect = "Allow"
         Action = [
@@ -106,6 +113,26 @@ data "archive_file" "scaling_lambda" {
     content  = file("${path.module}/lambda/scheduled_scaling.py")
     filename = "index.py"
   }
+  
+  source {
+    content  = file("${path.module}/lambda/api_metrics.py")
+    filename = "api_metrics.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/aws_clients.py")
+    filename = "aws_clients.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/rate_limiter.py")
+    filename = "rate_limiter.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/tag_index.py")
+    filename = "tag_index.py"
+  }
 }
 
 # CloudWatch Event Rules for scheduling
@@ -230,6 +230,40 @@ resource "aws_lambda_function" "auto_tagger" {
         local.mandatory_tags,
         local.cost_allocation_tags
       ))
+      TAG_STATE_TTL_SECONDS = "3600"  # Skip resources tagged, and events handled, within this window
+    }
+  }
+  
+  tags = merge(
+    local.mandatory_tags,
+    {
+      Purpose = "automated-tagging"
+    }
+  )
+}
+
+# One-off sweep tagging resources that predate the auto tagger; invoke it with an empty event
+resource "aws_lambda_function" "auto_tagger_backfill" {
+  count = var.auto_tagger_backfill ? 1 : 0
+  
+  filename         = data.archive_file.auto_tagger.output_path
+  function_name    = "${local.name_prefix}-auto-tagger-backfill"
+  role            = aws_iam_role.auto_tagger_backfill[0].arn
+  handler         = "index.backfill_handler"
+  source_code_hash = data.archive_file.auto_tagger.output_base64sha256
+  runtime         = "python3.11"
+  timeout         = 900
+  
+  environment {
+    variables = {
+      DEFAULT_TAGS = jsonencode(merge(
+        local.mandatory_tags,
+        local.cost_allocation_tags
+      ))
+      BACKFILL_WORKERS           = "8"  # TagResources calls in flight at once
+      CHECKPOINT_URI             = "s3://${aws_s3_bucket.temp.id}/auto-tagger"  # Shared by all containers
+      CHECKPOINT_RESERVE_SECONDS = "60"  # Time left when the sweep stops and the checkpoint is saved
+      CHECKPOINT_MAX_INVOCATIONS = "20"  # Stop a sweep after this many invocations
     }
   }
   
@@ -250,6 +284,66 @@ data "archive_file" "auto_tagger" {
     content  = file("${path.module}/lambda/auto_tagger.py")
     filename = "index.py"
   }
+  
+  source {
+    content  = file("${path.module}/lambda/api_metrics.py")
+    filename = "api_metrics.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/aws_clients.py")
+    filename = "aws_clients.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/ce_cache.py")
+    filename = "ce_cache.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/checkpoint.py")
+    filename = "checkpoint.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/inventory.py")
+    filename = "inventory.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/object_store.py")
+    filename = "object_store.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/rate_limiter.py")
+    filename = "rate_limiter.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/recommendations.py")
+    filename = "recommendations.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/scheduler.py")
+    filename = "scheduler.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/tag_backfill.py")
+    filename = "tag_backfill.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/tag_index.py")
+    filename = "tag_index.py"
+  }
+  
+  source {
+    content  = file("${path.module}/lambda/tag_state.py")
+    filename = "tag_state.py"
+  }
 }
 
 # IAM Role for Auto Tagger
@@ -279,7 +373,7 @@ resource "aws_iam_role_policy" "auto_tagger" {
   
   policy = jsonencode({
     Version = "2012-10-17"
-    Statement = [
+    Statement = concat([
       {
         Effect = "Allow"
         Action = [
@@ -288,12 +382,115 @@ resource "aws_iam_role_policy" "auto_tagger" {
           "ec2:DescribeVolumes",
           "ec2:DescribeSnapshots",
           "rds:AddTagsToResource",
+          "rds:ListTagsForResource",
           "rds:DescribeDBInstances",
           "s3:PutBucketTagging",
-          "s3:GetBucketTagging"
+          "s3:GetBucketTagging",
+          "s3:GetLifecycleConfiguration",
+          "s3:PutLifecycleConfiguration"
+        ]
+        Resource = "*"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "logs:CreateLogGroup",
+          "logs:CreateLogStream",
+          "logs:PutLogEvents"
+        ]
+        Resource = "arn:aws:logs:*:*:*"
+      }
+    ], var.auto_tagger_batching ? [
+      {
+        Effect = "Allow"
+        Action = [
+          "sqs:ReceiveMessage",
+          "sqs:DeleteMessage",
+          "sqs:GetQueueAttributes"
+        ]
+        Resource = aws_sqs_queue.auto_tagger[0].arn  # Only when events are batched through the queue
+      }
+    ] : [])
+  })
+}
+
+# IAM Role for the Tag Backfill, separate from the event-driven tagger
+resource "aws_iam_role" "auto_tagger_backfill" {
+  count = var.auto_tagger_backfill ? 1 : 0
+  
+  name = "${local.name_prefix}-auto-tagger-backfill"
+  
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Action = "sts:AssumeRole"
+        Effect = "Allow"
+        Principal = {
+          Service = "lambda.amazonaws.com"
+        }
+      }
+    ]
+  })
+  
+  tags = local.mandatory_tags
+}
+
+# Backfill IAM Policy: bulk tagging, plus checkpoints and continuations of long sweeps
+resource "aws_iam_role_policy" "auto_tagger_backfill" {
+  count = var.auto_tagger_backfill ? 1 : 0
+  
+  name = "${local.name_prefix}-auto-tagger-backfill-policy"
+  role = aws_iam_role.auto_tagger_backfill[0].id
+  
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "tag:GetResources",
+          "tag:TagResources",
+          "ec2:DescribeInstances",
+          "ec2:DescribeVolumes",
+          "ec2:CreateTags",
+          "rds:DescribeDBInstances",
+          "rds:ListTagsForResource",
+          "rds:AddTagsToResource",
+          "s3:ListAllMyBuckets",
+          "s3:GetBucketTagging",
+          "s3:PutBucketTagging"
         ]
         Resource = "*"
       },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject",
+          "s3:DeleteObject"
+        ]
+        Resource = "${aws_s3_bucket.temp.arn}/auto-tagger/*"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:ListBucket"
+        ]
+        Resource = aws_s3_bucket.temp.arn  # Missing checkpoints read as NoSuchKey, not AccessDenied
+        Condition = {
+          StringLike = {
+            "s3:prefix" = ["auto-tagger/*"]
+          }
+        }
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "lambda:InvokeFunction"
+        ]
+        Resource = aws_lambda_function.auto_tagger_backfill[0].arn  # Continuation of checkpointed sweeps
+      },
       {
         Effect = "Allow"
         Action = [
@@ -327,7 +524,67 @@ resource "aws_cloudwatch_event_rule" "auto_tag_resources" {
 resource "aws_cloudwatch_event_target" "auto_tag" {
   rule      = aws_cloudwatch_event_rule.auto_tag_resources.name
   target_id = "AutoTaggerLambda"
-  arn       = aws_lambda_function.auto_tagger.arn
+  arn       = var.auto_tagger_batching ? aws_sqs_queue.auto_tagger[0].arn : aws_lambda_function.auto_tagger.arn
+}
+
+# Event storms (e.g. an ASG scaling out) are buffered and tagged in batches
+resource "aws_sqs_queue" "auto_tagger" {
+  count = var.auto_tagger_batching ? 1 : 0
+  
+  name                       = "${local.name_prefix}-auto-tagger"
+  visibility_timeout_seconds = 180  # Six times the function timeout
+  message_retention_seconds  = 86400
+  
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.auto_tagger_dlq[0].arn
+    maxReceiveCount     = 3
+  })
+  
+  tags = local.mandatory_tags
+}
+
+resource "aws_sqs_queue" "auto_tagger_dlq" {
+  count = var.auto_tagger_batching ? 1 : 0
+  
+  name                      = "${local.name_prefix}-auto-tagger-dlq"
+  message_retention_seconds = 1209600
+  
+  tags = local.mandatory_tags
+}
+
+resource "aws_sqs_queue_policy" "auto_tagger" {
+  count = var.auto_tagger_batching ? 1 : 0
+  
+  queue_url = aws_sqs_queue.auto_tagger[0].id
+  
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Principal = {
+          Service = "events.amazonaws.com"
+        }
+        Action   = "sqs:SendMessage"
+        Resource = aws_sqs_queue.auto_tagger[0].arn
+        Condition = {
+          ArnEquals = {
+            "aws:SourceArn" = aws_cloudwatch_event_rule.auto_tag_resources.arn
+          }
+        }
+      }
+    ]
+  })
+}
+
+resource "aws_lambda_event_source_mapping" "auto_tagger" {
+  count = var.auto_tagger_batching ? 1 : 0
+  
+  event_source_arn                   = aws_sqs_queue.auto_tagger[0].arn
+  function_name                      = aws_lambda_function.auto_tagger.arn
+  batch_size                         = 500
+  maximum_batching_window_in_seconds = 10  # Collect a scale-out into one invocation
+  function_response_types            = ["ReportBatchItemFailures"]
 }
 
 resource "aws_lambda_permission" "auto_tag" {
@@ -339,6 +596,18 @@ resource "aws_lambda_permission" "auto_tag" {
 }
 
 # Variables for Tagging
+variable "auto_tagger_batching" {
+  description = "Deliver auto-tagging events through SQS so bursts are tagged in batches"
+  type        = bool
+  default     = false
+}
+
+variable "auto_tagger_backfill" {
+  description = "Deploy the function that tags resources created before the auto tagger"
+  type        = bool
+  default     = false
+}
+
 variable "enable_tag_policy" {
   description = "Enable organization-wide tag policy"
   type        = bool